@@ -35,6 +35,8 @@ es_host = os.getenv("ES_HOST", "http://elasticsearch:9200")  # 預設使用容
 # 嘗試連接 Elasticsearch（重試 5 次）
 MAX_RETRIES = 5
 RETRY_INTERVAL = 5  # 每次重試間隔 5 秒
+# from + size 翻頁不可超過索引的 max_result_window（Elasticsearch 預設 10000 筆）
+MAX_RESULT_WINDOW = int(os.getenv("MAX_RESULT_WINDOW", "10000"))
 
 es = None
 for i in range(MAX_RETRIES):
@@ -130,14 +132,17 @@ if st.session_state.get("search_button") and es is not None:
 
             try:
                 with st.spinner('搜尋中...'):
+                    # 只計算總筆數，每頁資料在顯示時才查詢
                     response = es.search(
                         index="ig_data",
                         body=search_body,
-                        size=10000  # 設定較大的結果數量限制
+                        size=0,
+                        track_total_hits=True
                     )
 
-                # 存儲搜尋結果到 session_state
-                st.session_state.search_results = response.get("hits", {}).get("hits", [])
+                # 存儲搜尋條件與總筆數到 session_state
+                st.session_state.search_body = search_body
+                st.session_state.search_total = response["hits"]["total"]["value"]
             except Exception as e:
                 st.error(f"搜尋時發生錯誤: {e}")
         else:
@@ -148,15 +153,20 @@ if 'current_page' not in st.session_state:
     st.session_state.current_page = 1
 
 # 顯示搜尋結果（如果存在）
-if hasattr(st.session_state, 'search_results'):
-    hits = st.session_state.search_results
-    if hits:
-        total_hits = len(hits)
+if hasattr(st.session_state, 'search_body'):
+    total_hits = st.session_state.search_total
+    if total_hits:
         st.success(f"找到 {total_hits} 筆結果")
         
         # 分頁設定
         items_per_page = 10
         total_pages = (total_hits + items_per_page - 1) // items_per_page
+        # 超過 max_result_window 的頁面無法以 from + size 查詢，只提供前面的頁數
+        max_pages = MAX_RESULT_WINDOW // items_per_page
+        if total_pages > max_pages:
+            total_pages = max_pages
+            st.info(f"結果超過 {MAX_RESULT_WINDOW} 筆，只能瀏覽前 {max_pages} 頁，請加入關鍵字或縮小日期範圍")
+        st.session_state.current_page = min(st.session_state.current_page, total_pages)
         
         # 分頁導航
         col1, col2, col3, col4 = st.columns([2, 1, 1, 2])
@@ -177,13 +187,24 @@ if hasattr(st.session_state, 'search_results'):
                 st.session_state.current_page += 1
                 st.rerun()
         
-        # 計算當前頁的資料範圍
+        # 只查詢當前頁的資料
         start_idx = (st.session_state.current_page - 1) * items_per_page
-        end_idx = min(start_idx + items_per_page, total_hits)
+        hits = []
+        try:
+            response = es.search(
+                index="ig_data",
+                body=st.session_state.search_body,
+                from_=start_idx,
+                size=items_per_page,
+                track_total_hits=False
+            )
+            hits = response.get("hits", {}).get("hits", [])
+        except Exception as e:
+            st.error(f"搜尋時發生錯誤: {e}")
 
 
         # 顯示當前頁的資料
-        for result in hits[start_idx:end_idx]:
+        for result in hits:
             with st.container():
                 title = result["_source"].get("datetime", "無標題")
                 content = result["_source"].get("content", "無內容")
@@ -0,0 +1,151 @@
+"""比較 content 欄位各分析器的搜尋品質與延遲
+
+以同一份IG匯出檔分別建立使用不同分析器的暫存索引，執行同一組查詢後輸出：
+命中數、前10筆精確率、召回率、延遲（p50/p95）與索引大小。
+
+沒有人工標註時，以「內文包含完整關鍵字」作為相關的判斷標準，可以直接看出
+單字切分造成的大量不相關命中。
+
+用法：
+    python benchmarks/analyzers_benchmark.py ig_data/export.zip \
+        --analyzers standard cjk_bigram ngram --queries queries.txt
+"""
+import os
+import sys
+import json
+import time
+import zipfile
+import argparse
+import unicodedata
+from typing import Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit_app"))
+
+import analyzers
+import search
+import setup
+from bulk_writer import bulk_write
+from elasticsearch import Elasticsearch
+
+DEFAULT_QUERIES = ["拉麵", "牛肉麵", "咖啡", "甜點", "火鍋", "早午餐", "壽司", "燒肉", "義大利麵", "小籠包"]
+BENCH_INDEX_PREFIX = "bench_analyzer_"
+TOP_K = 10
+MAX_HITS = 10000
+
+
+def normalize(text: str) -> str:
+    """全形轉半形並轉小寫，與分析器的 cjk_width / lowercase 一致"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def load_docs(zip_path: str) -> List[Dict]:
+    """從匯出檔讀取貼文，轉成索引用的文件"""
+    with zipfile.ZipFile(zip_path, "r") as zf:
+        docs = []
+        for item in setup.iter_instagram_data_from_zip(zf):
+            doc = setup.build_document(item)
+            doc["doc_id"] = setup.make_doc_id(item)
+            docs.append(doc)
+    return docs
+
+
+def build_index(es, analyzer: str, docs: List[Dict]) -> str:
+    """建立使用指定分析器的暫存索引並載入文件"""
+    index = f"{BENCH_INDEX_PREFIX}{analyzer}"
+    if es.indices.exists(index=index):
+        es.indices.delete(index=index)
+    es.indices.create(index=index, body=setup.build_index_body(analyzer))
+    bulk_write(es, ({"_op_type": "index", "_index": index, "_id": doc["doc_id"], "_source": doc} for doc in docs))
+    es.indices.put_settings(index=index, body={"index": setup.SERVING_SETTINGS})
+    es.indices.refresh(index=index)
+    es.indices.forcemerge(index=index, max_num_segments=1)
+    return index
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))] if values else 0.0
+
+
+def run_queries(es, index: str, docs: List[Dict], queries: List[str], repeat: int) -> Dict:
+    """執行查詢並計算品質與延遲指標"""
+    results = {}
+    for query in queries:
+        relevant = {doc["doc_id"] for doc in docs if normalize(query) in normalize(doc["content"])}
+        body = {"query": search.build_query(query, None, None), "sort": ["_score"], "_source": False,
+                "size": MAX_HITS, "track_total_hits": True}
+
+        latencies = []
+        response = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = es.search(index=index, body=body, request_cache=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        hit_ids = [hit["_id"] for hit in response["hits"]["hits"]]
+        top = hit_ids[:TOP_K]
+        results[query] = {
+            "hits": response["hits"]["total"]["value"],
+            "relevant": len(relevant),
+            "precision_at_10": sum(1 for i in top if i in relevant) / len(top) if top else 0.0,
+            "recall": len(relevant.intersection(hit_ids)) / len(relevant) if relevant else 1.0,
+            "p50_ms": percentile(latencies, 0.5),
+            "p95_ms": percentile(latencies, 0.95),
+            "took_ms": response["took"]
+        }
+    return results
+
+
+def summarize(per_query: Dict) -> Dict:
+    """計算所有查詢的平均值"""
+    count = len(per_query) or 1
+    keys = ["hits", "precision_at_10", "recall", "p50_ms", "p95_ms"]
+    return {key: sum(r[key] for r in per_query.values()) / count for key in keys}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 content 分析器的搜尋品質與延遲")
+    parser.add_argument("zip_path", help="IG匯出的zip檔")
+    parser.add_argument("--host", default=os.getenv("ES_HOST", "http://localhost:9200"))
+    parser.add_argument("--analyzers", nargs="+", default=["standard", "cjk_bigram", "ngram"])
+    parser.add_argument("--queries", help="查詢清單檔案，每行一個關鍵字")
+    parser.add_argument("--repeat", type=int, default=20, help="每個查詢重複次數（計算延遲百分位數）")
+    parser.add_argument("--output", help="將完整結果寫入JSON檔")
+    parser.add_argument("--keep", action="store_true", help="保留暫存索引")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    es = Elasticsearch(args.host, request_timeout=60)
+    docs = load_docs(args.zip_path)
+    print(f"載入 {len(docs)} 篇貼文，{len(queries)} 個查詢")
+
+    report = {}
+    for name in args.analyzers:
+        analyzer = analyzers.resolve_analyzer(es, name)
+        if analyzer != name:
+            print(f"略過 {name}（無法使用）")
+            continue
+        index = build_index(es, analyzer, docs)
+        size = es.indices.stats(index=index, metric="store")["_all"]["primaries"]["store"]["size_in_bytes"]
+        per_query = run_queries(es, index, docs, queries, args.repeat)
+        report[analyzer] = {"index_bytes": size, "summary": summarize(per_query), "queries": per_query}
+        if not args.keep:
+            es.indices.delete(index=index)
+
+    print(f"{'analyzer':<12}{'hits':>10}{'P@10':>8}{'recall':>8}{'p50 ms':>9}{'p95 ms':>9}{'index MB':>10}")
+    for analyzer, result in report.items():
+        s = result["summary"]
+        print(f"{analyzer:<12}{s['hits']:>10.1f}{s['precision_at_10']:>8.2f}{s['recall']:>8.2f}"
+              f"{s['p50_ms']:>9.1f}{s['p95_ms']:>9.1f}{result['index_bytes'] / 1024 / 1024:>10.2f}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
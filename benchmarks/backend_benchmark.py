@@ -0,0 +1,126 @@
+"""比較Elasticsearch與本機索引兩種搜尋後端的結果一致性與延遲
+
+以同一份IG匯出檔分別建立Elasticsearch暫存索引（cjk_bigram 分析器）與本機索引，
+執行相同的關鍵字與日期範圍查詢，輸出兩邊結果是否一致（筆數、順序、BM25排序前10筆的重疊率）以及延遲。
+
+用法：
+    python benchmarks/backend_benchmark.py ig_data/export.zip --queries queries.txt
+"""
+import os
+import sys
+import json
+import time
+import datetime
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit_app"))
+
+import local_index
+import search
+import search_backend
+from elasticsearch import Elasticsearch
+
+from analyzers_benchmark import DEFAULT_QUERIES, MAX_HITS, build_index, load_docs, percentile
+
+PARITY_ANALYZER = "cjk_bigram"
+RELEVANCE_TOP_K = 10  # 依BM25排序時比較前幾筆
+
+
+def date_ranges(docs):
+    """產生查詢用的日期範圍：全部、最近一年、最早一年"""
+    dates = sorted(datetime.date.fromisoformat(d["datetime"][:10]) for d in docs)
+    if not dates:
+        return [(None, None)]
+    first, last = dates[0], dates[-1]
+    return [
+        (None, None),
+        (last - datetime.timedelta(days=365), last),
+        (first, first + datetime.timedelta(days=365))
+    ]
+
+
+def es_ids(es, index, query, start, end, order="date"):
+    sort = ["_score", *search.SORT] if order == "score" else search.SORT
+    body = {"query": search.build_query(query, start, end), "sort": sort,
+            "_source": False, "size": MAX_HITS}
+    started = time.perf_counter()
+    response = es.search(index=index, body=body, request_cache=False)
+    return [hit["_id"] for hit in response["hits"]["hits"]], (time.perf_counter() - started) * 1000
+
+
+def local_ids(index, query, start, end, order="date"):
+    started = time.perf_counter()
+    lo, hi = search_backend.day_bounds(start, end)
+    ordinals = index.search(query, lo, hi, operator=search.MATCH_OPERATOR, order=order)
+    ids = [index.doc_ids[i].decode("ascii") for i in ordinals[:MAX_HITS]]
+    return ids, (time.perf_counter() - started) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較Elasticsearch與本機索引的搜尋結果與延遲")
+    parser.add_argument("zip_path", help="IG匯出的zip檔")
+    parser.add_argument("--host", default=os.getenv("ES_HOST", "http://localhost:9200"))
+    parser.add_argument("--queries", help="查詢清單檔案，每行一個關鍵字")
+    parser.add_argument("--repeat", type=int, default=20, help="每個查詢重複次數（計算延遲百分位數）")
+    parser.add_argument("--output", help="將完整結果寫入JSON檔")
+    args = parser.parse_args()
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    es = Elasticsearch(args.host, request_timeout=60)
+    docs = load_docs(args.zip_path)
+    es_index = build_index(es, PARITY_ANALYZER, docs)
+    local_dir = os.path.join(tempfile.mkdtemp(prefix="instasearch_bench_"), "local_index")
+    local_index.build(docs, local_dir)
+    index = local_index.LocalIndex(local_dir)
+    print(f"載入 {len(docs)} 篇貼文，{len(queries)} 個查詢")
+
+    results = []
+    for query in queries:
+        for start, end in date_ranges(docs):
+            es_latencies, local_latencies = [], []
+            for _ in range(args.repeat):
+                expected, latency = es_ids(es, es_index, query, start, end)
+                es_latencies.append(latency)
+                actual, latency = local_ids(index, query, start, end)
+                local_latencies.append(latency)
+            # BM25排序：Elasticsearch的欄位長度以有損編碼儲存，分數相近時順序可能不同，只比較前幾筆的重疊率
+            es_ranked, _ = es_ids(es, es_index, query, start, end, order="score")
+            local_ranked, _ = local_ids(index, query, start, end, order="score")
+            top_es, top_local = es_ranked[:RELEVANCE_TOP_K], local_ranked[:RELEVANCE_TOP_K]
+            results.append({
+                "query": query,
+                "range": [str(start), str(end)],
+                "es_hits": len(expected),
+                "local_hits": len(actual),
+                "same_order": expected == actual,
+                "missing": len(set(expected) - set(actual)),
+                "extra": len(set(actual) - set(expected)),
+                "bm25_top_overlap": len(set(top_es) & set(top_local)) / len(top_es) if top_es else 1.0,
+                "es_p50_ms": percentile(es_latencies, 0.5),
+                "es_p95_ms": percentile(es_latencies, 0.95),
+                "local_p50_ms": percentile(local_latencies, 0.5),
+                "local_p95_ms": percentile(local_latencies, 0.95)
+            })
+    es.indices.delete(index=es_index)
+
+    print(f"{'query':<10}{'range':<24}{'es':>7}{'local':>7}{'same':>6}{'bm25@10':>9}{'es p50':>9}{'local p50':>11}")
+    for r in results:
+        print(f"{r['query']:<10}{r['range'][0] + '~' + r['range'][1]:<24}{r['es_hits']:>7}{r['local_hits']:>7}"
+              f"{'✓' if r['same_order'] else '✗':>6}{r['bm25_top_overlap']:>9.0%}"
+              f"{r['es_p50_ms']:>9.2f}{r['local_p50_ms']:>11.2f}")
+    mismatched = [r for r in results if not r["same_order"]]
+    print(f"一致：{len(results) - len(mismatched)}/{len(results)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""端到端效能測試：以模擬匯出檔量測匯入各階段、搜尋頁與分析頁的耗時
+
+每個資料量各產生一份模擬匯出檔（見 generate_export.py），在暫存工作目錄中執行
+setup.process_instagram_zip，記錄各階段（extract、parse、copy、media、index、local、cleanup）
+的秒數與速率，再量測搜尋頁（第一頁、翻頁、媒體）、建議詞與分析頁的延遲。
+結果輸出為JSON，可用 --baseline 與先前的結果比較。
+
+後端：
+    elasticsearch  使用 --es-host 指定的可拋棄式Elasticsearch，例如
+                   docker run -d --rm -p 9200:9200 -e discovery.type=single-node \\
+                       -e xpack.security.enabled=false docker.elastic.co/elasticsearch/elasticsearch:8.11.3
+    local          不需Elasticsearch，使用本機索引
+
+用法：
+    python benchmarks/e2e_benchmark.py --sizes 1000,10000,100000 --backend local --output results.json
+    python benchmarks/e2e_benchmark.py --sizes 10000 --baseline results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(BENCH_DIR, "..", "streamlit_app")
+
+from generate_export import generate_export
+
+SEARCH_QUERIES = ["牛肉麵", "小籠包", "台北美食", "湯頭濃郁", "珍珠奶茶", "不存在的詞"]
+SUGGEST_PREFIXES = ["牛", "小籠", "台北", "鼎泰", "拉"]
+SEARCH_PAGES = 3  # 每個查詢翻幾頁
+
+
+def configure_environment(workdir: str, backend: str, es_host: Optional[str]):
+    """將應用程式的所有資料路徑指向工作目錄；必須在匯入 streamlit_app 模組前呼叫
+
+    各模組的預設路徑都由 APP_BASE_DIR 推得，只需設定這一項。
+    """
+    os.environ.update({
+        "APP_BASE_DIR": workdir,
+        "SEARCH_BACKEND": backend,
+        "REBUILD_INDEX": "true"
+    })
+    if es_host:
+        os.environ["ES_HOST"] = es_host
+    sys.path.insert(0, APP_DIR)
+
+
+def reset_workdir(workdir: str):
+    """清除上一輪留下的媒體、縮圖、本機索引與統計，保留產生的匯出檔"""
+    for path in ["media", "logs", os.path.join("ig_data", "local_index"),
+                 os.path.join("ig_data", ".analytics.json"), os.path.join("ig_data", "tmp_extract")]:
+        path = os.path.join(workdir, path)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def latency_stats(samples: List[float]) -> Dict:
+    """以毫秒表示的延遲統計"""
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "max_ms": round(max(samples, default=0.0) * 1000, 3)
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def make_stage_timer():
+    """建立記錄各階段耗時與速率的進度回報（需在匯入 setup 之後呼叫）"""
+    import setup
+
+    class StageTimer(setup.IngestProgress):
+        def __init__(self):
+            self.stages: Dict[str, Dict] = {}
+            self._started: Dict[str, float] = {}
+
+        def start(self, stage, total=None):
+            self._started[stage] = time.perf_counter()
+            self.stages[stage] = {"items": 0, "bytes": 0, "total": total}
+
+        def advance(self, stage, items=1, nbytes=0):
+            info = self.stages.get(stage)
+            if info is not None:
+                info["items"] += items
+                info["bytes"] += nbytes
+
+        def finish(self, stage):
+            info = self.stages[stage]
+            elapsed = time.perf_counter() - self._started[stage]
+            info["seconds"] = round(elapsed, 4)
+            info["items_per_s"] = round(info["items"] / elapsed, 1) if elapsed > 0 else 0.0
+            info["mb_per_s"] = round(info["bytes"] / elapsed / 1024 / 1024, 2) if elapsed > 0 else 0.0
+
+    return StageTimer()
+
+
+def run_ingest(zip_path: str, ingest_mode: str) -> Dict:
+    import setup
+
+    setup.INGEST_MODE = ingest_mode
+    timer = make_stage_timer()
+    (success, error), elapsed = timed(setup.process_instagram_zip, zip_path, progress=timer)
+    if not success:
+        raise RuntimeError(error)
+    return {"mode": ingest_mode, "seconds": round(elapsed, 4), "stages": timer.stages}
+
+
+def run_search(backend, repeat: int) -> Dict:
+    """量測搜尋頁：冷快取的第一頁、翻頁、目前頁面的媒體，以及重複查詢（同一session）"""
+    import query_cache
+
+    first_page, next_page, media, warm = [], [], [], []
+    for _ in range(repeat):
+        for query in SEARCH_QUERIES:
+            query_cache.get_cache().invalidate()
+            session: Dict = {}
+
+            def first():
+                state = backend.start_search(session, query, None, None)
+                return state, backend.get_page(state, 1)
+
+            (state, hits), elapsed = timed(first)
+            first_page.append(elapsed)
+            _, elapsed = timed(backend.fetch_sources, [hit["_id"] for hit in hits], ["media"])
+            media.append(elapsed)
+            for page_number in range(2, SEARCH_PAGES + 1):
+                _, elapsed = timed(backend.get_page, state, page_number)
+                next_page.append(elapsed)
+
+            _, elapsed = timed(lambda: backend.get_page(backend.start_search(session, query, None, None), 1))
+            warm.append(elapsed)
+
+    return {
+        "first_page_cold": latency_stats(first_page),
+        "next_page": latency_stats(next_page),
+        "page_media": latency_stats(media),
+        "first_page_warm": latency_stats(warm)
+    }
+
+
+def run_suggest(backend, repeat: int) -> Dict:
+    import query_cache
+
+    samples = []
+    for _ in range(repeat):
+        query_cache.get_cache().invalidate()
+        for prefix in SUGGEST_PREFIXES:
+            _, elapsed = timed(backend.suggest, prefix)
+            samples.append(elapsed)
+    return latency_stats(samples)
+
+
+def run_analytics(backend) -> Dict:
+    """量測分析頁：完整計算（不使用存檔）、同一版本再次讀取，以及趨勢分析"""
+    import analytics
+    import local_index
+    import query_cache
+
+    results = {}
+    if backend.supports_trends:
+        _, elapsed = timed(analytics.compute_analytics, backend.es)
+        results["compute_s"] = round(elapsed, 4)
+        _, elapsed = timed(backend.get_analytics)
+        results["page_load_s"] = round(elapsed, 4)
+        _, elapsed = timed(backend.get_analytics)
+        results["page_load_cached_s"] = round(elapsed, 4)
+
+        query_cache.get_cache().invalidate()
+        trends = {
+            "top_terms_by_month": lambda: analytics.top_terms_by_month(backend.es, "hashtags"),
+            "rising_terms": lambda: analytics.rising_terms(backend.es, "hashtags"),
+            "cooccurrence": lambda: analytics.cooccurrence(backend.es)
+        }
+        for name, func in trends.items():
+            _, elapsed = timed(func)
+            results[f"{name}_s"] = round(elapsed, 4)
+    else:
+        # 本機索引的統計在建立索引時已算好，重新開啟索引以量測冷讀取
+        _, elapsed = timed(lambda: local_index.LocalIndex(backend.index_dir).analytics())
+        results["page_load_s"] = round(elapsed, 4)
+        _, elapsed = timed(backend.get_analytics)
+        results["page_load_cached_s"] = round(elapsed, 4)
+    return results
+
+
+def flatten(data, prefix: str = "") -> Dict[str, float]:
+    """將巢狀結果攤平成 "size.path.metric" → 數值，方便比較兩次執行"""
+    flat = {}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(data, (int, float)) and not isinstance(data, bool):
+        flat[prefix] = data
+    return flat
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[Dict]:
+    """比較耗時類指標（秒、毫秒），列出變化超過門檻的項目"""
+    current, previous = flatten(results["sizes"]), flatten(baseline.get("sizes", {}))
+    changes = []
+    for key in sorted(current.keys() & previous.keys()):
+        if not (key.endswith("_s") or key.endswith("_ms") or key.endswith(".seconds")) or previous[key] <= 0:
+            continue
+        change = (current[key] - previous[key]) / previous[key]
+        if abs(change) >= threshold:
+            changes.append({"metric": key, "baseline": previous[key], "current": current[key],
+                            "change": round(change, 3)})
+    return changes
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="端到端效能測試（匯入、搜尋、分析）")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="貼文數，以逗號分隔")
+    parser.add_argument("--backend", choices=["elasticsearch", "local"], default="elasticsearch")
+    parser.add_argument("--es-host", default=None, help="Elasticsearch位址（預設使用 ES_HOST 環境變數）")
+    parser.add_argument("--ingest-modes", default="zip", help="匯入流程：zip、extract，或以逗號分隔兩者")
+    parser.add_argument("--media-per-post", type=int, default=1)
+    parser.add_argument("--media-kb", type=int, default=20)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=5, help="搜尋與建議詞的重複次數")
+    parser.add_argument("--workdir", default=None, help="工作目錄（預設為暫存目錄，結束後刪除）")
+    parser.add_argument("--output", default="e2e_results.json")
+    parser.add_argument("--baseline", default=None, help="先前的結果檔，列出變化超過門檻的指標")
+    parser.add_argument("--threshold", type=float, default=0.1, help="比較時的變化門檻（0.1 為 10%%）")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="instasearch_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    configure_environment(workdir, args.backend, args.es_host)
+
+    import es_client
+    import search_backend
+
+    # 健康狀態由背景執行緒更新，這裡沒有啟動背景檢查，直接ping一次
+    if args.backend == "elasticsearch" and not es_client.check_health():
+        sys.exit(f"無法連線到 Elasticsearch（{es_client.ES_HOST}），請先啟動容器或改用 --backend local")
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    modes = args.ingest_modes.split(",")
+    results = {
+        "meta": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "args": vars(args)
+        },
+        "sizes": {}
+    }
+
+    try:
+        for size in sizes:
+            zip_path = os.path.join(workdir, "exports", f"posts_{size}.zip")
+            export, elapsed = timed(generate_export, zip_path, size, args.media_per_post,
+                                    args.media_kb, args.duplicate_ratio)
+            print(f"📦 {size} 篇貼文：{export['media']} 個媒體檔，{export['bytes'] / 1024 / 1024:.1f} MB"
+                  f"（產生 {elapsed:.1f}s）")
+
+            entry = {"export": export, "ingest": {}}
+            for mode in modes:
+                reset_workdir(workdir)
+                entry["ingest"][mode] = run_ingest(zip_path, mode)
+                print(f"🚚 匯入（{mode}）：{entry['ingest'][mode]['seconds']:.2f}s")
+
+            backend = search_backend.get_backend(backend=args.backend)
+            entry["search"] = run_search(backend, args.repeat)
+            entry["suggest"] = run_suggest(backend, args.repeat)
+            entry["analytics"] = run_analytics(backend)
+            print(f"🔍 第一頁 p50 {entry['search']['first_page_cold']['p50_ms']}ms，"
+                  f"p95 {entry['search']['first_page_cold']['p95_ms']}ms")
+            results["sizes"][str(size)] = entry
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            results["comparison"] = compare(results, json.load(f), args.threshold)
+        for change in results["comparison"]:
+            print(f"{'🔺' if change['change'] > 0 else '🔻'} {change['metric']}: "
+                  f"{change['baseline']} → {change['current']} ({change['change']:+.0%})")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"✅ 結果已寫入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
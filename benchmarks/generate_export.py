@@ -0,0 +1,125 @@
+"""產生模擬的Instagram匯出ZIP檔，供效能測試使用
+
+結構與真實匯出檔相同：
+    your_instagram_activity/content/posts_N.json   貼文（標題以latin1亂碼方式編碼，與IG匯出相同）
+    media/posts/YYYYMM/<檔名>.jpg                   依月份分目錄的圖片
+
+用法：
+    python benchmarks/generate_export.py /tmp/export_10k.zip --posts 10000 --media-per-post 2 --media-kb 50
+"""
+import io
+import os
+import json
+import random
+import zipfile
+import argparse
+import datetime
+from typing import Dict, List
+
+from PIL import Image
+
+POSTS_PER_FILE = 1000  # 每個 posts_N.json 的貼文數
+START_DATE = datetime.datetime(2018, 1, 1)
+
+PLACES = ["鼎泰豐", "一蘭拉麵", "阿宗麵線", "春水堂", "金峰滷肉飯", "永康牛肉麵", "富霸王豬腳", "杭州小籠湯包",
+          "添好運", "藍家割包", "路易莎咖啡", "晶華酒店", "饗食天堂", "鬍鬚張", "欣葉台菜", "度小月"]
+DISHES = ["小籠包", "牛肉麵", "滷肉飯", "珍珠奶茶", "拉麵", "蚵仔煎", "鹽酥雞", "豬腳飯", "割包", "芒果冰",
+          "提拉米蘇", "義大利麵", "壽司", "燒肉", "火鍋", "早午餐", "可頌", "拿鐵"]
+ADJECTIVES = ["超好吃", "湯頭濃郁", "份量很足", "CP值高", "排隊名店", "服務親切", "環境舒適", "口感紮實",
+              "甜而不膩", "香氣十足", "有點小貴", "會再回訪"]
+AREAS = ["台北", "信義區", "大安區", "中山區", "台中", "台南", "高雄", "新竹"]
+
+
+def mojibake(text: str) -> str:
+    """以IG匯出的方式編碼：UTF-8位元組逐一當作latin1字元"""
+    return text.encode("utf-8").decode("latin1")
+
+
+def make_title(rng: random.Random) -> str:
+    place, area = rng.choice(PLACES), rng.choice(AREAS)
+    dishes = rng.sample(DISHES, rng.randint(1, 3))
+    lines = [
+        f"📍{place} {area}店",
+        f"點了{'、'.join(f'【{d}】' for d in dishes)}",
+        "，".join(rng.sample(ADJECTIVES, rng.randint(2, 4))) + "！",
+        " ".join(f"#{tag}" for tag in dict.fromkeys([f"{area}美食", dishes[0], "食記",
+                                                   rng.choice(["美食日記", "吃貨", "foodie"])]))
+    ]
+    return "\n".join(lines)
+
+
+def make_image(rng: random.Random, size_bytes: int) -> bytes:
+    """產生可解碼的JPEG；不足指定大小時在檔尾補上隨機位元組（解碼器會忽略）"""
+    img = Image.new("RGB", (64, 64), tuple(rng.randrange(256) for _ in range(3)))
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=80)
+    data = buf.getvalue()
+    if len(data) < size_bytes:
+        data += rng.randbytes(size_bytes - len(data))
+    return data
+
+
+def generate_export(path: str, posts: int, media_per_post: int = 1, media_kb: int = 20,
+                    duplicate_ratio: float = 0.0, posts_per_file: int = POSTS_PER_FILE, seed: int = 42) -> Dict:
+    """產生模擬的匯出ZIP
+
+    Args:
+        path: 輸出的ZIP路徑
+        posts: 貼文數
+        media_per_post: 每篇貼文的圖片數
+        media_kb: 每張圖片的大小（KB）
+        duplicate_ratio: 與先前圖片內容相同的比例（測試內容雜湊儲存區的去重）
+        posts_per_file: 每個 posts_N.json 的貼文數
+        seed: 亂數種子，相同參數會產生相同內容
+
+    Returns:
+        Dict: {"posts", "media", "bytes"}
+    """
+    rng = random.Random(seed)
+    media_count = 0
+    recent_images: List[bytes] = []
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    # 圖片本身已壓縮，以不壓縮方式存放；JSON以deflate壓縮
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for file_number, first in enumerate(range(0, posts, posts_per_file), start=1):
+            items = []
+            for i in range(first, min(first + posts_per_file, posts)):
+                created = START_DATE + datetime.timedelta(minutes=i * 37 + rng.randrange(30))
+                timestamp = int(created.replace(tzinfo=datetime.timezone.utc).timestamp())
+                media = []
+                for j in range(media_per_post):
+                    uri = f"media/posts/{created:%Y%m}/{timestamp}_{i}_{j}.jpg"
+                    if recent_images and rng.random() < duplicate_ratio:
+                        data = rng.choice(recent_images)
+                    else:
+                        data = make_image(rng, media_kb * 1024)
+                        recent_images = (recent_images + [data])[-50:]
+                    zf.writestr(zipfile.ZipInfo(uri, created.timetuple()[:6]), data, compress_type=zipfile.ZIP_STORED)
+                    media.append({"uri": uri, "creation_timestamp": timestamp, "title": ""})
+                    media_count += 1
+                items.append({"media": media, "title": mojibake(make_title(rng)), "creation_timestamp": timestamp})
+            zf.writestr(f"your_instagram_activity/content/posts_{file_number}.json", json.dumps(items, indent=2))
+
+    size = os.path.getsize(path)
+    return {"posts": posts, "media": media_count, "bytes": size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="產生模擬的Instagram匯出ZIP檔")
+    parser.add_argument("path", help="輸出的ZIP路徑")
+    parser.add_argument("--posts", type=int, default=1000)
+    parser.add_argument("--media-per-post", type=int, default=1)
+    parser.add_argument("--media-kb", type=int, default=20)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.0)
+    parser.add_argument("--posts-per-file", type=int, default=POSTS_PER_FILE)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    stats = generate_export(args.path, args.posts, args.media_per_post, args.media_kb,
+                            args.duplicate_ratio, args.posts_per_file, args.seed)
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 import zipfile
 import os
+import sys
 import shutil
 import json
 import pandas as pd
@@ -9,6 +10,10 @@ from contextlib import contextmanager
 from typing import Dict, List
 import logging
 
+# 與 streamlit_app 共用 _bulk 寫入：429 與 5xx 的單筆文件都以指數退避重試
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "streamlit_app"))
+from bulk_writer import bulk_write
+
 # 設定日誌
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -21,6 +26,9 @@ EXTRACT_PATH = os.path.join(IG_DATA_DIR, "tmp_extract")
 POSTS_JSON_PATH = os.path.join(EXTRACT_PATH, "your_instagram_activity", "content", "posts_1.json")
 ES_HOST = "http://localhost:9200"
 ES_INDEX = "ig_data"
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_MAX_CHUNK_BYTES = int(os.getenv("BULK_MAX_CHUNK_BYTES", str(10 * 1024 * 1024)))
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "3"))
 
 @contextmanager
 def elasticsearch_client():
@@ -107,21 +115,33 @@ def setup_elasticsearch_index():
         logger.info(f"✅ 索引 '{ES_INDEX}' 已建立")
 
 def import_data_to_elasticsearch(data: List[Dict]):
-    """將資料導入Elasticsearch
+    """將資料以 _bulk API 批次導入Elasticsearch
     
     Args:
         data: 要導入的資料列表
     """
-    with elasticsearch_client() as es:
-        for item in data:
-            doc = {
+    timestamp = datetime.datetime.now().isoformat()
+    actions = (
+        {
+            "_index": ES_INDEX,
+            "_source": {
                 "content": item["title"],
                 "datetime": item["creation_timestamp"],
-                "timestamp": datetime.datetime.now().isoformat(),
+                "timestamp": timestamp,
                 "media": item["media"]
             }
-            res = es.index(index=ES_INDEX, body=doc)
-            logger.info(f"✅ 文本已寫入，ID: {res['_id']}")
+        }
+        for item in data
+    )
+    
+    with elasticsearch_client() as es:
+        report = bulk_write(es, actions,
+                            chunk_size=BULK_CHUNK_SIZE,
+                            max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+                            max_retries=BULK_MAX_RETRIES)
+    for error in report["errors"]:
+        logger.warning(f"寫入失敗：{error}")
+    logger.info(f"✅ 批次寫入完成：成功 {report['indexed']} 筆，失敗 {report['failed']} 筆，重試 {report['retried']} 次")
 
 def cleanup():
     """清理暫存檔案和目錄"""
@@ -0,0 +1,465 @@
+import os
+import json
+import logging
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+import multi_search
+import query_cache
+
+logger = logging.getLogger(__name__)
+
+ES_INDEX = "ig_data"
+BASE_DIR = os.getenv("APP_BASE_DIR", "/app")
+# 統計結果與索引版本一起存檔，下次匯入前都直接沿用
+ANALYTICS_FILE = os.getenv("ANALYTICS_FILE", os.path.join(BASE_DIR, "ig_data", ".analytics.json"))
+RECENT_MONTHS = int(os.getenv("ANALYTICS_RECENT_MONTHS", "2"))  # 手動更新時重算最近幾個月
+TOP_TERMS_SIZE = int(os.getenv("ANALYTICS_TOP_TERMS", "20"))
+TERM_FIELDS = ["hashtags", "places", "dishes"]
+MONTH_FORMAT = "yyyy-MM"
+COMPOSITE_PAGE_SIZE = int(os.getenv("ANALYTICS_COMPOSITE_PAGE", "1000"))  # composite 每次取回的bucket數
+TRENDING_MONTHS = int(os.getenv("ANALYTICS_TRENDING_MONTHS", "3"))       # 「近期」的月份數
+
+# 每月內容指紋：content_hash 前 8 碼（32 位元）的總和，一個月兩百萬篇以內不會超出 double 的精確範圍
+HASH_SUM_SCRIPT = ("doc['content_hash'].size() == 0 ? 0 : "
+                   "Long.parseLong(doc['content_hash'].value.substring(0, 8), 16)")
+
+WEEKDAY_NAMES = {1: "週一", 2: "週二", 3: "週三", 4: "週四", 5: "週五", 6: "週六", 7: "週日"}
+
+_lock = threading.Lock()
+_latest: Optional[Dict] = None
+
+
+def time_fields(creation_timestamp: str) -> Dict:
+    """匯入時計算星期與小時欄位，統計時不必執行script
+
+    Args:
+        creation_timestamp: ISO格式的發文時間
+
+    Returns:
+        Dict: {"weekday": 1～7（週一為1）, "hour": 0～23}
+    """
+    dt = datetime.datetime.fromisoformat(creation_timestamp)
+    return {"weekday": dt.isoweekday(), "hour": dt.hour}
+
+
+def _buckets_to_dict(buckets: List[Dict]) -> Dict[str, int]:
+    return {str(b["key"]): b["doc_count"] for b in buckets}
+
+
+def _fingerprint_aggs() -> Dict:
+    """每月最新發文時間與內容雜湊總和，篇數相同但內容改變時也能察覺"""
+    return {
+        "latest": {"max": {"field": "datetime"}},
+        "hash_sum": {"sum": {"script": {"source": HASH_SUM_SCRIPT}}}
+    }
+
+
+def _fingerprint(bucket: Dict) -> List:
+    """[發文數, 最新發文時間, 內容雜湊總和]"""
+    return [bucket["doc_count"], bucket["latest"]["value"], bucket["hash_sum"]["value"]]
+
+
+def _months_body(since: Optional[str] = None) -> Dict:
+    """依月份統計發文數，以及每月的星期、小時分布的查詢
+
+    Args:
+        since: 只統計此月份（yyyy-MM）之後的資料，None 為全部
+    """
+    body = {
+        "size": 0,
+        "aggs": {
+            "months": {
+                "date_histogram": {
+                    "field": "datetime",
+                    "calendar_interval": "month",
+                    "format": MONTH_FORMAT,
+                    "min_doc_count": 1
+                },
+                "aggs": {
+                    "weekday": {"terms": {"field": "weekday", "size": 7}},
+                    "hour": {"terms": {"field": "hour", "size": 24}},
+                    **_fingerprint_aggs()
+                }
+            }
+        }
+    }
+    if since:
+        body["query"] = {"range": {"datetime": {"gte": since, "format": MONTH_FORMAT}}}
+    return body
+
+
+def _parse_months(response: Dict) -> Dict[str, Dict]:
+    """{月份: {"count", "weekday", "hour", "fingerprint"}}"""
+    return {
+        b["key_as_string"]: {
+            "count": b["doc_count"],
+            "weekday": _buckets_to_dict(b["weekday"]["buckets"]),
+            "hour": _buckets_to_dict(b["hour"]["buckets"]),
+            "fingerprint": _fingerprint(b)
+        }
+        for b in response["aggregations"]["months"]["buckets"]
+    }
+
+
+def _month_fingerprints(es, index: str) -> Dict[str, List]:
+    """只取得每月指紋，用來判斷哪些月份需要重算"""
+    body = {
+        "size": 0,
+        "aggs": {
+            "months": {
+                "date_histogram": {
+                    "field": "datetime",
+                    "calendar_interval": "month",
+                    "format": MONTH_FORMAT,
+                    "min_doc_count": 1
+                },
+                "aggs": _fingerprint_aggs()
+            }
+        }
+    }
+    response = es.search(index=index, body=body)
+    return {b["key_as_string"]: _fingerprint(b) for b in response["aggregations"]["months"]["buckets"]}
+
+
+def _top_terms_body() -> Dict:
+    """統計最常出現的hashtag、店名與菜名的查詢"""
+    return {
+        "size": 0,
+        "aggs": {field: {"terms": {"field": field, "size": TOP_TERMS_SIZE}} for field in TERM_FIELDS}
+    }
+
+
+def _parse_top_terms(response: Dict) -> Dict[str, List]:
+    return {
+        field: [[b["key"], b["doc_count"]] for b in response["aggregations"][field]["buckets"]]
+        for field in TERM_FIELDS
+    }
+
+
+def _aggregate(es, index: str, since: Optional[str] = None) -> Tuple[Dict[str, Dict], Dict[str, List]]:
+    """以一次 _msearch 取得每月統計與熱門詞"""
+    months, top_terms = multi_search.msearch(es, [(index, _months_body(since)), (index, _top_terms_body())])
+    return _parse_months(months), _parse_top_terms(top_terms)
+
+
+def summarize(months: Dict[str, Dict], top_terms: Dict[str, List], version: Optional[str]) -> Dict:
+    """由每月統計彙總出總數與整體分布"""
+    weekday = {str(d): 0 for d in WEEKDAY_NAMES}
+    hour = {str(h): 0 for h in range(24)}
+    for month in months.values():
+        for key, count in month["weekday"].items():
+            weekday[key] = weekday.get(key, 0) + count
+        for key, count in month["hour"].items():
+            hour[key] = hour.get(key, 0) + count
+    return {
+        "version": version,
+        "computed_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "total": sum(month["count"] for month in months.values()),
+        "months": dict(sorted(months.items())),
+        "weekday": weekday,
+        "hour": hour,
+        "top_terms": top_terms
+    }
+
+
+def compute_analytics(es, index: str = ES_INDEX, version: Optional[str] = None) -> Dict:
+    """完整計算所有統計
+
+    Args:
+        es: Elasticsearch客戶端
+        index: 索引名稱
+        version: 統計對應的索引版本
+
+    Returns:
+        Dict: {"version", "computed_at", "total", "months", "weekday", "hour", "top_terms"}
+    """
+    months, top_terms = _aggregate(es, index)
+    return summarize(months, top_terms, version)
+
+
+def update_analytics(es, previous: Dict, index: str = ES_INDEX, version: Optional[str] = None,
+                     recent_months: int = 0) -> Dict:
+    """以先前的統計為基礎，只重算有變動的月份
+
+    先以便宜的每月指紋（發文數、最新發文時間、content_hash 總和）找出有新增、
+    刪除或內容修改的月份（另外一律包含最近 recent_months 個月），再從其中最早
+    的月份開始重算星期、小時分布；較早的月份沿用舊結果。沒有指紋的舊統計視為
+    已變動。
+
+    Args:
+        es: Elasticsearch客戶端
+        previous: 先前的統計結果
+        index: 索引名稱
+        version: 新的索引版本
+        recent_months: 不論指紋是否改變都重算的最近月份數
+
+    Returns:
+        Dict: 更新後的統計結果
+    """
+    fingerprints = _month_fingerprints(es, index)
+    old_months = previous.get("months", {})
+    ordered = sorted(fingerprints)
+    changed = {m for m in ordered if old_months.get(m, {}).get("fingerprint") != fingerprints[m]}
+    if recent_months:
+        changed.update(ordered[-recent_months:])
+
+    months = {m: old_months[m] for m in ordered if m in old_months}
+    if changed:
+        since = min(changed)
+        months = {m: v for m, v in months.items() if m < since}
+        recomputed, top_terms = _aggregate(es, index, since)
+        months.update(recomputed)
+    else:
+        top_terms = _parse_top_terms(multi_search.msearch(es, [(index, _top_terms_body())])[0])
+    logger.info(f"📊 統計更新：重算 {len(changed)} 個月份（共 {len(fingerprints)} 個）")
+    return summarize(months, top_terms, version)
+
+
+def load_analytics(path: str = ANALYTICS_FILE) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_analytics(analytics: Dict, path: str = ANALYTICS_FILE):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(analytics, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"無法儲存統計結果 {path}: {e}")
+
+
+def get_analytics(es, index: str = ES_INDEX) -> Dict:
+    """取得目前索引版本的統計，同一版本只計算一次
+
+    依序使用行程內的結果、存檔的結果；索引版本改變時以舊結果為基礎增量更新，
+    沒有舊結果時才完整計算。
+
+    Args:
+        es: Elasticsearch客戶端
+        index: 索引名稱
+
+    Returns:
+        Dict: 統計結果
+    """
+    global _latest
+    version = query_cache.read_index_version()
+    with _lock:
+        if _latest is not None and _latest["version"] == version:
+            return _latest
+
+        stored = _latest or load_analytics()
+        if stored is not None and stored.get("version") == version:
+            _latest = stored
+            return _latest
+
+        if stored is not None and "months" in stored:
+            analytics = update_analytics(es, stored, index, version)
+        else:
+            analytics = compute_analytics(es, index, version)
+            logger.info(f"📊 統計完成：{analytics['total']} 篇貼文，{len(analytics['months'])} 個月份")
+        save_analytics(analytics)
+        _latest = analytics
+        return _latest
+
+
+def refresh_recent(es, months: int = RECENT_MONTHS, index: str = ES_INDEX) -> Dict:
+    """手動更新：重算最近幾個月份與熱門詞
+
+    Args:
+        es: Elasticsearch客戶端
+        months: 要重算的最近月份數
+        index: 索引名稱
+
+    Returns:
+        Dict: 更新後的統計結果
+    """
+    global _latest
+    previous = get_analytics(es, index)
+    with _lock:
+        analytics = update_analytics(es, previous, index, previous["version"], recent_months=months)
+        save_analytics(analytics)
+        _latest = analytics
+        return _latest
+
+
+def composite_frame(es, sources: List[Dict], query: Optional[Dict] = None,
+                    index: str = ES_INDEX, page_size: int = COMPOSITE_PAGE_SIZE) -> pd.DataFrame:
+    """以 composite 聚合分頁取回所有bucket，轉為 DataFrame
+
+    Args:
+        es: Elasticsearch客戶端
+        sources: composite sources，例如 [{"term": {"terms": {"field": "hashtags"}}}]
+        query: 篩選條件
+        index: 索引名稱
+        page_size: 每次取回的bucket數
+
+    Returns:
+        pd.DataFrame: 每個source一欄，另加 count 欄
+    """
+    columns = [name for source in sources for name in source]
+    body = {"size": 0, "aggs": {"pairs": {"composite": {"size": page_size, "sources": sources}}}}
+    if query:
+        body["query"] = query
+
+    keys, counts = [], []
+    while True:
+        result = es.search(index=index, body=body)["aggregations"]["pairs"]
+        for bucket in result["buckets"]:
+            keys.append(bucket["key"])
+            counts.append(bucket["doc_count"])
+        after = result.get("after_key")
+        if not after or len(result["buckets"]) < page_size:
+            break
+        body["aggs"]["pairs"]["composite"]["after"] = after
+
+    frame = pd.DataFrame.from_records(keys, columns=columns)
+    frame["count"] = np.asarray(counts, dtype=np.int64)
+    return frame
+
+
+def _month_source() -> Dict:
+    return {"month": {"date_histogram": {"field": "datetime", "calendar_interval": "month", "format": MONTH_FORMAT}}}
+
+
+def _cached(name: str, compute):
+    """結果存放在共用查詢快取，索引版本改變時自動失效"""
+    return query_cache.get_cache().get_or_compute(f"analytics|{name}", compute)
+
+
+def top_terms_by_month(es, field: str, top_n: int = 5, index: str = ES_INDEX) -> pd.DataFrame:
+    """每月最常出現的詞
+
+    Args:
+        es: Elasticsearch客戶端
+        field: hashtags、places 或 dishes
+        top_n: 每月取前幾名
+        index: 索引名稱
+
+    Returns:
+        pd.DataFrame: 欄位 month、rank、term、count
+    """
+    def compute():
+        frame = composite_frame(es, [_month_source(), {"term": {"terms": {"field": field}}}], index=index)
+        if frame.empty:
+            return frame.assign(rank=pd.Series(dtype=np.int64))[["month", "rank", "term", "count"]]
+        frame["rank"] = frame.groupby("month")["count"].rank(method="first", ascending=False).astype(np.int64)
+        frame = frame[frame["rank"] <= top_n]
+        return frame.sort_values(["month", "rank"], ascending=[False, True])[["month", "rank", "term", "count"]]
+
+    return _cached(f"top_by_month|{field}|{top_n}|{index}", compute)
+
+
+def rising_terms(es, field: str, recent_months: int = TRENDING_MONTHS, size: int = 20,
+                 index: str = ES_INDEX) -> pd.DataFrame:
+    """近期竄升的詞：significant_terms 比較近期與全部資料，再計算佔比成長
+
+    Args:
+        es: Elasticsearch客戶端
+        field: hashtags、places 或 dishes
+        recent_months: 近期的月份數
+        size: 最多回傳幾個詞
+        index: 索引名稱
+
+    Returns:
+        pd.DataFrame: 欄位 term、recent、total、score、recent_share、earlier_share、growth
+    """
+    def compute():
+        since = f"now-{recent_months}M/M"
+        body = {
+            "size": 0,
+            "query": {"range": {"datetime": {"gte": since}}},
+            "aggs": {"rising": {"significant_terms": {"field": field, "size": size, "min_doc_count": 2}}}
+        }
+        agg = es.search(index=index, body=body)["aggregations"]["rising"]
+        frame = pd.DataFrame(
+            [(b["key"], b["doc_count"], b["bg_count"], b["score"]) for b in agg["buckets"]],
+            columns=["term", "recent", "total", "score"]
+        )
+        recent_posts = agg.get("doc_count", 0)
+        all_posts = agg.get("bg_count", 0)
+        earlier_posts = max(all_posts - recent_posts, 1)
+        # 以向量運算計算近期與先前的出現比例
+        frame["recent_share"] = frame["recent"] / max(recent_posts, 1)
+        frame["earlier_share"] = (frame["total"] - frame["recent"]) / earlier_posts
+        frame["growth"] = frame["recent_share"] / frame["earlier_share"].replace(0, np.nan)
+        return frame.sort_values("score", ascending=False).reset_index(drop=True)
+
+    return _cached(f"rising|{field}|{recent_months}|{size}|{index}", compute)
+
+
+def cooccurrence_scans(es, row_field: str = "places", column_field: str = "dishes",
+                       index: str = ES_INDEX) -> Dict[str, Callable[[], Any]]:
+    """共同出現分析需要的四個查詢（各自快取），互不相依
+
+    呼叫端可將這些查詢與其他查詢放進同一個 multi_search.run_parallel，
+    再以 combine_cooccurrence 合併結果。
+
+    Args:
+        es: Elasticsearch客戶端
+        row_field: 第一個欄位
+        column_field: 第二個欄位
+        index: 索引名稱
+
+    Returns:
+        Dict[str, Callable]: {"pairs", "rows", "columns", "total": 不需參數的查詢函數}
+    """
+    row_source = {row_field: {"terms": {"field": row_field}}}
+    column_source = {column_field: {"terms": {"field": column_field}}}
+    key = f"cooccurrence|{row_field}|{column_field}|{index}"
+    return {
+        "pairs": lambda: _cached(f"{key}|pairs", lambda: composite_frame(es, [row_source, column_source], index=index)),
+        "rows": lambda: _cached(f"{key}|rows", lambda: composite_frame(es, [row_source], index=index)),
+        "columns": lambda: _cached(f"{key}|columns", lambda: composite_frame(es, [column_source], index=index)),
+        "total": lambda: _cached(f"{key}|total", lambda: es.count(index=index)["count"])
+    }
+
+
+def combine_cooccurrence(results: Dict[str, Any], row_field: str = "places", column_field: str = "dishes",
+                         min_count: int = 2) -> pd.DataFrame:
+    """由 cooccurrence_scans 的查詢結果計算共同出現篇數與關聯度
+
+    Returns:
+        pd.DataFrame: 欄位 row_field、column_field、count、lift（依 count 遞減）
+    """
+    pairs, rows, columns = results["pairs"], results["rows"], results["columns"]
+    if pairs.empty:
+        return pairs.assign(lift=pd.Series(dtype=float))
+    total = results["total"] or 1
+
+    pairs = pairs[pairs["count"] >= min_count]
+    row_counts = pairs[row_field].map(rows.set_index(row_field)["count"])
+    column_counts = pairs[column_field].map(columns.set_index(column_field)["count"])
+    # lift > 1 代表兩者一起出現的機率高於各自獨立出現
+    pairs = pairs.assign(lift=pairs["count"] * total / (row_counts * column_counts))
+    return pairs.sort_values(["count", "lift"], ascending=False).reset_index(drop=True)
+
+
+def cooccurrence(es, row_field: str = "places", column_field: str = "dishes", min_count: int = 2,
+                 index: str = ES_INDEX) -> pd.DataFrame:
+    """同一篇貼文中同時出現的店家與餐點
+
+    已在 run_parallel 中的呼叫端應改用 cooccurrence_scans，讓四個查詢與其他查詢一起執行。
+
+    Args:
+        es: Elasticsearch客戶端
+        row_field: 第一個欄位
+        column_field: 第二個欄位
+        min_count: 最少共同出現篇數
+        index: 索引名稱
+
+    Returns:
+        pd.DataFrame: 欄位 row_field、column_field、count、lift（依 count 遞減）
+    """
+    results = multi_search.run_parallel(cooccurrence_scans(es, row_field, column_field, index))
+    return combine_cooccurrence(results, row_field, column_field, min_count)
@@ -0,0 +1,110 @@
+import os
+import logging
+from typing import Dict, Set
+
+logger = logging.getLogger(__name__)
+
+# content 欄位使用的分析器："cjk_bigram"（預設）、"ngram"、"standard"，
+# 或需要安裝外掛的字典分詞器 "smartcn"、"ik"
+CONTENT_ANALYZER = os.getenv("CONTENT_ANALYZER", "cjk_bigram")
+FALLBACK_ANALYZER = "cjk_bigram"
+
+# 每種分析器需要的外掛、analysis 設定與 content 欄位設定
+ANALYZERS = {
+    # 逐字切分，中文會被拆成單字（原本的行為，保留供比較）
+    "standard": {
+        "plugin": None,
+        "analysis": {},
+        "field": {"analyzer": "standard"}
+    },
+    # 中日韓文字切成相鄰兩字，英數仍以單字切分；全形半形與大小寫統一
+    "cjk_bigram": {
+        "plugin": None,
+        "analysis": {
+            "analyzer": {
+                "content_cjk_bigram": {
+                    "type": "custom",
+                    "tokenizer": "standard",
+                    "filter": ["cjk_width", "lowercase", "cjk_bigram"]
+                }
+            }
+        },
+        "field": {"analyzer": "content_cjk_bigram"}
+    },
+    # 2～3字的n-gram，不需字典即可比對任意詞，但索引較大
+    "ngram": {
+        "plugin": None,
+        "analysis": {
+            "tokenizer": {
+                "content_ngram": {
+                    "type": "ngram",
+                    "min_gram": 2,
+                    "max_gram": 3,
+                    "token_chars": ["letter", "digit"]
+                }
+            },
+            "analyzer": {
+                "content_ngram": {
+                    "type": "custom",
+                    "tokenizer": "content_ngram",
+                    "filter": ["cjk_width", "lowercase"]
+                }
+            }
+        },
+        "field": {"analyzer": "content_ngram"}
+    },
+    # 以下為字典分詞，需先在Elasticsearch節點安裝對應外掛
+    "smartcn": {
+        "plugin": "analysis-smartcn",
+        "analysis": {},
+        "field": {"analyzer": "smartcn"}
+    },
+    "ik": {
+        "plugin": "analysis-ik",
+        "analysis": {},
+        "field": {"analyzer": "ik_max_word", "search_analyzer": "ik_smart"}
+    }
+}
+
+
+def installed_plugins(es) -> Set[str]:
+    """取得叢集中已安裝的外掛名稱"""
+    try:
+        return {plugin["component"] for plugin in es.cat.plugins(format="json")}
+    except Exception as e:
+        logger.warning(f"無法取得外掛清單：{e}")
+        return set()
+
+
+def resolve_analyzer(es, name: str = CONTENT_ANALYZER) -> str:
+    """確認分析器可用；未知名稱或缺少外掛時改用預設的 cjk_bigram
+
+    Args:
+        es: Elasticsearch客戶端
+        name: 設定的分析器名稱
+
+    Returns:
+        str: 實際使用的分析器名稱
+    """
+    config = ANALYZERS.get(name)
+    if config is None:
+        logger.warning(f"未知的分析器 '{name}'，改用 {FALLBACK_ANALYZER}")
+        return FALLBACK_ANALYZER
+    if config["plugin"] and config["plugin"] not in installed_plugins(es):
+        logger.warning(f"未安裝 {config['plugin']} 外掛，改用 {FALLBACK_ANALYZER}")
+        return FALLBACK_ANALYZER
+    return name
+
+
+def analysis_settings(name: str) -> Dict:
+    """取得索引 settings 中的 analysis 設定"""
+    return ANALYZERS[name]["analysis"]
+
+
+def content_field_mapping(name: str) -> Dict:
+    """取得使用指定分析器的 content 欄位 mapping"""
+    return {
+        "type": "text",
+        **ANALYZERS[name]["field"],
+        "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}
+    }
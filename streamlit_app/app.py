@@ -1,10 +1,19 @@
 import streamlit as st
-from elasticsearch import Elasticsearch
-import time
 import logging
 from datetime import datetime, timedelta
-from PIL import Image, UnidentifiedImageError
 import os
+import time
+import pandas as pd
+
+import analytics
+import es_client
+import ingest_jobs
+import metrics
+import multi_search
+import search
+import search_backend
+import search_session
+import thumbnails
 
 # 設定頁面配置
 st.set_page_config(
@@ -24,6 +33,10 @@ st.markdown(
         div[data-testid="stVerticalBlock"] > div:has(div.stButton) > div {
             padding-top: 25px;
         }
+        .snippet mark {
+            background-color: #fff3b0;
+            padding: 0 2px;
+        }
     </style>
     """,
     unsafe_allow_html=True,
@@ -42,24 +55,20 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 logger.info("✅ 成功初始化 Logging 系統！")
 
-# Elasticsearch 連接設定
-es_host = os.getenv("ES_HOST", "http://elasticsearch:9200")
-
-# 嘗試連接 Elasticsearch（重試 5 次）
-MAX_RETRIES = 5
-RETRY_INTERVAL = 5
-
-es = None
-for i in range(MAX_RETRIES):
-    try:
-        es = Elasticsearch([es_host])
-        if es.ping():
-            logger.info("✅ 成功連接到 Elasticsearch！")
-            break
-    except Exception as e:
-        st.warning(f"🚨 連接 Elasticsearch 失敗，重試中 ({i+1}/{MAX_RETRIES})... 等待 {RETRY_INTERVAL} 秒")
-        time.sleep(RETRY_INTERVAL)
-else:
+# 共用的Elasticsearch客戶端，Streamlit重新執行腳本時不會重建連線
+es = es_client.get_client()
+# 健康檢查在背景執行，不阻塞頁面繪製
+es_client.start_health_check()
+# 背景匯入執行緒，服務重新啟動後會接續排隊中的工作
+ingest_jobs.start_worker()
+# 本機 /metrics 服務（Prometheus文字格式），每個行程只啟動一次
+metrics.start_server()
+# 依設定使用Elasticsearch或本機索引；auto 模式在Elasticsearch無法連線時改用本機索引
+backend = search_backend.get_backend(es)
+if backend.name == "local":
+    if search_backend.SEARCH_BACKEND != "local":
+        st.warning("⚠️ 無法連接到 Elasticsearch，目前使用本機索引搜尋")
+elif es_client.get_health()["ok"] is False:
     st.error("❌ 無法連接到 Elasticsearch，請檢查服務是否運行中！")
 
 # 初始化 session state
@@ -68,6 +77,9 @@ if 'current_page' not in st.session_state:
 if 'active_page' not in st.session_state:
     st.session_state.active_page = "搜尋"
 
+PAGE_RENDER_SECONDS = metrics.histogram("page_render_seconds", "整頁繪製耗時（秒）")
+RENDER_STEP_SECONDS = metrics.histogram("render_step_seconds", "搜尋頁各步驟耗時（秒）")
+
 def change_page(page):
     st.session_state.active_page = page
     st.session_state.current_page = 1
@@ -86,6 +98,27 @@ with st.sidebar:
     if st.button("⚙️ 設置", use_container_width=True):
         change_page("設置")
 
+def use_suggestion(term: str):
+    """點選建議詞：填入搜尋框並直接搜尋"""
+    st.session_state.query = term
+    st.session_state.run_search = True
+
+def show_suggestions(query: str):
+    """在搜尋框下方顯示店名、菜名與hashtag建議"""
+    try:
+        with RENDER_STEP_SECONDS.time(step="suggest"):
+            terms = [t for t in backend.suggest(query) if t != query]
+    except Exception as e:
+        # 建議詞只是輔助，失敗時不影響搜尋
+        logger.warning(f"取得建議詞失敗：{e}")
+        return
+    if not terms:
+        return
+    cols = st.columns(len(terms))
+    for i, (col, term) in enumerate(zip(cols, terms)):
+        with col:
+            st.button(term, key=f"suggestion_{i}", on_click=use_suggestion, args=(term,))
+
 def search_page():
     st.title("🔍 搜尋")
     
@@ -100,93 +133,164 @@ def search_page():
         end_date = st.date_input("結束日期")
     
     with col3:
-        query = st.text_input("請輸入搜尋關鍵字", "")
+        query = st.text_input("請輸入搜尋關鍵字", key="query")
     
     with col4:
         search_button = st.button("搜尋", use_container_width=True)
+    
+    # 索引有向量欄位時提供語意與混合搜尋
+    modes = backend.search_modes
+    mode = "keyword"
+    if len(modes) > 1:
+        mode = st.radio("搜尋模式", modes, format_func=search.SEARCH_MODES.get, horizontal=True)
+
+    # 點選建議詞時視同按下搜尋；尚未搜尋的輸入顯示建議詞
+    active_key = st.session_state.get("active_search")
+    searched = active_key is not None and active_key[0] == search_session.normalize_key(query, None, None)[0]
+    if st.session_state.pop("run_search", False):
+        search_button = True
+    elif query and not search_button and not searched:
+        show_suggestions(query)
 
     if search_button:
         if not query and not start_date:
             st.error("請至少輸入關鍵字或選擇時間！")
             return
 
-        # 組合日期範圍
-        start_datetime = f"{start_date.isoformat()}T00:00:00+00:00" if start_date else None
-        end_datetime = f"{end_date.isoformat()}T23:59:59+00:00" if end_date else None
-
-        # 搜尋邏輯
-        must_conditions = []
-        if query:
-            must_conditions.append({"match": {"content": query}})
-        if start_datetime or end_datetime:
-            date_range = {"range": {"datetime": {}}}
-            if start_datetime:
-                date_range["range"]["datetime"]["gte"] = start_datetime
-            if end_datetime:
-                date_range["range"]["datetime"]["lte"] = end_datetime
-            must_conditions.append(date_range)
-
         try:
-            with st.spinner('搜尋中...'):
-                response = es.search(
-                    index="ig_data",
-                    body={
-                        "query": {"bool": {"must": must_conditions}},
-                        "sort": [{"datetime": {"order": "desc"}}]
-                    },
-                    size=10000
-                )
-                hits = response.get("hits", {}).get("hits", [])
-                
-                if hits:
-                    st.success(f"找到 {len(hits)} 筆結果")
-                    display_results(hits)
-                else:
-                    st.warning("沒有找到相關結果")
-                    
+            with st.spinner('搜尋中...'), RENDER_STEP_SECONDS.time(step="search"):
+                # 相同條件的搜尋直接沿用session中的結果
+                backend.start_search(st.session_state, query, start_date, end_date, mode)
+                st.session_state.current_page = 1
         except Exception as e:
             st.error(f"搜尋時發生錯誤: {e}")
+            return
+
+    state = backend.get_active_search(st.session_state)
+    if state:
+        if state["total"]:
+            st.success(f"找到 {state['total']} 筆結果")
+            display_results(state)
+        else:
+            st.warning("沒有找到相關結果")
+
+def trend_section(labels):
+    """每月熱門詞、近期竄升的詞與店家／餐點共同出現"""
+    st.subheader("趨勢分析")
+    field = st.selectbox("分析欄位", list(labels), format_func=labels.get)
+    
+    # 所有查詢（含共同出現的四個查詢）同時執行，頁面只需等待最慢的一項
+    with st.spinner("分析中..."):
+        scans = analytics.cooccurrence_scans(es)
+        results = multi_search.run_parallel({
+            "monthly": lambda: analytics.top_terms_by_month(es, field),
+            "rising": lambda: analytics.rising_terms(es, field),
+            **{f"pairs_{name}": scan for name, scan in scans.items()}
+        })
+        pairs = analytics.combine_cooccurrence({name: results[f"pairs_{name}"] for name in scans})
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.markdown("**每月熱門**")
+        monthly = results["monthly"]
+        if not monthly.empty:
+            # 每月一列，依名次排成欄位
+            table = monthly.assign(label=monthly["term"] + "（" + monthly["count"].astype(str) + "）")
+            table = table.pivot(index="month", columns="rank", values="label").sort_index(ascending=False)
+            table.columns = [f"第{rank}名" for rank in table.columns]
+            st.dataframe(table, use_container_width=True)
+    with col2:
+        st.markdown(f"**近 {analytics.TRENDING_MONTHS} 個月竄升**")
+        rising = results["rising"]
+        st.dataframe(
+            rising[["term", "recent", "total", "growth"]].rename(
+                columns={"term": labels[field], "recent": "近期篇數", "total": "總篇數", "growth": "成長倍數"}
+            ),
+            hide_index=True, use_container_width=True
+        )
+    
+    st.markdown("**店家與餐點共同出現**")
+    st.dataframe(
+        pairs.head(50).rename(columns={"places": "店家", "dishes": "餐點", "count": "篇數", "lift": "關聯度"}),
+        hide_index=True, use_container_width=True
+    )
 
 def analyze_page():
     st.title("📊 分析")
     
-    if es:
+    if backend.name == "local" or es_client.get_health()["ok"] is not False:
         try:
-            # 取得時間分佈
-            agg_query = {
-                "aggs": {
-                    "posts_over_time": {
-                        "date_histogram": {
-                            "field": "datetime",
-                            "calendar_interval": "month"
-                        }
-                    }
-                },
-                "size": 0
-            }
+            # 統計結果每個索引版本只計算一次
+            stats = backend.get_analytics()
             
-            response = es.search(index="ig_data", body=agg_query)
-            
-            # 處理資料用於圖表顯示
-            dates = []
-            counts = []
-            
-            for bucket in response['aggregations']['posts_over_time']['buckets']:
-                dates.append(datetime.fromtimestamp(bucket['key']/1000).strftime('%Y-%m'))
-                counts.append(bucket['doc_count'])
+            col1, col2 = st.columns([3, 1])
+            with col1:
+                st.metric("總發文數", stats["total"])
+            with col2:
+                if st.button("更新最近月份", use_container_width=True):
+                    stats = backend.refresh_analytics()
+            st.caption(f"統計時間：{stats['computed_at']}")
             
             # 顯示圖表
             st.subheader("發文時間分布")
-            st.line_chart(dict(zip(dates, counts)))
+            st.line_chart({month: v["count"] for month, v in stats["months"].items()})
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                st.subheader("星期分布")
+                weekday = pd.DataFrame(
+                    {"發文數": [stats["weekday"].get(str(d), 0) for d in analytics.WEEKDAY_NAMES]},
+                    index=list(analytics.WEEKDAY_NAMES.values())
+                )
+                st.bar_chart(weekday)
+            with col2:
+                st.subheader("時段分布")
+                st.bar_chart(pd.DataFrame({"發文數": [stats["hour"].get(str(h), 0) for h in range(24)]}))
             
-            # 計算總發文數
-            st.metric("總發文數", len(dates))
+            st.subheader("熱門關鍵字")
+            labels = {"hashtags": "Hashtag", "places": "店家", "dishes": "餐點"}
+            for col, field in zip(st.columns(len(labels)), labels):
+                with col:
+                    st.dataframe(
+                        pd.DataFrame(stats["top_terms"].get(field, []), columns=[labels[field], "篇數"]),
+                        hide_index=True, use_container_width=True
+                    )
+            
+            if backend.supports_trends:
+                trend_section(labels)
             
         except Exception as e:
             st.error(f"分析資料時發生錯誤: {e}")
     else:
         st.error("無法連接到資料庫")
 
+STAGE_LABELS = {"extract": "寫出檔案", "parse": "解析資料", "copy": "搬移媒體", "media": "檢查媒體",
+                "index": "寫入索引", "local": "建立本機索引", "cleanup": "清除暫存檔"}
+STATUS_LABELS = {"queued": "⏳ 排隊中", "running": "🔄 處理中", "done": "✅ 完成", "failed": "❌ 失敗"}
+JOB_POLL_INTERVAL = 1.0  # 有進行中的工作時，頁面重新整理的間隔秒數
+BASE_DIR = os.getenv("APP_BASE_DIR", "/app")  # 媒體清單與貼文中的相對路徑以此為根目錄
+
+def show_job(job):
+    """顯示一個匯入工作的狀態與各階段進度"""
+    st.markdown(f"**{job['filename']}**　{STATUS_LABELS.get(job['status'], job['status'])}　"
+                f"（{job['created']}）")
+    for stage in ingest_jobs.STAGES:
+        info = job["stages"].get(stage)
+        if not info:
+            continue
+        if info["total"]:
+            fraction = min(info["items"] / info["total"], 1.0)
+            count = f"{info['items']}/{info['total']}"
+        else:
+            fraction = 1.0 if info["status"] == "done" else 0.0
+            count = f"{info['items']}"
+        text = f"{STAGE_LABELS[stage]}：{count} 筆，{info['items_per_s']:.0f} 筆/秒"
+        if info["bytes"]:
+            text += f"，{info['bytes_per_s'] / 1024 / 1024:.1f} MB/秒"
+        st.progress(fraction, text=text)
+    if job["error"]:
+        st.error(f"處理失敗：{job['error']}")
+
 def settings_page():
     st.title("⚙️ 設置")
     
@@ -196,32 +300,51 @@ def settings_page():
                                    help="上傳Instagram資料下載的ZIP檔案")
     
     if uploaded_file is not None:
-        # 確保ig_data目錄存在
-        ig_data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "ig_data")
-        os.makedirs(ig_data_path, exist_ok=True)
-        
-        # 儲存上傳的檔案
-        save_path = os.path.join(ig_data_path, uploaded_file.name)
-        with open(save_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        
         if st.button("處理資料", type="primary"):
-            with st.spinner('處理資料中...'):
-                import sys
-                sys.path.append(os.path.dirname(__file__))
-                import setup
-                success, error = setup.process_instagram_zip(save_path)
-                sys.path.remove(os.path.dirname(__file__))
-                
-                if success:
-                    st.success("資料處理完成！")
-                else:
-                    st.error(f"處理失敗：{error}")
+            # 匯入在背景執行，關閉頁面也不會中斷；多個上傳依序處理
+            ingest_jobs.submit(uploaded_file.name, uploaded_file)
+            st.success("已加入匯入佇列")
+    
+    jobs = ingest_jobs.list_jobs()
+    if jobs:
+        st.subheader("📋 匯入工作")
+        for job in jobs:
+            with st.container():
+                show_job(job)
+                st.markdown("---")
+    
+    # 有進行中的工作時定期重新整理顯示進度
+    if any(job["status"] in ingest_jobs.ACTIVE_STATUSES for job in jobs):
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
 
-def display_results(hits):
+def media_thumbnails(media, use_manifest=True):
+    """取得貼文媒體要顯示的縮圖路徑
+    
+    有媒體清單時直接使用匯入時產生的縮圖，不需檢查檔案；舊資料或
+    use_manifest 為 False 時才即時檢查原始檔並產生縮圖。
+    """
+    image_list = []
+    for item in media:
+        manifest = item.get('manifest')
+        if use_manifest and manifest is not None:
+            if manifest.get('valid') and manifest.get('thumbnail'):
+                image_list.append(os.path.join(BASE_DIR, manifest['thumbnail']))
+            continue
+        
+        image_path = item.get('uri', '')
+        if image_path and not image_path.startswith('/'):
+            image_path = os.path.join(BASE_DIR, image_path)
+        # 無法產生縮圖代表檔案不存在或不是可顯示的圖片
+        thumbnail = thumbnails.get_thumbnail(image_path)
+        if thumbnail:
+            image_list.append(thumbnail)
+    return image_list
+
+def display_results(state):
     # 分頁設定
-    items_per_page = 10
-    total_hits = len(hits)
+    items_per_page = search.PAGE_SIZE
+    total_hits = state["total"]
     total_pages = (total_hits + items_per_page - 1) // items_per_page
     
     # 分頁導航
@@ -243,45 +366,91 @@ def display_results(hits):
             st.session_state.current_page += 1
             st.rerun()
 
-    # 計算當前頁的資料範圍
-    start_idx = (st.session_state.current_page - 1) * items_per_page
-    end_idx = min(start_idx + items_per_page, total_hits)
+    try:
+        with RENDER_STEP_SECONDS.time(step="get_page"):
+            hits = backend.get_page(state, st.session_state.current_page)
+    except Exception as e:
+        st.error(f"搜尋時發生錯誤: {e}")
+        return
+
+    # 只對畫面上的貼文取得媒體；展開全文的貼文另外取得內文
+    ids = [result["_id"] for result in hits]
+    expanded = st.session_state.setdefault("expanded_docs", set())
+    fields = ["media", "content"] if expanded.intersection(ids) else ["media"]
+    try:
+        with RENDER_STEP_SECONDS.time(step="fetch_sources"):
+            sources = backend.fetch_sources(ids, fields)
+    except Exception as e:
+        logger.warning(f"取得媒體資料失敗：{e}")
+        sources = {}
 
     # 顯示當前頁的資料
-    for result in hits[start_idx:end_idx]:
+    for result in hits:
         with st.container():
+            doc_id = result["_id"]
             title = result["_source"].get("datetime", "無標題")
-            content = result["_source"].get("content", "無內容")
+            source = sources.get(doc_id, {})
             
             # 讀取圖片
-            image_list = []
-            media = result["_source"].get('media', [])
-            
-            if media:
-                for item in media:
-                    image_path = item.get('uri', '')
-                    if image_path and not image_path.startswith('/'):
-                        image_path = os.path.join('/app', image_path)
-                    if os.path.exists(image_path):
-                        try:
-                            with Image.open(image_path) as img:
-                                img.verify()
-                            image_list.append(image_path)
-                        except Exception as e:
-                            logger.error(f"讀取圖片 {image_path} 時發生錯誤：{e}")
+            media = source.get('media', [])
+            with RENDER_STEP_SECONDS.time(step="thumbnails"):
+                image_list = media_thumbnails(media)
 
             st.subheader(title)
-            st.write(content)
+            if doc_id in expanded and "content" in source:
+                st.write(source["content"])
+            else:
+                fragments = result.get("highlight", {}).get("content", [])
+                snippet = " … ".join(f.replace("\n", " ") for f in fragments) or "無內容"
+                st.markdown(f'<div class="snippet">{snippet}</div>', unsafe_allow_html=True)
+                st.button("顯示全文", key=f"expand_{doc_id}", on_click=expanded.add, args=(doc_id,))
             
             if image_list:
-                st.image(image_list, width=300)
+                try:
+                    with RENDER_STEP_SECONDS.time(step="images"):
+                        st.image(image_list, width=300)
+                except Exception:
+                    # 縮圖可能已被快取清理，改為即時重新產生
+                    image_list = media_thumbnails(media, use_manifest=False)
+                    if image_list:
+                        st.image(image_list, width=300)
             
             st.markdown("---")
 
+def metrics_panel():
+    """側邊欄的效能指標：各步驟延遲、快取命中率與匯入速率（本行程啟動以來）"""
+    snapshot = metrics.snapshot()
+    st.markdown("**延遲（毫秒）**")
+    st.dataframe(
+        pd.DataFrame([{
+            "指標": row["metric"],
+            "標籤": ",".join(f"{k}={v}" for k, v in row["labels"].items()),
+            "次數": row["count"],
+            "平均": round(row["avg"] * 1000, 1),
+            "p95": round(row["p95"] * 1000, 1)
+        } for row in snapshot["latency"]], columns=["指標", "標籤", "次數", "平均", "p95"]),
+        hide_index=True, use_container_width=True
+    )
+    st.markdown("**計數與比率**")
+    st.dataframe(
+        pd.DataFrame([{
+            "指標": row["metric"],
+            "標籤": ",".join(f"{k}={v}" for k, v in row["labels"].items()),
+            "數值": round(row["value"], 3)
+        } for row in snapshot["values"]], columns=["指標", "標籤", "數值"]),
+        hide_index=True, use_container_width=True
+    )
+
 # 根據選擇的頁面顯示內容
-if st.session_state.active_page == "搜尋":
-    search_page()
-elif st.session_state.active_page == "分析":
-    analyze_page()
-else:
-    settings_page()
+with PAGE_RENDER_SECONDS.time(page=st.session_state.active_page):
+    if st.session_state.active_page == "搜尋":
+        search_page()
+    elif st.session_state.active_page == "分析":
+        analyze_page()
+    else:
+        settings_page()
+
+# 放在最後，才會包含本次繪製的耗時
+with st.sidebar:
+    if st.checkbox("📈 顯示效能指標", value=metrics.METRICS_PANEL):
+        metrics_panel()
@@ -0,0 +1,214 @@
+import json
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from elasticsearch import ApiError, ConnectionError, ConnectionTimeout
+
+logger = logging.getLogger(__name__)
+
+# 預設批次設定
+DEFAULT_CHUNK_SIZE = 500                      # 每批最多文件數
+DEFAULT_MAX_CHUNK_BYTES = 10 * 1024 * 1024    # 每批最多位元組數（10MB）
+DEFAULT_WORKERS = 1                           # 平行送出批次的執行緒數
+DEFAULT_MAX_RETRIES = 3                       # 單筆文件最多重試次數
+DEFAULT_INITIAL_BACKOFF = 1.0                 # 第一次重試等待秒數（之後倍增）
+DEFAULT_MAX_BACKOFF = 30.0                    # 重試等待上限
+
+# 可重試的HTTP狀態碼（過載或暫時性伺服器錯誤）
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+def _serialize_action(action: Dict) -> bytes:
+    """將一筆動作轉為 _bulk 所需的 NDJSON 內容
+
+    Args:
+        action: 動作字典，支援 `_op_type`（index/create/update/delete）、
+            `_index`、`_id` 及 `_source`（文件內容或update主體）
+
+    Returns:
+        bytes: 以換行結尾的NDJSON片段
+    """
+    op_type = action.get("_op_type", "index")
+    meta = {"_index": action["_index"]}
+    if action.get("_id") is not None:
+        meta["_id"] = action["_id"]
+
+    lines = [json.dumps({op_type: meta}, ensure_ascii=False)]
+    if op_type != "delete":
+        lines.append(json.dumps(action["_source"], ensure_ascii=False))
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def chunk_actions(actions: Iterable[Dict],
+                  chunk_size: int = DEFAULT_CHUNK_SIZE,
+                  max_chunk_bytes: int = DEFAULT_MAX_CHUNK_BYTES) -> Iterator[List[Tuple[Dict, bytes]]]:
+    """依文件數與位元組數將動作切成批次
+
+    Args:
+        actions: 動作來源（可為產生器，不會一次載入全部）
+        chunk_size: 每批最多文件數
+        max_chunk_bytes: 每批最多位元組數
+
+    Yields:
+        List[Tuple[Dict, bytes]]: (原始動作, 序列化內容) 的批次
+    """
+    chunk = []
+    chunk_bytes = 0
+    for action in actions:
+        data = _serialize_action(action)
+        if chunk and (len(chunk) >= chunk_size or chunk_bytes + len(data) > max_chunk_bytes):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append((action, data))
+        chunk_bytes += len(data)
+    if chunk:
+        yield chunk
+
+
+class BulkReport:
+    """批次寫入統計（多執行緒安全）"""
+
+    def __init__(self):
+        self.indexed = 0
+        self.failed = 0
+        self.retried = 0
+        self.errors: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, indexed: int = 0, failed: int = 0, retried: int = 0, errors: List[Dict] = None):
+        with self._lock:
+            self.indexed += indexed
+            self.failed += failed
+            self.retried += retried
+            if errors:
+                # 只保留前幾筆錯誤，避免大量失敗時佔用記憶體
+                self.errors.extend(errors[:max(0, 10 - len(self.errors))])
+
+    def as_dict(self) -> Dict:
+        return {
+            "indexed": self.indexed,
+            "failed": self.failed,
+            "retried": self.retried,
+            "errors": list(self.errors),
+        }
+
+
+def _backoff(attempt: int, initial_backoff: float, max_backoff: float) -> float:
+    """計算第 attempt 次重試的等待秒數（指數退避加隨機抖動）"""
+    delay = min(max_backoff, initial_backoff * (2 ** attempt))
+    return delay * (0.5 + random.random() / 2)
+
+
+def _send_chunk(es, chunk: List[Tuple[Dict, bytes]], report: BulkReport,
+                max_retries: int, initial_backoff: float, max_backoff: float,
+                refresh=None):
+    """送出單一批次，對 429/5xx 的個別文件以退避重試
+
+    Args:
+        es: Elasticsearch客戶端
+        chunk: 批次內容
+        report: 統計物件
+        max_retries: 單筆文件最多重試次數
+        initial_backoff: 初始等待秒數
+        max_backoff: 等待上限
+        refresh: 傳給 _bulk 的 refresh 參數
+    """
+    pending = chunk
+    attempt = 0
+    while pending:
+        body = b"".join(data for _, data in pending)
+        retry_items = []
+        try:
+            kwargs = {"operations": body}
+            if refresh is not None:
+                kwargs["refresh"] = refresh
+            response = es.bulk(**kwargs)
+        except (ConnectionError, ConnectionTimeout) as e:
+            retry_items = pending
+            last_error = {"status": None, "error": str(e)}
+        except ApiError as e:
+            if e.meta.status not in RETRYABLE_STATUS:
+                report.add(failed=len(pending), errors=[{"status": e.meta.status, "error": str(e)}])
+                return
+            retry_items = pending
+            last_error = {"status": e.meta.status, "error": str(e)}
+        else:
+            indexed = 0
+            errors = []
+            for (action, data), item in zip(pending, response["items"]):
+                result = next(iter(item.values()))
+                status = result.get("status", 500)
+                if status < 300 or (status == 404 and action.get("_op_type") == "delete"):
+                    indexed += 1
+                elif status in RETRYABLE_STATUS:
+                    retry_items.append((action, data))
+                    last_error = {"status": status, "error": result.get("error")}
+                else:
+                    errors.append({"_id": result.get("_id"), "status": status, "error": result.get("error")})
+            report.add(indexed=indexed, failed=len(errors), errors=errors)
+
+        if not retry_items:
+            return
+        if attempt >= max_retries:
+            report.add(failed=len(retry_items), errors=[last_error])
+            return
+
+        delay = _backoff(attempt, initial_backoff, max_backoff)
+        logger.warning(f"⚠️ {len(retry_items)} 筆文件暫時寫入失敗（{last_error['status']}），{delay:.1f} 秒後重試")
+        report.add(retried=len(retry_items))
+        time.sleep(delay)
+        pending = retry_items
+        attempt += 1
+
+
+def bulk_write(es, actions: Iterable[Dict],
+               chunk_size: int = DEFAULT_CHUNK_SIZE,
+               max_chunk_bytes: int = DEFAULT_MAX_CHUNK_BYTES,
+               workers: int = DEFAULT_WORKERS,
+               max_retries: int = DEFAULT_MAX_RETRIES,
+               initial_backoff: float = DEFAULT_INITIAL_BACKOFF,
+               max_backoff: float = DEFAULT_MAX_BACKOFF,
+               refresh=None) -> Dict:
+    """以 _bulk API 批次寫入文件
+
+    Args:
+        es: Elasticsearch客戶端
+        actions: 動作來源，可為產生器
+        chunk_size: 每批最多文件數
+        max_chunk_bytes: 每批最多位元組數
+        workers: 平行送出批次的執行緒數，1 表示依序送出
+        max_retries: 對 429/5xx 的單筆文件最多重試次數
+        initial_backoff: 初始重試等待秒數
+        max_backoff: 重試等待上限
+        refresh: 傳給 _bulk 的 refresh 參數
+
+    Returns:
+        Dict: 統計結果 {"indexed", "failed", "retried", "errors"}
+    """
+    report = BulkReport()
+    chunks = chunk_actions(actions, chunk_size, max_chunk_bytes)
+    send_args = (report, max_retries, initial_backoff, max_backoff, refresh)
+
+    if workers <= 1:
+        for chunk in chunks:
+            _send_chunk(es, chunk, *send_args)
+        return report.as_dict()
+
+    # 限制同時在途的批次數，讓記憶體用量不隨資料量成長
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = set()
+        for chunk in chunks:
+            if len(in_flight) >= workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            in_flight.add(executor.submit(_send_chunk, es, chunk, *send_args))
+        for future in in_flight:
+            future.result()
+
+    return report.as_dict()
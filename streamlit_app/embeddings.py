@@ -0,0 +1,260 @@
+import os
+import math
+import time
+import sqlite3
+import hashlib
+import logging
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+import local_index
+import metrics
+import query_cache
+
+logger = logging.getLogger(__name__)
+
+# 語意搜尋設定（可由環境變數調整）
+SEMANTIC_SEARCH = os.getenv("SEMANTIC_SEARCH", "false").lower() == "true"  # 匯入時是否產生向量
+# "hashing"（不需額外套件的特徵雜湊向量），或 sentence-transformers 模型名稱／本機路徑
+# （需另外安裝 sentence-transformers 並事先下載模型，執行時不連網）
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "hashing")
+HASHING_DIMS = int(os.getenv("EMBEDDING_HASHING_DIMS", "256"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+BASE_DIR = os.getenv("APP_BASE_DIR", "/app")
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", os.path.join(BASE_DIR, "ig_data", ".embeddings.sqlite"))
+CACHE_QUERY_CHUNK = 500  # SQLite 單次查詢的參數上限內
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))  # 行程內保留幾筆搜尋詞向量
+VECTOR_FIELD = "content_vector"
+
+EMBEDDING_BATCH_SECONDS = metrics.histogram("embedding_batch_seconds", "每批文字向量化耗時（秒）")
+EMBEDDING_TEXTS = metrics.counter("embedding_texts_total", "向量化的文字數（cached：沿用快取、computed：重新計算）")
+
+
+class HashingEmbedder:
+    """特徵雜湊向量：與本機索引相同的斷詞（中文雙字詞、英文單字），不需模型檔
+
+    只能找到用字相近的貼文；要比對同義詞（例如「拉麵」與 ramen）需使用 sentence-transformers 模型。
+    """
+
+    def __init__(self, dims: int = HASHING_DIMS):
+        self.dims = dims
+        self.name = f"hashing-{dims}"
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dims, dtype=np.float32)
+        for token, tf in Counter(local_index.tokenize(text)).items():
+            # 使用固定的雜湊函數，不同行程與每次執行的結果相同
+            h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[h % self.dims] += (1.0 + math.log(tf)) * (1.0 if h >> 63 else -1.0)
+        return vector
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.stack([self._vector(text) for text in texts]) if texts else np.zeros((0, self.dims), np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+
+class SentenceTransformerEmbedder:
+    """本機的 sentence-transformers 模型（只從本機快取或路徑載入，不連網）"""
+
+    def __init__(self, model: str):
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model, device="cpu")
+        self.dims = self.model.get_sentence_embedding_dimension()
+        self.name = f"st:{model}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False).astype(np.float32)
+
+
+_embedders: Dict[str, object] = {}
+
+
+def model_name(model: str = EMBEDDING_MODEL) -> str:
+    """設定值對應的模型名稱（記錄在索引 _meta，查詢時需使用相同模型）"""
+    return f"hashing-{HASHING_DIMS}" if model == "hashing" else model if ":" in model else f"st:{model}"
+
+
+def get_embedder(name: Optional[str] = None):
+    """依模型名稱取得向量模型，每個行程只載入一次
+
+    Args:
+        name: model_name() 格式的名稱，例如 "hashing-256" 或 "st:<模型>"，預設為目前設定
+
+    Returns:
+        具有 name、dims 與 embed(texts) 的向量模型
+    """
+    name = name or model_name()
+    if name not in _embedders:
+        if name.startswith("hashing-"):
+            _embedders[name] = HashingEmbedder(int(name.split("-", 1)[1]))
+        elif name.startswith("st:"):
+            _embedders[name] = SentenceTransformerEmbedder(name[3:])
+            logger.info(f"✅ 已載入向量模型 {name}（{_embedders[name].dims} 維）")
+        else:
+            raise ValueError(f"不支援的向量模型：{name}")
+    return _embedders[name]
+
+
+def vector_mapping(dims: int) -> Dict:
+    """dense_vector 欄位，以HNSW建立近似最近鄰索引；向量已正規化，使用 dot_product"""
+    return {
+        "type": "dense_vector",
+        "dims": dims,
+        "index": True,
+        "similarity": "dot_product",
+        "index_options": {"type": "hnsw", "m": 16, "ef_construction": 100}
+    }
+
+
+def text_key(model: str, text: str) -> str:
+    return hashlib.sha1(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """以文字雜湊為鍵的向量快取（SQLite），重新匯入時未變更的內文不必重算"""
+
+    def __init__(self, path: str = EMBEDDING_CACHE):
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        with self._connect() as db:
+            for start in range(0, len(keys), CACHE_QUERY_CHUNK):
+                chunk = keys[start:start + CACHE_QUERY_CHUNK]
+                rows = db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                )
+                found.update((key, np.frombuffer(blob, dtype=np.float32)) for key, blob in rows)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]):
+        with self._connect() as db:
+            db.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                           ((key, vector.astype(np.float32).tobytes()) for key, vector in items.items()))
+
+
+_worker_model: Optional[str] = None
+
+
+def _init_worker(model: str):
+    global _worker_model
+    _worker_model = model
+    get_embedder(model)
+
+
+def _embed_batch(texts: List[str]) -> np.ndarray:
+    return get_embedder(_worker_model).embed(texts)
+
+
+def embed_texts(texts: List[str], model: Optional[str] = None, cache: Optional[EmbeddingCache] = None,
+                pool: Optional[ProcessPoolExecutor] = None) -> np.ndarray:
+    """批次產生向量：先查快取，相同文字只算一次，其餘分批交給行程池（未提供時在本行程計算）
+
+    Args:
+        texts: 要向量化的文字
+        model: 模型名稱，預設為目前設定
+        cache: 向量快取
+        pool: 以 _init_worker 初始化的行程池
+
+    Returns:
+        np.ndarray: (len(texts), dims) 的正規化向量
+    """
+    model = model or model_name()
+    keys = [text_key(model, text) for text in texts]
+    vectors = cache.get_many(list(set(keys))) if cache else {}
+    missing = list({key: text for key, text in zip(keys, texts) if key not in vectors}.items())
+    EMBEDDING_TEXTS.inc(len(texts) - len(missing), result="cached")
+    EMBEDDING_TEXTS.inc(len(missing), result="computed")
+
+    if missing:
+        batches = [missing[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(missing), EMBEDDING_BATCH_SIZE)]
+        start = time.perf_counter()
+        if pool is not None and len(batches) > 1:
+            results = pool.map(_embed_batch, [[text for _, text in batch] for batch in batches])
+        else:
+            embedder = get_embedder(model)
+            results = (embedder.embed([text for _, text in batch]) for batch in batches)
+        computed = {}
+        for batch, batch_vectors in zip(batches, results):
+            computed.update(zip((key for key, _ in batch), batch_vectors))
+        EMBEDDING_BATCH_SECONDS.observe((time.perf_counter() - start) / len(batches))
+        if cache:
+            cache.put_many(computed)
+        vectors.update(computed)
+
+    if not keys:
+        return np.zeros((0, get_embedder(model).dims), dtype=np.float32)
+    return np.stack([vectors[key] for key in keys])
+
+
+# 搜尋詞的向量只放在行程內的LRU快取，不寫入文件的向量快取（SQLite）
+_query_vectors = query_cache.QueryCache(max_entries=QUERY_EMBEDDING_CACHE_SIZE, ttl=float("inf"))
+query_cache.register_metrics("query_embedding", _query_vectors)
+
+
+def embed_query(text: str, model: Optional[str] = None) -> List[float]:
+    """搜尋時將關鍵字轉為向量（在本行程計算，結果存於行程內的LRU快取）"""
+    model = model or model_name()
+    return _query_vectors.get_or_compute(text_key(model, text), lambda: embed_texts([text], model)[0].tolist())
+
+
+def attach_vectors(actions: Iterable[Dict], field: str, model: str,
+                   workers: int = EMBEDDING_WORKERS) -> Iterator[Dict]:
+    """為寫入動作中的文件加上內文向量，逐段處理不會一次載入全部資料
+
+    Args:
+        actions: bulk_write 的動作（delete 動作原樣傳遞）
+        field: 向量欄位名稱
+        model: 模型名稱（與索引 _meta 記錄的相同）
+        workers: 行程數，1 表示在本行程計算
+
+    Yields:
+        Dict: 已加上向量的動作
+    """
+    cache = EmbeddingCache()
+    chunk_size = EMBEDDING_BATCH_SIZE * max(workers, 1) * 4
+    pool = None
+    if workers > 1:
+        # 匯入在背景執行緒中進行，以 spawn 建立子行程，避免 fork 複製其他執行緒持有的鎖
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(model,))
+    try:
+        chunk: List[Dict] = []
+        for action in actions:
+            chunk.append(action)
+            if len(chunk) >= chunk_size:
+                yield from _attach_chunk(chunk, field, model, cache, pool)
+                chunk = []
+        yield from _attach_chunk(chunk, field, model, cache, pool)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+
+def _attach_chunk(chunk: List[Dict], field: str, model: str, cache: EmbeddingCache,
+                  pool: Optional[ProcessPoolExecutor]) -> List[Dict]:
+    docs = [action["_source"] for action in chunk if action.get("_op_type", "index") != "delete"]
+    if docs:
+        vectors = embed_texts([doc.get("content", "") for doc in docs], model, cache, pool)
+        for doc, vector in zip(docs, vectors):
+            # 沒有內文（零向量）時不寫入，dense_vector 不接受長度為0的向量
+            if vector.any():
+                doc[field] = vector.tolist()
+    return chunk
@@ -0,0 +1,131 @@
+import os
+import time
+import logging
+import threading
+from typing import Dict, Optional
+
+from elasticsearch import ApiError, Elasticsearch
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 連線設定（可由環境變數調整）
+ES_HOST = os.getenv("ES_HOST", "http://elasticsearch:9200")
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "30"))      # 單一請求逾時秒數
+ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))                 # 連線錯誤或逾時的重試次數
+ES_CONNECTIONS_PER_NODE = int(os.getenv("ES_CONNECTIONS_PER_NODE", "10"))  # 每個節點的連線池大小
+HEALTH_CHECK_INTERVAL = float(os.getenv("ES_HEALTH_CHECK_INTERVAL", "10"))  # 背景健康檢查間隔秒數
+
+ES_REQUEST_SECONDS = metrics.histogram("es_request_seconds", "Elasticsearch 請求延遲（秒）")
+ES_RESPONSE_BYTES = metrics.counter("es_response_bytes_total", "Elasticsearch 回應大小（位元組）")
+ES_ERRORS = metrics.counter("es_errors_total", "Elasticsearch 請求失敗次數")
+
+
+def endpoint_name(method: str, path: str) -> str:
+    """將請求路徑轉為不含索引名稱與文件ID的端點名稱，例如 /ig_data/_search → _search"""
+    parts = [part for part in path.split("?")[0].split("/") if part]
+    for part in parts:
+        if part.startswith("_"):
+            return part
+    return "index" if parts else "info"
+
+
+class InstrumentedElasticsearch(Elasticsearch):
+    """記錄每個請求延遲、回應大小與錯誤的Elasticsearch客戶端
+
+    所有API（包含 indices 等子客戶端與 options() 產生的客戶端）都經過 perform_request。
+    """
+
+    def perform_request(self, method, path, *, params=None, headers=None, body=None):
+        endpoint = endpoint_name(method, path)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = super().perform_request(method, path, params=params, headers=headers, body=body)
+            status = str(response.meta.status)
+            length = response.meta.headers.get("content-length")
+            if length:
+                ES_RESPONSE_BYTES.inc(int(length), endpoint=endpoint)
+            return response
+        except ApiError as e:
+            status = str(e.meta.status)
+            raise
+        finally:
+            ES_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=method)
+            # HEAD 回應 404 是 exists 類API的正常結果
+            if not status.startswith("2") and not (method == "HEAD" and status == "404"):
+                ES_ERRORS.inc(endpoint=endpoint, status=status)
+
+
+_client: Optional[Elasticsearch] = None
+_client_lock = threading.Lock()
+
+_health = {"ok": None, "checked_at": None, "error": None}
+_health_lock = threading.Lock()
+_health_thread: Optional[threading.Thread] = None
+
+
+def get_client() -> Elasticsearch:
+    """取得行程內共用的Elasticsearch客戶端
+
+    客戶端只建立一次，底層連線池會保持長連線（keep-alive）並可由多個執行緒共用，
+    Streamlit 每次重新執行腳本時不會重新建立連線。
+
+    Returns:
+        Elasticsearch: 共用客戶端
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = InstrumentedElasticsearch(
+                    ES_HOST,
+                    request_timeout=ES_REQUEST_TIMEOUT,
+                    max_retries=ES_MAX_RETRIES,
+                    retry_on_timeout=True,
+                    connections_per_node=ES_CONNECTIONS_PER_NODE
+                )
+                logger.info(f"✅ 已建立共用 Elasticsearch 客戶端：{ES_HOST}")
+    return _client
+
+
+def check_health() -> bool:
+    """立即對Elasticsearch執行一次ping並更新健康狀態"""
+    try:
+        ok = bool(get_client().ping())
+        error = None if ok else "ping 失敗"
+    except Exception as e:
+        ok, error = False, str(e)
+
+    with _health_lock:
+        previous = _health["ok"]
+        _health.update(ok=ok, checked_at=time.time(), error=error)
+    if ok != previous:
+        if ok:
+            logger.info("✅ 成功連接到 Elasticsearch！")
+        else:
+            logger.warning(f"🚨 無法連接到 Elasticsearch：{error}")
+    return ok
+
+
+def _health_loop():
+    while True:
+        check_health()
+        time.sleep(HEALTH_CHECK_INTERVAL)
+
+
+def start_health_check():
+    """啟動背景健康檢查執行緒（重複呼叫不會建立多個執行緒）"""
+    global _health_thread
+    with _health_lock:
+        if _health_thread is not None and _health_thread.is_alive():
+            return
+        _health_thread = threading.Thread(target=_health_loop, name="es-health-check", daemon=True)
+        _health_thread.start()
+
+
+def get_health() -> Dict:
+    """取得最近一次健康檢查結果，ok 為 None 表示尚未檢查完成"""
+    with _health_lock:
+        return dict(_health)
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import uuid
+import queue
+import shutil
+import logging
+import datetime
+import threading
+from typing import BinaryIO, Dict, List, Optional
+
+import setup
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.getenv("APP_BASE_DIR", "/app")
+# 工作紀錄與上傳檔存放位置（可由環境變數調整）
+JOBS_DIR = os.getenv("INGEST_JOBS_DIR", os.path.join(BASE_DIR, "ig_data", ".jobs"))
+UPLOAD_DIR = os.getenv("INGEST_UPLOAD_DIR", os.path.join(BASE_DIR, "ig_data", "uploads"))
+MAX_JOBS_KEPT = int(os.getenv("INGEST_MAX_JOBS_KEPT", "20"))  # 保留幾筆已結束的工作紀錄
+SAVE_INTERVAL = 0.5  # 進度寫入工作紀錄的最短間隔秒數
+
+STAGES = ["extract", "parse", "copy", "media", "index", "local", "cleanup"]
+ACTIVE_STATUSES = ("queued", "running")
+
+_queue: "queue.Queue[str]" = queue.Queue()
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
+
+def _now() -> str:
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+
+def save_job(job: Dict):
+    """以暫存檔改名的方式寫入工作紀錄，讀取端不會讀到寫到一半的內容"""
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    path = _job_path(job["id"])
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(job, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_job(job_id: str) -> Optional[Dict]:
+    try:
+        with open(_job_path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def list_jobs(limit: int = 10) -> List[Dict]:
+    """取得最近的工作紀錄（新的在前）"""
+    if not os.path.isdir(JOBS_DIR):
+        return []
+    job_ids = sorted((name[:-5] for name in os.listdir(JOBS_DIR) if name.endswith(".json")), reverse=True)
+    jobs = []
+    for job_id in job_ids[:limit]:
+        job = load_job(job_id)
+        if job:
+            jobs.append(job)
+    return jobs
+
+
+def _remove_upload(job: Dict):
+    """刪除工作的上傳檔（已刪除時忽略）"""
+    zip_path = job.get("zip_path")
+    if zip_path and os.path.exists(zip_path):
+        try:
+            os.remove(zip_path)
+            logger.info(f"🧹 已刪除上傳檔：{zip_path}")
+        except OSError as e:
+            logger.warning(f"無法刪除上傳檔 {zip_path}：{e}")
+
+
+def _prune_jobs():
+    """刪除已結束工作留下的上傳檔，以及超出保留數量的工作紀錄"""
+    finished = [job for job in list_jobs(limit=1000) if job["status"] not in ACTIVE_STATUSES]
+    for job in finished:
+        _remove_upload(job)
+    for job in finished[MAX_JOBS_KEPT:]:
+        try:
+            os.remove(_job_path(job["id"]))
+        except OSError:
+            pass
+
+
+class JobProgress(setup.IngestProgress):
+    """將各階段進度與速率記錄到工作紀錄"""
+
+    def __init__(self, job: Dict):
+        self.job = job
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+        self._started: Dict[str, float] = {}
+
+    def _save(self, force: bool = False):
+        now = time.monotonic()
+        if force or now - self._saved_at >= SAVE_INTERVAL:
+            self._saved_at = now
+            save_job(self.job)
+
+    def _update_rates(self, stage: str):
+        info = self.job["stages"][stage]
+        elapsed = time.monotonic() - self._started[stage]
+        info["seconds"] = round(elapsed, 2)
+        info["items_per_s"] = info["items"] / elapsed if elapsed > 0 else 0.0
+        info["bytes_per_s"] = info["bytes"] / elapsed if elapsed > 0 else 0.0
+
+    def start(self, stage: str, total: Optional[int] = None):
+        with self._lock:
+            self._started[stage] = time.monotonic()
+            self.job["stage"] = stage
+            self.job["stages"][stage] = {
+                "status": "running", "items": 0, "total": total, "bytes": 0,
+                "seconds": 0.0, "items_per_s": 0.0, "bytes_per_s": 0.0
+            }
+            self._save(force=True)
+
+    def advance(self, stage: str, items: int = 1, nbytes: int = 0):
+        with self._lock:
+            info = self.job["stages"].get(stage)
+            if info is None:
+                return
+            info["items"] += items
+            info["bytes"] += nbytes
+            self._update_rates(stage)
+            self._save()
+
+    def finish(self, stage: str):
+        with self._lock:
+            self._update_rates(stage)
+            self.job["stages"][stage]["status"] = "done"
+            self._save(force=True)
+
+
+def _run(job_id: str):
+    """執行一個匯入工作，結果寫回工作紀錄"""
+    job = load_job(job_id)
+    if job is None or job["status"] != "queued":
+        return
+
+    job.update(status="running", started=_now())
+    save_job(job)
+    logger.info(f"🚚 開始匯入工作 {job_id}：{job['filename']}")
+
+    progress = JobProgress(job)
+    try:
+        success, error = setup.process_instagram_zip(job["zip_path"], progress=progress)
+    except Exception as e:
+        success, error = False, str(e)
+    finally:
+        # 成功或失敗都不再需要上傳檔，要重新匯入需再次上傳
+        _remove_upload(job)
+
+    job.update(status="done" if success else "failed", error=error, finished=_now(), stage=None)
+    save_job(job)
+    logger.info(f"{'✅' if success else '❌'} 匯入工作 {job_id} 結束")
+    _prune_jobs()
+
+
+def _worker_loop():
+    # 一次只執行一個工作，多個上傳依序排隊，不會同時使用暫存目錄與索引
+    while True:
+        job_id = _queue.get()
+        try:
+            _run(job_id)
+        except Exception as e:
+            logger.error(f"匯入工作 {job_id} 發生未預期錯誤: {e}")
+        finally:
+            _queue.task_done()
+
+
+def _recover_jobs():
+    """處理上次行程結束時留下的工作：執行中的標記為中斷，排隊中的重新排入"""
+    for job in reversed(list_jobs(limit=1000)):
+        if job["status"] == "running":
+            job.update(status="failed", error="工作執行中斷（服務重新啟動）", finished=_now(), stage=None)
+            save_job(job)
+            _remove_upload(job)
+        elif job["status"] == "queued":
+            _queue.put(job["id"])
+
+
+def start_worker():
+    """啟動背景匯入執行緒（每個行程只啟動一次）"""
+    global _worker
+    with _worker_lock:
+        if _worker is not None and _worker.is_alive():
+            return
+        _recover_jobs()
+        _worker = threading.Thread(target=_worker_loop, name="ingest-worker", daemon=True)
+        _worker.start()
+
+
+def submit(filename: str, fileobj: BinaryIO) -> str:
+    """儲存上傳的ZIP檔並排入匯入佇列
+
+    Args:
+        filename: 原始檔名
+        fileobj: 上傳檔內容
+
+    Returns:
+        str: 工作ID
+    """
+    # 先啟動背景執行緒（會重新排入先前留下的工作），再排入新工作
+    start_worker()
+    job_id = f"{datetime.datetime.now():%Y%m%d%H%M%S%f}-{uuid.uuid4().hex[:6]}"
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    zip_path = os.path.join(UPLOAD_DIR, f"{job_id}_{os.path.basename(filename)}")
+    with open(zip_path, "wb") as f:
+        shutil.copyfileobj(fileobj, f, 1024 * 1024)
+
+    job = {
+        "id": job_id,
+        "filename": filename,
+        "zip_path": zip_path,
+        "size": os.path.getsize(zip_path),
+        "status": "queued",
+        "created": _now(),
+        "started": None,
+        "finished": None,
+        "stage": None,
+        "stages": {},
+        "error": None
+    }
+    save_job(job)
+    _queue.put(job_id)
+    logger.info(f"📥 匯入工作 {job_id} 已排入佇列：{filename}")
+    return job_id
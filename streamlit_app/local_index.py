@@ -0,0 +1,508 @@
+import os
+import re
+import json
+import mmap
+import html
+import math
+import heapq
+import bisect
+import shutil
+import logging
+import datetime
+import itertools
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import analytics
+import media_copy
+import suggest
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.getenv("APP_BASE_DIR", "/app")
+# 不需Elasticsearch的本機索引，放在資料目錄下，匯入時重建
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(BASE_DIR, "ig_data", "local_index"))
+FORMAT_VERSION = 3
+SORT_RUN_SIZE = int(os.getenv("LOCAL_INDEX_SORT_RUN", "10000"))  # 建立索引時每段排序的文件數
+POSTINGS_RUN_SIZE = int(os.getenv("LOCAL_INDEX_POSTINGS_RUN", "1000000"))  # 建立索引時在記憶體累積的postings筆數
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_TF = np.iinfo(np.uint16).max
+
+# 與 Elasticsearch cjk_bigram 相同的範圍：平假名、片假名、漢字、韓文
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af"
+_TOKEN_PATTERN = re.compile(f"[{_CJK}]+|[^\\W{_CJK}]+")
+_CJK_PATTERN = re.compile(f"[{_CJK}]")
+
+# 只保留顯示與篩選需要的欄位，completion 輸入另外存成建議詞清單
+STORED_FIELDS = ["content", "datetime", "media", "hashtags", "places", "dishes", "weekday", "hour", "doc_id"]
+
+
+def tokenize(text: str) -> List[str]:
+    """與 content_cjk_bigram 分析器相同的切詞：中日韓文字切成相鄰兩字，其餘以單字切分
+
+    Args:
+        text: 原始文字
+
+    Returns:
+        List[str]: 詞（依出現順序，可能重複）
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(text):
+        if _CJK_PATTERN.match(run):
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def to_epoch(value: str) -> int:
+    """將ISO時間轉為秒數；沒有時區的時間視為UTC，與Elasticsearch的解讀一致"""
+    dt = datetime.datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=datetime.timezone.utc)
+    return int(dt.timestamp())
+
+
+def _write_array(index_dir: str, name: str, array: np.ndarray):
+    np.save(os.path.join(index_dir, f"{name}.npy"), array)
+
+
+def _write_json(index_dir: str, name: str, data):
+    with open(os.path.join(index_dir, name), "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def _sort_key(doc: Dict) -> Tuple[str, str]:
+    return doc["datetime"], doc["doc_id"]
+
+
+def _write_sorted_runs(docs: Iterable[Dict], directory: str) -> Tuple[List[str], int]:
+    """將文件每 SORT_RUN_SIZE 篇排序一次，各自寫成暫存檔（每行一篇JSON）
+
+    Returns:
+        Tuple[List[str], int]: (暫存檔路徑, 文件數)
+    """
+    paths: List[str] = []
+    run: List[Dict] = []
+    count = 0
+
+    def flush():
+        run.sort(key=_sort_key, reverse=True)
+        path = os.path.join(directory, f"run_{len(paths):05d}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for doc in run:
+                f.write(json.dumps(doc, ensure_ascii=False) + "\n")
+        paths.append(path)
+        run.clear()
+
+    for doc in docs:
+        run.append(doc)
+        count += 1
+        if len(run) >= SORT_RUN_SIZE:
+            flush()
+    if run:
+        flush()
+    return paths, count
+
+
+def _merge_sorted_runs(paths: List[str]) -> Iterator[Dict]:
+    """逐行合併已排序的暫存檔，依（datetime, doc_id）遞減產生文件"""
+    files = [open(path, "r", encoding="utf-8") for path in paths]
+    try:
+        runs = [(json.loads(line) for line in f) for f in files]
+        yield from heapq.merge(*runs, key=_sort_key, reverse=True)
+    finally:
+        for f in files:
+            f.close()
+
+
+class _PostingsSpill:
+    """建立索引時分段累積postings：每 POSTINGS_RUN_SIZE 筆依詞排序後寫入暫存檔，
+    最後依詞合併各段，直接寫入記憶體映射的 .npy 檔"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.paths: List[str] = []
+        self.total = 0
+        self._buffer: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        self._buffered = 0
+
+    def add(self, term: str, ordinal: int, tf: int):
+        self._buffer[term].append((ordinal, min(tf, MAX_TF)))
+        self._buffered += 1
+        self.total += 1
+        if self._buffered >= POSTINGS_RUN_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        path = os.path.join(self.directory, f"postings_{len(self.paths):05d}.jsonl")
+        with open(path, "w", encoding="utf-8") as f:
+            for term in sorted(self._buffer):
+                f.write(json.dumps([term, self._buffer[term]], ensure_ascii=False) + "\n")
+        self.paths.append(path)
+        self._buffer.clear()
+        self._buffered = 0
+
+    def write(self, index_dir: str) -> Dict[str, List[int]]:
+        """合併各段寫入 postings_docs.npy 與 postings_tf.npy
+
+        各段涵蓋的文件編號依序遞增，同一個詞依段的順序合併後，詞內的文件編號仍是遞增的。
+
+        Returns:
+            Dict[str, List[int]]: 詞典 {詞: [postings起點, 文件數]}
+        """
+        self._flush()
+        if not self.total:
+            _write_array(index_dir, "postings_docs", np.zeros(0, dtype=np.uint32))
+            _write_array(index_dir, "postings_tf", np.zeros(0, dtype=np.uint16))
+            return {}
+
+        def open_array(name, dtype):
+            return np.lib.format.open_memmap(os.path.join(index_dir, f"{name}.npy"), mode="w+",
+                                             dtype=dtype, shape=(self.total,))
+
+        postings_docs = open_array("postings_docs", np.uint32)
+        postings_tf = open_array("postings_tf", np.uint16)
+        lexicon = {}
+        position = 0
+        files = [open(path, "r", encoding="utf-8") for path in self.paths]
+        try:
+            runs = [(json.loads(line) for line in f) for f in files]
+            merged = heapq.merge(*runs, key=lambda entry: entry[0])
+            for term, group in itertools.groupby(merged, key=lambda entry: entry[0]):
+                start = position
+                for _, entries in group:
+                    block = np.asarray(entries, dtype=np.int64)
+                    postings_docs[position:position + len(block)] = block[:, 0]
+                    postings_tf[position:position + len(block)] = block[:, 1]
+                    position += len(block)
+                lexicon[term] = [start, position - start]
+            postings_docs.flush()
+            postings_tf.flush()
+        finally:
+            for f in files:
+                f.close()
+            del postings_docs, postings_tf
+        return lexicon
+
+
+def build(docs: Iterable[Dict], index_dir: str = LOCAL_INDEX_DIR, version: Optional[str] = None) -> Dict:
+    """由索引文件建立本機倒排索引
+
+    文件依（datetime, doc_id）遞減排序後編號，與Elasticsearch端的排序相同，
+    日期欄位因此是排序好的，日期範圍篩選只需二分搜尋。排序以外部合併排序進行：
+    每 SORT_RUN_SIZE 篇排序後寫入暫存檔，再逐行合併，不會一次載入全部文件；
+    postings同樣分段寫入暫存檔，最後合併寫入記憶體映射的檔案。
+
+    檔案內容：
+        meta.json         文件數、平均長度等資訊
+        lexicon.json      {詞: [postings起點, 文件數]}
+        postings_docs.npy 文件編號（uint32，依詞排列、詞內遞增）
+        postings_tf.npy   詞頻（uint16）
+        doc_lengths.npy   文件長度（詞數，BM25使用）
+        date_keys.npy     負的發文時間秒數（遞增，供 searchsorted 使用）
+        doc_ids.npy       文件ID
+        store.bin / store_offsets.npy  文件內容（JSON）
+        suggestions.json  建議詞 [正規化, 原文, 權重]，依正規化排序
+        analytics.json    與 analytics.summarize 相同格式的統計
+
+    Args:
+        docs: 索引文件（setup.build_document 的結果加上 doc_id），可為產生器
+        index_dir: 索引目錄，建立完成後以改名整批替換
+        version: 對應的索引版本
+
+    Returns:
+        Dict: {"docs", "terms", "postings", "bytes"}
+    """
+    staging = f"{index_dir}.build"
+    shutil.rmtree(staging, ignore_errors=True)
+    runs_dir = os.path.join(staging, "runs")
+    os.makedirs(runs_dir)
+    run_paths, count = _write_sorted_runs(docs, runs_dir)
+
+    postings = _PostingsSpill(runs_dir)
+    lengths = np.zeros(count, dtype=np.uint32)
+    doc_ids = np.zeros(count, dtype="S40")
+    date_keys = np.zeros(count, dtype=np.int64)
+    offsets = np.zeros(count + 1, dtype=np.uint64)
+    suggestions: Dict[str, List] = {}
+    months: Dict[str, Dict] = {}
+    term_counts = {field: Counter() for field in analytics.TERM_FIELDS}
+
+    with open(os.path.join(staging, "store.bin"), "wb") as store:
+        for ordinal, doc in enumerate(_merge_sorted_runs(run_paths)):
+            date_keys[ordinal] = -to_epoch(doc["datetime"])
+            doc_ids[ordinal] = doc["doc_id"]
+            tokens = tokenize(doc.get("content", ""))
+            lengths[ordinal] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                postings.add(term, ordinal, tf)
+
+            for entry in doc.get("suggest", []):
+                for term in entry["input"]:
+                    key = suggest.normalize(term)
+                    best = suggestions.get(key)
+                    if best is None or entry["weight"] > best[2]:
+                        suggestions[key] = [key, term, entry["weight"]]
+
+            month = doc["datetime"][:7]
+            bucket = months.setdefault(month, {"count": 0, "weekday": Counter(), "hour": Counter()})
+            bucket["count"] += 1
+            bucket["weekday"][str(doc.get("weekday"))] += 1
+            bucket["hour"][str(doc.get("hour"))] += 1
+            for field in analytics.TERM_FIELDS:
+                term_counts[field].update(set(doc.get(field, [])))
+
+            data = json.dumps({k: doc[k] for k in STORED_FIELDS if k in doc}, ensure_ascii=False).encode("utf-8")
+            store.write(data)
+            offsets[ordinal + 1] = offsets[ordinal] + len(data)
+
+    lexicon = postings.write(staging)
+    total_postings = postings.total
+    shutil.rmtree(runs_dir)
+
+    _write_array(staging, "doc_lengths", lengths)
+    _write_array(staging, "date_keys", date_keys)
+    _write_array(staging, "store_offsets", offsets)
+    _write_array(staging, "doc_ids", doc_ids)
+    _write_json(staging, "lexicon.json", lexicon)
+    _write_json(staging, "suggestions.json", sorted(suggestions.values()))
+
+    months = {m: {"count": v["count"], "weekday": dict(v["weekday"]), "hour": dict(v["hour"])}
+              for m, v in months.items()}
+    top_terms = {field: [[t, c] for t, c in counter.most_common(analytics.TOP_TERMS_SIZE)]
+                 for field, counter in term_counts.items()}
+    _write_json(staging, "analytics.json", analytics.summarize(months, top_terms, version))
+    _write_json(staging, "meta.json", {
+        "format_version": FORMAT_VERSION,
+        "docs": count,
+        "terms": len(lexicon),
+        "avg_length": float(lengths.mean()) if count else 0.0,
+        "version": version,
+        "built_at": datetime.datetime.now().isoformat(timespec="seconds")
+    })
+
+    stats = media_copy.replace_tree(staging, index_dir, move=True)
+    logger.info(f"🗃️ 本機索引完成：{count} 篇貼文，{len(lexicon)} 個詞，{total_postings} 筆postings")
+    return {"docs": count, "terms": len(lexicon), "postings": total_postings, "bytes": stats["bytes"]}
+
+
+class LocalIndex:
+    """唯讀的本機索引；postings、日期與文件內容以記憶體映射讀取"""
+
+    def __init__(self, index_dir: str = LOCAL_INDEX_DIR):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, "meta.json"), "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"本機索引格式版本 {self.meta.get('format_version')} 不符，需要重新匯入")
+        with open(os.path.join(index_dir, "lexicon.json"), "r", encoding="utf-8") as f:
+            self.lexicon: Dict[str, List[int]] = json.load(f)
+
+        def load(name):
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+
+        self.postings_docs = load("postings_docs")
+        self.postings_tf = load("postings_tf")
+        self.doc_lengths = load("doc_lengths")
+        self.date_keys = load("date_keys")
+        self.store_offsets = load("store_offsets")
+        self.doc_ids = load("doc_ids")
+        self._store_file = open(os.path.join(index_dir, "store.bin"), "rb")
+        self._store = (mmap.mmap(self._store_file.fileno(), 0, access=mmap.ACCESS_READ)
+                       if self.meta["docs"] else b"")
+        self._id_lookup: Optional[Dict[str, int]] = None
+        self._suggestions: Optional[List] = None
+
+    @property
+    def doc_count(self) -> int:
+        return self.meta["docs"]
+
+    def close(self):
+        if isinstance(self._store, mmap.mmap):
+            self._store.close()
+        self._store_file.close()
+
+    def date_range(self, start: Optional[int], end: Optional[int]) -> Tuple[int, int]:
+        """以二分搜尋找出發文時間介於 start～end 秒（含）的文件編號範圍 [lo, hi)"""
+        lo = int(np.searchsorted(self.date_keys, -end, side="left")) if end is not None else 0
+        hi = int(np.searchsorted(self.date_keys, -start, side="right")) if start is not None else self.doc_count
+        return lo, max(lo, hi)
+
+    def postings(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        entry = self.lexicon.get(term)
+        if entry is None:
+            return np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.uint16)
+        start, df = entry
+        return self.postings_docs[start:start + df], self.postings_tf[start:start + df]
+
+    def search(self, query: str, start: Optional[int] = None, end: Optional[int] = None,
+               operator: str = "and", order: str = "date") -> np.ndarray:
+        """搜尋符合條件的文件
+
+        Args:
+            query: 搜尋關鍵字，空字串時只依日期篩選
+            start: 發文時間下限（秒）
+            end: 發文時間上限（秒）
+            operator: "and" 需符合所有詞，"or" 符合任一詞即可
+            order: "date" 依發文時間遞減（與搜尋頁的 search.SORT 相同，不計算分數）；
+                "score" 依BM25分數遞減，同分時依發文時間（與 ["_score", *search.SORT] 相同）
+
+        Returns:
+            np.ndarray: 依 order 排序的文件編號
+        """
+        lo, hi = self.date_range(start, end)
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return np.arange(lo, hi, dtype=np.uint32)
+
+        per_term = []
+        for term in terms:
+            docs, tfs = self.postings(term)
+            # postings依文件編號遞增，日期範圍同樣以二分搜尋裁切
+            first, last = np.searchsorted(docs, [lo, hi])
+            per_term.append((len(docs), np.asarray(docs[first:last]), tfs[first:last]))
+
+        if operator == "and":
+            matched = per_term[0][1]
+            for _, docs, _ in per_term[1:]:
+                matched = np.intersect1d(matched, docs, assume_unique=True)
+        else:
+            matched = np.unique(np.concatenate([docs for _, docs, _ in per_term]))
+        matched = matched.astype(np.uint32)
+        if order != "score" or not len(matched):
+            return matched
+
+        scores = self._bm25(matched, per_term)
+        # lexsort 以最後一個鍵為主：分數遞減，同分時文件編號遞增（即發文時間遞減）
+        return matched[np.lexsort((matched, -scores))]
+
+    def _bm25(self, matched: np.ndarray, per_term: List[Tuple[int, np.ndarray, np.ndarray]]) -> np.ndarray:
+        """各詞的BM25分數加總（與Elasticsearch預設的相似度公式相同）"""
+        avg_length = self.meta["avg_length"] or 1.0
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[matched] / avg_length)
+        scores = np.zeros(len(matched), dtype=np.float64)
+        for df, docs, tfs in per_term:
+            _, in_matched, in_docs = np.intersect1d(matched, docs, assume_unique=True, return_indices=True)
+            tf = np.asarray(tfs, dtype=np.float64)[in_docs]
+            idf = math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+            scores[in_matched] += idf * tf * (BM25_K1 + 1) / (tf + norms[in_matched])
+        return scores
+
+    def document(self, ordinal: int) -> Dict:
+        start, end = int(self.store_offsets[ordinal]), int(self.store_offsets[ordinal + 1])
+        return json.loads(bytes(self._store[start:end]).decode("utf-8"))
+
+    def ordinal_of(self, doc_id: str) -> Optional[int]:
+        if self._id_lookup is None:
+            self._id_lookup = {value.decode("ascii"): i for i, value in enumerate(self.doc_ids)}
+        return self._id_lookup.get(doc_id)
+
+    def suggest(self, prefix: str, size: int) -> List[str]:
+        """依權重回傳以 prefix 開頭的建議詞"""
+        if self._suggestions is None:
+            with open(os.path.join(self.index_dir, "suggestions.json"), "r", encoding="utf-8") as f:
+                self._suggestions = json.load(f)
+            self._suggestion_keys = [entry[0] for entry in self._suggestions]
+        start = bisect.bisect_left(self._suggestion_keys, prefix)
+        end = bisect.bisect_left(self._suggestion_keys, prefix + "\uffff")
+        matches = sorted(self._suggestions[start:end], key=lambda entry: -entry[2])
+        return [entry[1] for entry in matches[:size]]
+
+    def analytics(self) -> Dict:
+        with open(os.path.join(self.index_dir, "analytics.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def highlight(content: str, query: str, fragment_size: int, fragments: int) -> List[str]:
+    """產生與Elasticsearch highlight相同格式的片段（HTML跳脫，符合的詞以 <mark> 標示）
+
+    Args:
+        content: 貼文內容
+        query: 搜尋關鍵字
+        fragment_size: 每個片段的字數
+        fragments: 最多幾個片段
+
+    Returns:
+        List[str]: 片段；沒有符合的詞時回傳開頭一段
+    """
+    content = content or ""
+    lower = unicodedata.normalize("NFKC", content).lower()
+    if len(lower) != len(content):
+        lower = content.lower()
+
+    spans = []
+    for term in set(tokenize(query)):
+        position = lower.find(term)
+        while position != -1:
+            spans.append([position, position + len(term)])
+            position = lower.find(term, position + 1)
+    if not spans:
+        return [html.escape(content[:fragment_size * 2])] if content else []
+
+    # 合併重疊的範圍（相鄰的雙字詞會連成完整的關鍵字）
+    spans.sort()
+    merged = [spans[0]]
+    for start, end in spans[1:]:
+        if start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+
+    result = []
+    window_end = -1
+    for start, _ in merged:
+        if start < window_end:
+            continue
+        window_start = max(0, start - fragment_size // 4)
+        window_end = window_start + fragment_size
+        parts, cursor = [], window_start
+        for s, e in merged:
+            if e <= window_start or s >= window_end:
+                continue
+            s, e = max(s, window_start), min(e, window_end)
+            parts.append(html.escape(content[cursor:s]))
+            parts.append(f"<mark>{html.escape(content[s:e])}</mark>")
+            cursor = e
+        parts.append(html.escape(content[cursor:window_end]))
+        result.append("".join(parts))
+        if len(result) >= fragments:
+            break
+    return result
+
+
+_lock = threading.Lock()
+_index: Optional[LocalIndex] = None
+_index_mtime: Optional[float] = None
+
+
+def exists(index_dir: str = LOCAL_INDEX_DIR) -> bool:
+    return os.path.exists(os.path.join(index_dir, "meta.json"))
+
+
+def get_index(index_dir: str = LOCAL_INDEX_DIR) -> LocalIndex:
+    """取得行程內共用的本機索引，重新匯入後自動載入新版本
+
+    Raises:
+        FileNotFoundError: 尚未建立本機索引時
+    """
+    global _index, _index_mtime
+    mtime = os.stat(os.path.join(index_dir, "meta.json")).st_mtime
+    with _lock:
+        if _index is None or _index.index_dir != index_dir or mtime != _index_mtime:
+            # 舊索引可能仍被其他執行緒使用，不主動關閉，由垃圾回收釋放映射
+            _index = LocalIndex(index_dir)
+            _index_mtime = mtime
+            logger.info(f"✅ 已載入本機索引：{_index.doc_count} 篇貼文")
+        return _index
@@ -0,0 +1,208 @@
+import os
+import time
+import errno
+import ctypes
+import shutil
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+COPY_CHUNK = 8 * 1024 * 1024  # 每次核心複製的位元組數
+AT_FDCWD = -100
+RENAME_EXCHANGE = 2  # renameat2 旗標：原子交換兩個既有路徑
+
+
+def _kernel_copy(fsrc, fdst, size: int):
+    """以 copy_file_range / sendfile 在核心內複製，不經過Python緩衝區"""
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    copied = 0
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                n = os.copy_file_range(in_fd, out_fd, min(COPY_CHUNK, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            if copied >= size:
+                return
+        except OSError:
+            # 部分檔案系統不支援，改用 sendfile（從已複製的位置繼續）
+            pass
+
+    if hasattr(os, "sendfile"):
+        try:
+            while copied < size:
+                n = os.sendfile(out_fd, in_fd, copied, min(COPY_CHUNK, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            if copied >= size:
+                return
+        except OSError:
+            pass
+
+    fsrc.seek(copied)
+    fdst.seek(copied)
+    shutil.copyfileobj(fsrc, fdst, COPY_CHUNK)
+
+
+def fast_copy(src: str, dst: str) -> int:
+    """複製單一檔案並設置權限
+
+    Args:
+        src: 來源檔案路徑
+        dst: 目標檔案路徑
+
+    Returns:
+        int: 複製的位元組數
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    size = os.path.getsize(src)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        _kernel_copy(fsrc, fdst, size)
+    os.chmod(dst, 0o666)
+    return size
+
+
+def _list_files(src_dir: str) -> Tuple[List[str], List[str]]:
+    """列出來源目錄下的所有子目錄與檔案（相對路徑）"""
+    dirs, files = [], []
+    for root, dirnames, filenames in os.walk(src_dir):
+        rel_root = os.path.relpath(root, src_dir)
+        dirs.extend(os.path.normpath(os.path.join(rel_root, d)) for d in dirnames)
+        files.extend(os.path.normpath(os.path.join(rel_root, f)) for f in filenames)
+    return dirs, files
+
+
+def _chmod_tree(path: str):
+    """設置整個目錄樹的權限（目錄 777、檔案 666）"""
+    os.chmod(path, 0o777)
+    for root, dirs, files in os.walk(path):
+        for d in dirs:
+            os.chmod(os.path.join(root, d), 0o777)
+        for f in files:
+            os.chmod(os.path.join(root, f), 0o666)
+
+
+@functools.lru_cache(maxsize=None)
+def _renameat2():
+    """取得 libc 的 renameat2（glibc 2.28 起提供），沒有時回傳 None"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        return None
+    func = getattr(libc, "renameat2", None)
+    if func is not None:
+        func.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+        func.restype = ctypes.c_int
+    return func
+
+
+def _exchange(a: str, b: str) -> bool:
+    """以 renameat2(RENAME_EXCHANGE) 原子交換兩個路徑
+
+    Returns:
+        bool: 是否完成交換；系統或檔案系統不支援時回傳 False
+
+    Raises:
+        OSError: 支援交換但執行失敗時
+    """
+    func = _renameat2()
+    if func is None:
+        return False
+    if func(AT_FDCWD, os.fsencode(a), AT_FDCWD, os.fsencode(b), RENAME_EXCHANGE) == 0:
+        return True
+    err = ctypes.get_errno()
+    if err in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+        return False
+    raise OSError(err, os.strerror(err), a, None, b)
+
+
+def _swap_in(staging: str, dst_dir: str):
+    """把建好的暫存目錄換成目標目錄
+
+    支援時以一次原子交換完成，讀取端不會看到目標不存在的空窗；否則退回
+    兩次改名，第二次改名失敗時把舊目錄改回原位，不會留下搬到一半的狀態。
+    """
+    if not os.path.exists(dst_dir):
+        os.rename(staging, dst_dir)
+        return
+    if _exchange(staging, dst_dir):
+        # 交換後暫存路徑放的是舊目錄
+        shutil.rmtree(staging, ignore_errors=True)
+        return
+
+    old = f"{dst_dir}.old"
+    if os.path.exists(old):
+        shutil.rmtree(old, ignore_errors=True)
+    os.rename(dst_dir, old)
+    try:
+        os.rename(staging, dst_dir)
+    except OSError:
+        os.rename(old, dst_dir)
+        raise
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def replace_tree(src_dir: str, dst_dir: str, workers: int = 8, move: bool = True) -> Dict:
+    """以新目錄取代目標目錄：先完整建立到暫存目錄，再原子交換切換
+
+    來源與目標在同一檔案系統且 move 為 True 時直接改名整個目錄；否則以
+    有上限的執行緒池平行複製。切換前舊目錄仍可讀取，不會出現刪到一半的狀態。
+
+    Args:
+        src_dir: 來源目錄
+        dst_dir: 目標目錄
+        workers: 平行複製的執行緒數
+        move: 是否允許直接搬移來源（來源之後不再使用時）
+
+    Returns:
+        Dict: {"files", "bytes", "failed", "seconds", "mb_per_s", "method"}
+    """
+    started = time.monotonic()
+    parent = os.path.dirname(os.path.abspath(dst_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = f"{dst_dir}.new"
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+
+    dirs, files = _list_files(src_dir)
+    stats = {"files": len(files), "bytes": 0, "failed": 0, "method": "copy"}
+
+    same_fs = os.stat(src_dir).st_dev == os.stat(parent).st_dev
+    if move and same_fs:
+        stats["bytes"] = sum(os.path.getsize(os.path.join(src_dir, f)) for f in files)
+        os.rename(src_dir, staging)
+        _chmod_tree(staging)
+        stats["method"] = "rename"
+    else:
+        os.makedirs(staging)
+        for d in dirs:
+            os.makedirs(os.path.join(staging, d), exist_ok=True)
+        _chmod_tree(staging)
+
+        def copy_one(rel_path: str) -> int:
+            try:
+                return fast_copy(os.path.join(src_dir, rel_path), os.path.join(staging, rel_path))
+            except OSError as e:
+                logger.warning(f"複製檔案失敗 {rel_path}: {e}")
+                return -1
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for size in executor.map(copy_one, files):
+                if size < 0:
+                    stats["failed"] += 1
+                else:
+                    stats["bytes"] += size
+
+    _swap_in(staging, dst_dir)
+
+    stats["seconds"] = time.monotonic() - started
+    stats["mb_per_s"] = stats["bytes"] / 1024 / 1024 / stats["seconds"] if stats["seconds"] > 0 else 0.0
+    logger.info(f"📁 媒體檔{'搬移' if stats['method'] == 'rename' else '複製'}完成："
+                f"{stats['files']} 個檔案、{stats['bytes'] / 1024 / 1024:.1f} MB，"
+                f"{stats['seconds']:.1f} 秒（{stats['mb_per_s']:.1f} MB/s），失敗 {stats['failed']} 個")
+    return stats
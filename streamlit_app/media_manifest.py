@@ -0,0 +1,95 @@
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional
+
+from PIL import Image
+
+import thumbnails
+
+logger = logging.getLogger(__name__)
+
+
+def inspect_media(base_dir: str, uri: str) -> Dict:
+    """檢查單一媒體檔，取得大小、尺寸、格式、是否可顯示與縮圖路徑
+
+    圖片會完整解碼一次（同時產生縮圖），損毀檔在匯入時就會被標記。
+
+    Args:
+        base_dir: 媒體路徑的根目錄（uri 相對於此目錄）
+        uri: 文件中的媒體路徑，例如 media/posts/202301/xxx.jpg
+
+    Returns:
+        Dict: {"size", "width", "height", "format", "kind", "valid", "thumbnail"}
+    """
+    path = os.path.join(base_dir, uri)
+    entry = {"size": None, "width": None, "height": None, "format": None,
+             "kind": "image", "valid": False, "thumbnail": None}
+    try:
+        entry["size"] = os.path.getsize(path)
+    except OSError:
+        return entry
+
+    extension = os.path.splitext(uri)[1].lower()
+    if extension in thumbnails.VIDEO_EXTENSIONS:
+        entry.update(kind="video", format=extension.lstrip("."), valid=True)
+        return entry
+
+    try:
+        with Image.open(path) as img:
+            entry.update(width=img.width, height=img.height, format=img.format)
+    except Exception:
+        return entry
+
+    thumbnail = thumbnails.get_thumbnail(path)
+    if thumbnail:
+        entry["valid"] = True
+        entry["thumbnail"] = os.path.relpath(thumbnail, base_dir)
+    return entry
+
+
+def build_manifest(base_dir: str, uris: Iterable[str], workers: int = 4,
+                   on_file: Optional[Callable[[int], None]] = None) -> Dict[str, Dict]:
+    """平行檢查所有媒體檔並建立清單
+
+    Args:
+        base_dir: 媒體路徑的根目錄
+        uris: 媒體路徑
+        workers: 平行處理的執行緒數
+        on_file: 每檢查完一個檔案呼叫一次，參數為檔案大小（回報進度用）
+
+    Returns:
+        Dict[str, Dict]: {媒體路徑: inspect_media 結果}
+    """
+    uris = sorted(set(uris))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        entries = []
+        for entry in executor.map(lambda uri: inspect_media(base_dir, uri), uris):
+            entries.append(entry)
+            if on_file:
+                on_file(entry["size"] or 0)
+    manifest = dict(zip(uris, entries))
+
+    invalid = [uri for uri, entry in manifest.items() if not entry["valid"]]
+    for uri in invalid[:20]:
+        logger.warning(f"⚠️ 媒體檔缺少或損毀：{uri}")
+    logger.info(f"🗂️ 媒體清單完成：{len(manifest)} 個檔案，無法顯示 {len(invalid)} 個")
+    return manifest
+
+
+def attach_manifest(items: Iterable[Dict], manifest: Dict[str, Dict]) -> Iterator[Dict]:
+    """將媒體清單資訊附加到每筆資料的 media[].manifest
+
+    Args:
+        items: 處理後的Instagram資料
+        manifest: build_manifest 結果
+
+    Yields:
+        Dict: 附加清單資訊的資料
+    """
+    for item in items:
+        for media_item in item["media"]:
+            entry = manifest.get(media_item.get("uri"))
+            if entry is not None:
+                media_item["manifest"] = entry
+        yield item
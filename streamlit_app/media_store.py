@@ -0,0 +1,308 @@
+import os
+import json
+import errno
+import hashlib
+import logging
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import media_copy
+
+logger = logging.getLogger(__name__)
+
+STORE_PREFIX = os.path.join("media", "store")  # 文件中媒體路徑的前綴
+INDEX_FILENAME = "index.json"                  # ZIP成員 → 內容雜湊路徑的對照表
+READ_CHUNK = 1024 * 1024
+
+
+def _member_key(info: zipfile.ZipInfo) -> str:
+    """以檔名、大小與CRC識別ZIP成員，相同的鍵代表相同內容，不必重新讀取"""
+    return f"{os.path.basename(info.filename)}:{info.file_size}:{info.CRC:08x}"
+
+
+def store_uri(digest: str, extension: str) -> str:
+    """依內容雜湊產生儲存路徑，例如 media/store/ab/abcdef….jpg"""
+    return os.path.join(STORE_PREFIX, digest[:2], digest + extension.lower())
+
+
+class MediaStore:
+    """以內容雜湊儲存媒體檔，每份內容只保留一份"""
+
+    def __init__(self, base_dir: str):
+        self.base_dir = base_dir
+        self.root = os.path.join(base_dir, STORE_PREFIX)
+        self.index_path = os.path.join(self.root, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._index = self._load_index()
+
+    def _load_index(self) -> Dict[str, str]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self):
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _tmp_path(self) -> str:
+        """每個執行緒各自的暫存檔（位於儲存區根目錄，不會被當成內容）"""
+        os.makedirs(self.root, exist_ok=True)
+        return os.path.join(self.root, f".{threading.get_ident()}.part")
+
+    def _destination(self, uri: str) -> str:
+        dst = os.path.join(self.base_dir, uri)
+        dst_dir = os.path.dirname(dst)
+        if not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir, exist_ok=True)
+            os.chmod(dst_dir, 0o777)
+        return dst
+
+    def _known(self, key: str) -> str:
+        """回傳已知成員的儲存路徑（檔案仍存在時）"""
+        with self._lock:
+            uri = self._index.get(key)
+        if uri and os.path.exists(os.path.join(self.base_dir, uri)):
+            return uri
+        return None
+
+    def put_member(self, zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> Tuple[str, int]:
+        """將ZIP成員存入儲存區
+
+        Args:
+            zf: 已開啟的ZIP檔（每個執行緒各自一個）
+            info: 成員資訊
+
+        Returns:
+            Tuple[str, int]: (儲存路徑, 實際寫入的位元組數；重複內容為 0)
+        """
+        key = _member_key(info)
+        uri = self._known(key)
+        if uri:
+            return uri, 0
+
+        # 邊讀邊算雜湊寫到暫存檔，完成後依雜湊決定最終位置
+        tmp_path = self._tmp_path()
+        sha = hashlib.sha256()
+        with zf.open(info) as fsrc, open(tmp_path, "wb") as fdst:
+            while True:
+                chunk = fsrc.read(READ_CHUNK)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                fdst.write(chunk)
+
+        uri = store_uri(sha.hexdigest(), os.path.splitext(info.filename)[1])
+        written = 0
+        if os.path.exists(os.path.join(self.base_dir, uri)):
+            os.remove(tmp_path)
+        else:
+            dst = self._destination(uri)
+            os.chmod(tmp_path, 0o666)
+            os.replace(tmp_path, dst)
+            written = info.file_size
+
+        with self._lock:
+            self._index[key] = uri
+        return uri, written
+
+    def put_file(self, path: str) -> Tuple[str, int]:
+        """將解壓縮出的檔案移入儲存區（同一檔案系統時直接改名，否則複製）
+
+        Args:
+            path: 檔案路徑，之後不再使用（內容重複時保留原檔，由呼叫端清除）
+
+        Returns:
+            Tuple[str, int]: (儲存路徑, 實際寫入的位元組數；重複內容為 0)
+        """
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+                sha.update(chunk)
+
+        uri = store_uri(sha.hexdigest(), os.path.splitext(path)[1])
+        if os.path.exists(os.path.join(self.base_dir, uri)):
+            return uri, 0
+
+        dst = self._destination(uri)
+        size = os.path.getsize(path)
+        os.chmod(path, 0o666)
+        try:
+            os.replace(path, dst)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            tmp_path = self._tmp_path()
+            media_copy.fast_copy(path, tmp_path)
+            os.replace(tmp_path, dst)
+        return uri, size
+
+    def retain(self, uris: Iterable[str]) -> Dict:
+        """刪除儲存區中不在 uris 內的內容，並移除對照表中指向它們的項目
+
+        Args:
+            uris: 仍被引用的儲存路徑
+
+        Returns:
+            Dict: {"removed", "bytes"}
+        """
+        keep = {os.path.normpath(uri) for uri in uris}
+        stats = {"removed": 0, "bytes": 0}
+        for root, _, files in os.walk(self.root):
+            # 根目錄只有對照表與暫存檔，內容都在雜湊前兩碼的子目錄中
+            if root == self.root:
+                continue
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.relpath(path, self.base_dir) in keep:
+                    continue
+                try:
+                    size = os.path.getsize(path)
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"無法刪除未引用的媒體檔 {path}: {e}")
+                    continue
+                stats["removed"] += 1
+                stats["bytes"] += size
+
+        with self._lock:
+            self._index = {key: uri for key, uri in self._index.items() if os.path.normpath(uri) in keep}
+        self.save_index()
+        return stats
+
+
+def import_from_zip(zip_path: str, base_dir: str, members: Dict[str, zipfile.ZipInfo],
+                    workers: int = 4,
+                    on_file: Optional[Callable[[int], None]] = None) -> Tuple[Dict[str, str], Dict]:
+    """將需要的ZIP成員存入內容雜湊儲存區
+
+    Args:
+        zip_path: zip檔案的路徑（每個執行緒各自開啟，避免共用檔案位置）
+        base_dir: 媒體路徑的根目錄
+        members: {原本的媒體路徑: ZIP成員資訊}
+        workers: 平行處理的執行緒數
+        on_file: 每處理完一個成員呼叫一次，參數為寫入的位元組數（回報進度用）
+
+    Returns:
+        Tuple[Dict[str, str], Dict]: ({原本的媒體路徑: 儲存路徑}, 統計 {"files", "new", "deduped", "bytes"})
+    """
+    store = MediaStore(base_dir)
+    local = threading.local()
+    handles = []
+
+    def put(item):
+        uri, info = item
+        if not hasattr(local, "zf"):
+            local.zf = zipfile.ZipFile(zip_path, "r")
+            handles.append(local.zf)
+        return uri, store.put_member(local.zf, info)
+
+    uri_map = {}
+    stats = {"files": len(members), "new": 0, "deduped": 0, "bytes": 0}
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for uri, (stored, written) in executor.map(put, sorted(members.items())):
+                uri_map[uri] = stored
+                if written:
+                    stats["new"] += 1
+                    stats["bytes"] += written
+                else:
+                    stats["deduped"] += 1
+                if on_file:
+                    on_file(written)
+    finally:
+        for zf in handles:
+            zf.close()
+        store.save_index()
+
+    logger.info(f"📁 媒體儲存區：{stats['files']} 個檔案，新增 {stats['new']} 個"
+                f"（{stats['bytes'] / 1024 / 1024:.1f} MB），重複略過 {stats['deduped']} 個")
+    return uri_map, stats
+
+
+def import_from_directory(src_dir: str, base_dir: str, uris: Iterable[str],
+                          workers: int = 4,
+                          on_file: Optional[Callable[[int], None]] = None) -> Tuple[Dict[str, str], Dict]:
+    """將解壓縮目錄中的媒體檔移入內容雜湊儲存區
+
+    Args:
+        src_dir: 解壓縮的暫存目錄（媒體路徑相對於此目錄）
+        base_dir: 媒體路徑的根目錄
+        uris: 文件中的媒體路徑
+        workers: 平行處理的執行緒數
+        on_file: 每處理完一個檔案呼叫一次，參數為寫入的位元組數（回報進度用）
+
+    Returns:
+        Tuple[Dict[str, str], Dict]: ({原本的媒體路徑: 儲存路徑}, 統計 {"files", "new", "deduped", "missing", "bytes"})
+    """
+    store = MediaStore(base_dir)
+    uris = sorted(set(uris))
+
+    def put(uri):
+        path = os.path.join(src_dir, uri)
+        if not os.path.isfile(path):
+            return uri, None
+        return uri, store.put_file(path)
+
+    uri_map = {}
+    stats = {"files": len(uris), "new": 0, "deduped": 0, "missing": 0, "bytes": 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for uri, result in executor.map(put, uris):
+            if result is None:
+                stats["missing"] += 1
+                if stats["missing"] <= 20:
+                    logger.warning(f"解壓縮目錄中找不到媒體檔：{uri}")
+                written = 0
+            else:
+                uri_map[uri], written = result
+                if written:
+                    stats["new"] += 1
+                    stats["bytes"] += written
+                else:
+                    stats["deduped"] += 1
+            if on_file:
+                on_file(written)
+
+    logger.info(f"📁 媒體儲存區：{stats['files']} 個檔案，新增 {stats['new']} 個"
+                f"（{stats['bytes'] / 1024 / 1024:.1f} MB），重複略過 {stats['deduped']} 個，缺少 {stats['missing']} 個")
+    return uri_map, stats
+
+
+def collect_garbage(base_dir: str, referenced: Iterable[str]) -> Dict:
+    """刪除儲存區中沒有任何文件引用的內容（發布成功後呼叫）
+
+    Args:
+        base_dir: 媒體路徑的根目錄
+        referenced: 所有保留的索引中引用到的媒體路徑（不在儲存區的路徑會被忽略）
+
+    Returns:
+        Dict: {"removed", "bytes"}
+    """
+    stats = MediaStore(base_dir).retain(referenced)
+    logger.info(f"🧹 媒體儲存區清理：刪除 {stats['removed']} 個未引用的檔案（{stats['bytes'] / 1024 / 1024:.1f} MB）")
+    return stats
+
+
+def rewrite_uris(items: Iterable[Dict], uri_map: Dict[str, str]) -> Iterator[Dict]:
+    """將資料中的媒體路徑改為儲存區路徑，原路徑保留在 source_uri
+
+    Args:
+        items: 處理後的Instagram資料
+        uri_map: import_from_zip 回傳的路徑對照
+
+    Yields:
+        Dict: 改寫後的資料
+    """
+    for item in items:
+        for media_item in item["media"]:
+            uri = media_item.get("uri")
+            if uri in uri_map:
+                media_item["source_uri"] = uri
+                media_item["uri"] = uri_map[uri]
+        yield item
@@ -0,0 +1,282 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 指標服務設定（可由環境變數調整）
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))  # 0 表示不啟動指標服務
+METRICS_PANEL = os.getenv("METRICS_PANEL", "false").lower() == "true"  # 側邊欄預設顯示效能指標
+METRIC_PREFIX = "instasearch_"
+
+# 延遲直方圖的上界（秒），涵蓋快取命中（毫秒以下）到大量匯入（數十秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+# 收集函數回傳的樣本：(名稱, 類型, 說明, 標籤, 數值)
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def _label_key(labels: Dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in key)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(key, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._values: Dict[LabelKey, object] = {}
+        self._lock = threading.Lock()
+
+    def samples(self) -> List[Tuple[str, LabelKey, float]]:
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Counter(Metric):
+    """只增不減的計數（次數、位元組數）"""
+
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """目前的數值（例如最近一次匯入的速率）"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+
+class Histogram(Metric):
+    """延遲分布：各上界的累計次數、總和與次數"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][bisect.bisect_left(self.buckets, value)] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """量測區塊執行時間（發生例外時也會記錄）"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        result = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    result.append((f"{self.name}_bucket", key + (("le", _format_value(bound)),), cumulative))
+                result.append((f"{self.name}_sum", key, total))
+                result.append((f"{self.name}_count", key, count))
+        return result
+
+    def summaries(self) -> List[Dict]:
+        """每組標籤的次數、平均與估計的p50/p95（秒）"""
+        with self._lock:
+            states = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        return [{
+            "labels": dict(key),
+            "count": count,
+            "sum": total,
+            "avg": total / count if count else 0.0,
+            "p50": estimate_quantile(self.buckets, counts, 0.5),
+            "p95": estimate_quantile(self.buckets, counts, 0.95)
+        } for key, counts, total, count in states]
+
+
+def estimate_quantile(buckets: Tuple[float, ...], counts: List[int], q: float) -> float:
+    """由直方圖各區間次數以線性內插估計分位數（與Prometheus的 histogram_quantile 相同）"""
+    total = sum(counts)
+    if total == 0:
+        return 0.0
+    rank = q * total
+    cumulative = 0
+    for i, bucket_count in enumerate(counts):
+        if cumulative + bucket_count >= rank and bucket_count:
+            if i == len(buckets):
+                return buckets[-1]
+            lower = buckets[i - 1] if i > 0 else 0.0
+            return lower + (buckets[i] - lower) * (rank - cumulative) / bucket_count
+        cumulative += bucket_count
+    return buckets[-1]
+
+
+_metrics: Dict[str, Metric] = {}
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+_registry_lock = threading.Lock()
+
+
+def _get_or_create(cls, name: str, help_text: str, **kwargs):
+    name = METRIC_PREFIX + name
+    with _registry_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = cls(name, help_text, **kwargs)
+        return metric
+
+
+def counter(name: str, help_text: str) -> Counter:
+    return _get_or_create(Counter, name, help_text)
+
+
+def gauge(name: str, help_text: str) -> Gauge:
+    return _get_or_create(Gauge, name, help_text)
+
+
+def histogram(name: str, help_text: str, buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, help_text, buckets=buckets)
+
+
+def register_collector(collect: Callable[[], Iterable[Sample]]):
+    """註冊在輸出時才讀取數值的收集函數（例如快取統計），避免在熱路徑上重複記錄"""
+    with _registry_lock:
+        _collectors.append(collect)
+
+
+def _collected() -> Dict[str, Tuple[str, str, List[Tuple[LabelKey, float]]]]:
+    groups: Dict[str, Tuple[str, str, List]] = {}
+    with _registry_lock:
+        collectors = list(_collectors)
+    for collect in collectors:
+        try:
+            for name, kind, help_text, labels, value in collect():
+                groups.setdefault(METRIC_PREFIX + name, (kind, help_text, []))[2].append((_label_key(labels), value))
+        except Exception as e:
+            logger.warning(f"收集效能指標失敗：{e}")
+    return groups
+
+
+def render() -> str:
+    """以Prometheus文字格式輸出所有指標"""
+    lines = []
+    with _registry_lock:
+        metrics = sorted(_metrics.values(), key=lambda m: m.name)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in metric.samples():
+            lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+    for name, (kind, help_text, values) in sorted(_collected().items()):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for key, value in values:
+            lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def snapshot() -> Dict[str, List[Dict]]:
+    """側邊欄顯示用：延遲直方圖的摘要與其他數值
+
+    Returns:
+        Dict: {"latency": [{"metric", "labels", "count", "avg", "p50", "p95", ...}], "values": [{"metric", "labels", "value"}]}
+    """
+    latency, values = [], []
+    with _registry_lock:
+        metrics = sorted(_metrics.values(), key=lambda m: m.name)
+    for metric in metrics:
+        short_name = metric.name[len(METRIC_PREFIX):]
+        if isinstance(metric, Histogram):
+            latency.extend({"metric": short_name, **summary} for summary in metric.summaries())
+        else:
+            values.extend({"metric": short_name, "labels": dict(key), "value": value}
+                          for _, key, value in metric.samples())
+    for name, (_, _, samples) in sorted(_collected().items()):
+        values.extend({"metric": name[len(METRIC_PREFIX):], "labels": dict(key), "value": value}
+                      for key, value in samples)
+    return {"latency": latency, "values": values}
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 不將每次抓取寫入log
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_attempted = False
+_server_lock = threading.Lock()
+
+
+def start_server(host: str = METRICS_HOST, port: int = METRICS_PORT) -> bool:
+    """在背景執行緒啟動 /metrics 服務（每個行程只啟動一次）
+
+    Args:
+        host: 監聽位址，預設只接受本機連線
+        port: 連接埠，0 表示不啟動
+
+    Returns:
+        bool: 服務是否執行中
+    """
+    global _server, _server_attempted
+    if port <= 0:
+        return False
+    with _server_lock:
+        # Streamlit 每次重新執行腳本都會呼叫，啟動失敗（例如連接埠被占用）時不再重試
+        if _server_attempted:
+            return _server is not None
+        _server_attempted = True
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"無法啟動效能指標服務 {host}:{port}：{e}")
+            return False
+        _server.daemon_threads = True
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"📈 效能指標服務：http://{host}:{port}/metrics")
+    return True
@@ -0,0 +1,113 @@
+import os
+import logging
+import dataclasses
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from elasticsearch import ApiError
+from elasticsearch.exceptions import HTTP_EXCEPTIONS
+
+import query_cache
+
+logger = logging.getLogger(__name__)
+
+# 同時執行的查詢數（共用客戶端的連線池大小為 ES_CONNECTIONS_PER_NODE）
+QUERY_WORKERS = int(os.getenv("QUERY_WORKERS", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=QUERY_WORKERS, thread_name_prefix="query")
+_local = threading.local()
+
+SearchRequest = Tuple[Optional[str], Dict]  # (索引名稱，使用PIT時為 None；搜尋內容)
+
+
+def _raise_item_error(response, item: Dict):
+    """將 _msearch 中單一查詢的錯誤轉為與 es.search 相同的例外（例如PIT過期時的 NotFoundError）
+
+    _msearch 本身的回應狀態為200，例外的狀態碼改用該查詢自己的 status。
+    """
+    status = item.get("status", 500)
+    error = item.get("error", {})
+    message = error.get("type", "search_error") if isinstance(error, dict) else str(error)
+    meta = dataclasses.replace(response.meta, status=status)
+    raise HTTP_EXCEPTIONS.get(status, ApiError)(message=message, meta=meta, body=item)
+
+
+def msearch(es, requests: List[SearchRequest]) -> List[Dict]:
+    """以一次 _msearch 執行多個搜尋，依序回傳各自的回應
+
+    每個查詢先查共用查詢快取，只有未命中的查詢送出；快取鍵與 query_cache.cached_search 相同，
+    兩者的結果可以互相沿用。
+
+    Args:
+        es: Elasticsearch客戶端
+        requests: [(索引名稱, 搜尋內容)]
+
+    Returns:
+        List[Dict]: 與 requests 同順序的搜尋回應（不含 pit_id，呼叫端不可修改）
+
+    Raises:
+        ApiError: 任一查詢失敗時，依其狀態碼拋出對應的例外
+    """
+    cache = query_cache.get_cache()
+    results: List[Optional[Dict]] = [None] * len(requests)
+    pending: List[Tuple[int, str]] = []
+    searches: List[Dict] = []
+    for i, (index, body) in enumerate(requests):
+        key = query_cache.canonical_key(index or "pit", {k: v for k, v in body.items() if k != "pit"})
+        results[i] = cache.get(key)
+        if results[i] is None:
+            pending.append((i, key))
+            searches.append({"index": index} if index else {})
+            searches.append(body)
+
+    if pending:
+        response = es.msearch(searches=searches)
+        for (i, key), item in zip(pending, response["responses"]):
+            if "error" in item:
+                _raise_item_error(response, item)
+            result = dict(item)
+            result.pop("status", None)
+            # PIT ID每次都可能不同，不存入快取
+            result.pop("pit_id", None)
+            cache.put(key, result)
+            results[i] = result
+    return results
+
+
+def run_parallel(tasks: Dict[str, Callable[[], Any]]) -> Dict[str, Any]:
+    """同時執行多個互不相依的查詢函數，全部完成後一起回傳
+
+    頁面的耗時為最慢的查詢，而不是所有查詢的總和。已在查詢執行緒中的呼叫（巢狀呼叫）
+    改為依序執行，避免等待同一個執行緒池而卡住。
+
+    Args:
+        tasks: {名稱: 不需參數的查詢函數}
+
+    Returns:
+        Dict[str, Any]: {名稱: 回傳值}
+
+    Raises:
+        Exception: 任一查詢失敗時拋出其例外（其他查詢仍會執行完畢）
+    """
+    if len(tasks) <= 1 or getattr(_local, "in_worker", False):
+        return {name: task() for name, task in tasks.items()}
+
+    def run(task):
+        _local.in_worker = True
+        try:
+            return task()
+        finally:
+            _local.in_worker = False
+
+    futures = {name: _executor.submit(run, task) for name, task in tasks.items()}
+    results, error = {}, None
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            logger.warning(f"查詢 {name} 失敗：{e}")
+            error = error or e
+    if error is not None:
+        raise error
+    return results
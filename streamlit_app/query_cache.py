@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# 快取設定（可由環境變數調整）
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "256"))  # 最多快取幾筆查詢結果
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "300"))   # 每筆結果的存活秒數
+BASE_DIR = os.getenv("APP_BASE_DIR", "/app")
+# 匯入流程寫完新版本索引後會更新此檔案，所有行程的快取據此失效
+INDEX_VERSION_FILE = os.getenv("INDEX_VERSION_FILE", os.path.join(BASE_DIR, "ig_data", ".index_version"))
+VERSION_CHECK_INTERVAL = 1.0  # 檢查版本檔的最短間隔秒數
+
+
+def canonical_key(index: str, body: Dict) -> str:
+    """將索引名稱與查詢內容轉為固定格式的快取鍵（鍵排序、去除空白）"""
+    return json.dumps([index, body], sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def read_index_version(path: str = INDEX_VERSION_FILE) -> Optional[str]:
+    """讀取目前的索引版本，檔案不存在時回傳 None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class QueryCache:
+    """行程內共用的查詢結果快取：LRU容量上限、TTL過期、索引版本變更時整批失效"""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 version_file: str = INDEX_VERSION_FILE):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_file = version_file
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = read_index_version(version_file)
+        self._version_checked = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self):
+        """定期比對版本檔，索引版本改變時清空快取（呼叫端需持有鎖）"""
+        now = time.monotonic()
+        if now - self._version_checked < VERSION_CHECK_INTERVAL:
+            return
+        self._version_checked = now
+        version = read_index_version(self.version_file)
+        if version != self._version:
+            logger.info(f"索引版本變更（{self._version} → {version}），清空查詢快取")
+            self._version = version
+            self._clear()
+
+    def _clear(self):
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+
+    def _lookup(self, key: str) -> Optional[Any]:
+        """取得未過期的值，不更新命中統計（呼叫端需持有鎖）"""
+        self._check_version()
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        return value
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._lookup(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """有快取時直接回傳，否則執行 compute 並存入快取"""
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def invalidate(self, version: Optional[str] = None):
+        """清空快取；提供 version 時同時記錄為目前版本"""
+        with self._lock:
+            if version is not None:
+                self._version = version
+            self._clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "version": self._version
+            }
+
+
+def register_metrics(name: str, cache: QueryCache):
+    """將快取的命中統計加入效能指標（輸出時才讀取，不影響查詢路徑）
+
+    Args:
+        name: 指標標籤中的快取名稱
+        cache: 快取
+    """
+    def collect():
+        stats = cache.stats()
+        labels = {"cache": name}
+        return [
+            ("cache_hits_total", "counter", "快取命中次數", labels, stats["hits"]),
+            ("cache_misses_total", "counter", "快取未命中次數", labels, stats["misses"]),
+            ("cache_hit_ratio", "gauge", "快取命中率", labels, stats["hit_ratio"]),
+            ("cache_entries", "gauge", "快取筆數", labels, stats["size"]),
+            ("cache_evictions_total", "counter", "因容量上限移除的筆數", labels, stats["evictions"])
+        ]
+    metrics.register_collector(collect)
+
+
+_cache = QueryCache()
+register_metrics("query", _cache)
+
+
+def get_cache() -> QueryCache:
+    """取得行程內共用的查詢快取"""
+    return _cache
+
+
+def bump_index_version(version: str, path: str = INDEX_VERSION_FILE):
+    """記錄新的索引版本，讓所有行程的查詢快取失效
+
+    Args:
+        version: 新版本識別字串
+        path: 版本檔路徑
+    """
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"無法寫入索引版本檔 {path}: {e}")
+    _cache.invalidate(version)
+
+
+def cached_search(es, index: Optional[str], body: Dict) -> Dict:
+    """透過共用快取執行搜尋；body 中的PIT ID不列入快取鍵
+
+    Args:
+        es: Elasticsearch客戶端
+        index: 索引名稱，使用PIT時為 None
+        body: 搜尋內容
+
+    Returns:
+        Dict: 搜尋回應（不含 pit_id，呼叫端不可修改）
+    """
+    use_pit = "pit" in body
+    key_body = {k: v for k, v in body.items() if k != "pit"}
+
+    def compute():
+        response = es.search(body=body) if use_pit else es.search(index=index, body=body)
+        result = dict(response.body if hasattr(response, "body") else response)
+        # PIT ID每次都可能不同，不存入快取
+        result.pop("pit_id", None)
+        return result
+
+    # PIT建立在同一別名上，同一索引版本內的結果相同
+    return _cache.get_or_compute(canonical_key(index or "pit", key_body), compute)
@@ -0,0 +1,271 @@
+import os
+import logging
+from datetime import date
+from typing import Dict, List, Optional
+
+from elasticsearch import NotFoundError
+
+import embeddings
+import multi_search
+import query_cache
+
+logger = logging.getLogger(__name__)
+
+ES_INDEX = "ig_data"
+PAGE_SIZE = 10
+PIT_KEEP_ALIVE = "5m"  # 翻頁間隔超過此時間後PIT會失效，屆時自動重新開啟
+# 關鍵字切成多個詞（例如中文雙字詞）時的比對方式："and" 需全部符合，"or" 任一符合即可
+MATCH_OPERATOR = os.getenv("MATCH_OPERATOR", "and")
+
+# 依發文時間由新到舊排序，doc_id 作為同一時間貼文的決勝欄位，確保 search_after 翻頁穩定
+SORT = [
+    {"datetime": {"order": "desc"}},
+    {"doc_id": {"order": "desc"}}
+]
+# 搜尋結果只回傳顯示用的欄位，內文改以highlight片段呈現，媒體只對畫面上的文件另外取得
+SOURCE_FIELDS = ["datetime"]
+SNIPPET_LENGTH = int(os.getenv("SNIPPET_LENGTH", "120"))    # 每個片段的字數
+SNIPPET_FRAGMENTS = int(os.getenv("SNIPPET_FRAGMENTS", "3"))
+HIGHLIGHT = {
+    # html編碼會跳脫內文中的HTML，只保留 <mark> 標記
+    "encoder": "html",
+    "pre_tags": ["<mark>"],
+    "post_tags": ["</mark>"],
+    "fields": {
+        "content": {
+            "fragment_size": SNIPPET_LENGTH,
+            "number_of_fragments": SNIPPET_FRAGMENTS,
+            # 只用日期搜尋時沒有符合的詞，改回傳開頭一段
+            "no_match_size": SNIPPET_LENGTH * 2
+        }
+    }
+}
+
+
+# 搜尋模式：關鍵字（BM25，依時間排序）、語意（kNN）、混合（BM25 與 kNN 以RRF合併）
+SEARCH_MODES = {"keyword": "關鍵字", "knn": "語意", "hybrid": "混合"}
+SEMANTIC_TOP_K = int(os.getenv("SEMANTIC_TOP_K", "100"))               # 語意與混合模式最多回傳的筆數
+KNN_NUM_CANDIDATES = int(os.getenv("KNN_NUM_CANDIDATES", "500"))       # HNSW 每個分片的候選數
+RRF_RANK_CONSTANT = int(os.getenv("RRF_RANK_CONSTANT", "60"))
+
+
+def date_filters(start_date: Optional[date], end_date: Optional[date]) -> List[Dict]:
+    """日期範圍條件（UTC整天），沒有指定日期時為空列表"""
+    date_range = {}
+    if start_date:
+        date_range["gte"] = f"{start_date.isoformat()}T00:00:00+00:00"
+    if end_date:
+        date_range["lte"] = f"{end_date.isoformat()}T23:59:59+00:00"
+    return [{"range": {"datetime": date_range}}] if date_range else []
+
+
+def build_query(query: str, start_date: Optional[date], end_date: Optional[date]) -> Dict:
+    """組合關鍵字與日期範圍的查詢條件
+
+    Args:
+        query: 搜尋關鍵字
+        start_date: 開始日期
+        end_date: 結束日期
+
+    Returns:
+        Dict: Elasticsearch query
+    """
+    must_conditions = []
+    if query:
+        must_conditions.append({"match": {"content": {"query": query, "operator": MATCH_OPERATOR}}})
+    must_conditions.extend(date_filters(start_date, end_date))
+
+    return {"bool": {"must": must_conditions}}
+
+
+def open_pit(es, index: str = ES_INDEX) -> str:
+    """開啟point-in-time，讓翻頁期間看到一致的資料"""
+    return es.open_point_in_time(index=index, keep_alive=PIT_KEEP_ALIVE)["id"]
+
+
+def close_pit(es, pit_id: Optional[str]):
+    """關閉point-in-time，已失效時忽略"""
+    if not pit_id:
+        return
+    try:
+        es.close_point_in_time(id=pit_id)
+    except Exception as e:
+        logger.debug(f"關閉PIT失敗：{e}")
+
+
+def fetch_page(es, query: Dict, search_after: Optional[List] = None,
+               pit_id: Optional[str] = None, size: int = PAGE_SIZE,
+               track_total_hits: bool = True, index: str = ES_INDEX) -> Dict:
+    """只取回一頁的搜尋結果
+
+    Args:
+        es: Elasticsearch客戶端
+        query: build_query 產生的查詢條件
+        search_after: 上一頁最後一筆的排序值，第一頁為 None
+        pit_id: point-in-time ID，為 None 時直接查詢索引
+        size: 每頁筆數
+        track_total_hits: 是否計算精確總筆數（通常只在第一頁需要）
+        index: 未使用PIT時查詢的索引
+
+    Returns:
+        Dict: {"hits": 本頁結果, "total": 總筆數或 None, "next_cursor": 下一頁的 search_after, "pit_id": 最新的PIT ID}
+    """
+    body = {
+        "query": query,
+        "sort": SORT,
+        "size": size,
+        "track_total_hits": track_total_hits,
+        "_source": SOURCE_FIELDS,
+        "highlight": HIGHLIGHT
+    }
+    if search_after:
+        body["search_after"] = search_after
+
+    if pit_id:
+        body["pit"] = {"id": pit_id, "keep_alive": PIT_KEEP_ALIVE}
+        try:
+            response = query_cache.cached_search(es, None, body)
+        except NotFoundError:
+            # PIT已過期，重新開啟後再查一次
+            logger.info("PIT 已過期，重新開啟")
+            pit_id = open_pit(es, index)
+            body["pit"]["id"] = pit_id
+            response = query_cache.cached_search(es, None, body)
+    else:
+        response = query_cache.cached_search(es, index, body)
+
+    hits = response.get("hits", {}).get("hits", [])
+    total = response["hits"]["total"]["value"] if track_total_hits else None
+    return {
+        "hits": hits,
+        "total": total,
+        "next_cursor": hits[-1]["sort"] if len(hits) == size else None,
+        "pit_id": response.get("pit_id", pit_id)
+    }
+
+
+def fetch_sources(es, ids: List[str], fields: List[str], index: str = ES_INDEX) -> Dict[str, Dict]:
+    """以 _mget 取得指定文件的部分欄位，例如畫面上貼文的媒體或全文
+
+    Args:
+        es: Elasticsearch客戶端
+        ids: 文件ID
+        fields: 要取得的 _source 欄位
+        index: 索引名稱
+
+    Returns:
+        Dict[str, Dict]: {文件ID: 部分 _source}，找不到的文件不列入
+    """
+    if not ids:
+        return {}
+
+    def compute():
+        response = es.mget(index=index, ids=ids, source_includes=fields)
+        return {doc["_id"]: doc.get("_source", {}) for doc in response["docs"] if doc.get("found")}
+
+    key = query_cache.canonical_key(index, {"mget": ids, "_source": fields})
+    return query_cache.get_cache().get_or_compute(key, compute)
+
+
+def index_embedding_model(es, index: str = ES_INDEX) -> Optional[str]:
+    """索引建立時記錄的向量模型，沒有向量欄位時回傳 None（結果隨索引版本快取）"""
+    def compute():
+        mappings = es.indices.get_mapping(index=index)
+        meta = next(iter(mappings.values()))["mappings"].get("_meta", {})
+        return {"model": meta.get("embedding_model")}
+
+    try:
+        return query_cache.get_cache().get_or_compute(f"embedding_model|{index}", compute)["model"]
+    except NotFoundError:
+        return None
+
+
+def semantic_available(es, index: str = ES_INDEX) -> bool:
+    """索引有向量欄位，且與目前設定的模型相同（查詢向量需由同一模型產生）"""
+    return embeddings.SEMANTIC_SEARCH and index_embedding_model(es, index) == embeddings.model_name()
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], rank_constant: int = RRF_RANK_CONSTANT) -> List[str]:
+    """以RRF合併多組排名：每組中排第 r 名得 1/(rank_constant + r) 分，依總分排序
+
+    Args:
+        rankings: 各查詢依分數排序的文件ID
+        rank_constant: 降低前幾名權重差距的常數
+
+    Returns:
+        List[str]: 合併後的文件ID
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (rank_constant + rank)
+    return sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+
+
+def ranked_ids(es, query: str, start_date: Optional[date], end_date: Optional[date],
+               mode: str, size: int = SEMANTIC_TOP_K, index: str = ES_INDEX) -> List[str]:
+    """語意或混合搜尋，回傳依相關度排序的文件ID
+
+    混合模式的BM25與kNN查詢以一次 _msearch 送出，再以RRF合併兩邊的排名。
+
+    Args:
+        es: Elasticsearch客戶端
+        query: 搜尋關鍵字
+        start_date: 開始日期
+        end_date: 結束日期
+        mode: "knn" 或 "hybrid"
+        size: 最多回傳筆數
+        index: 索引名稱
+
+    Returns:
+        List[str]: 文件ID
+    """
+    vector = embeddings.embed_query(query, index_embedding_model(es, index))
+    filters = date_filters(start_date, end_date)
+    requests = []
+    # 沒有可比對的詞時查詢向量為零向量，只用關鍵字查詢
+    if any(vector):
+        requests.append((index, {
+            "knn": {
+                "field": embeddings.VECTOR_FIELD,
+                "query_vector": vector,
+                "k": size,
+                "num_candidates": max(KNN_NUM_CANDIDATES, size),
+                "filter": filters
+            },
+            "size": size,
+            "_source": False
+        }))
+    if mode == "hybrid" or not requests:
+        requests.append((index, {"query": build_query(query, start_date, end_date), "size": size, "_source": False}))
+
+    responses = multi_search.msearch(es, requests)
+    rankings = [[hit["_id"] for hit in response["hits"]["hits"]] for response in responses]
+    return reciprocal_rank_fusion(rankings)[:size] if len(rankings) > 1 else rankings[0]
+
+
+def fetch_ranked_page(es, ids: List[str], query: str, index: str = ES_INDEX) -> List[Dict]:
+    """取得指定文件的顯示欄位與highlight片段，依 ids 的順序回傳
+
+    Args:
+        es: Elasticsearch客戶端
+        ids: 本頁的文件ID（已排序）
+        query: 搜尋關鍵字，用來標示片段中符合的詞
+        index: 索引名稱
+
+    Returns:
+        List[Dict]: 與 fetch_page 相同格式的 hit
+    """
+    if not ids:
+        return []
+    body = {
+        "query": {"bool": {
+            "filter": [{"ids": {"values": ids}}],
+            "should": [{"match": {"content": {"query": query}}}]
+        }},
+        "size": len(ids),
+        "_source": SOURCE_FIELDS,
+        "highlight": HIGHLIGHT
+    }
+    hits = {hit["_id"]: hit for hit in query_cache.cached_search(es, index, body)["hits"]["hits"]}
+    return [hits[doc_id] for doc_id in ids if doc_id in hits]
@@ -0,0 +1,223 @@
+import os
+import time
+import logging
+import datetime
+from collections import OrderedDict
+from typing import Dict, List, MutableMapping, Optional
+
+import numpy as np
+
+import analytics
+import es_client
+import local_index
+import search
+import search_session
+import suggest
+
+logger = logging.getLogger(__name__)
+
+# 搜尋後端："elasticsearch"（預設）、"local"（不需Elasticsearch的本機索引），
+# 或 "auto"（Elasticsearch無法連線時改用本機索引）
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "elasticsearch")
+
+
+class SearchBackend:
+    """搜尋頁與分析頁使用的搜尋後端介面
+
+    搜尋結果沿用Elasticsearch回應中 hit 的格式：{"_id", "_source": {"datetime"}, "highlight": {"content": [...]}}
+    """
+
+    name = ""
+    supports_trends = False  # 是否支援趨勢分析（significant_terms / composite 聚合）
+
+    @property
+    def search_modes(self) -> List[str]:
+        """可用的搜尋模式（search.SEARCH_MODES 的鍵）"""
+        return ["keyword"]
+
+    def start_search(self, session_state: MutableMapping, query: str,
+                     start_date: Optional[datetime.date], end_date: Optional[datetime.date],
+                     mode: str = "keyword") -> Dict:
+        """執行搜尋並設為目前的搜尋，回傳含 "total" 的搜尋狀態"""
+        raise NotImplementedError
+
+    def get_active_search(self, session_state: MutableMapping) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def get_page(self, state: Dict, page_number: int) -> List[Dict]:
+        raise NotImplementedError
+
+    def fetch_sources(self, ids: List[str], fields: List[str]) -> Dict[str, Dict]:
+        raise NotImplementedError
+
+    def suggest(self, prefix: str) -> List[str]:
+        raise NotImplementedError
+
+    def get_analytics(self) -> Dict:
+        raise NotImplementedError
+
+    def refresh_analytics(self) -> Dict:
+        return self.get_analytics()
+
+
+class ElasticsearchBackend(SearchBackend):
+    """以Elasticsearch搜尋（PIT翻頁、highlight、completion建議詞、聚合統計）"""
+
+    name = "elasticsearch"
+    supports_trends = True
+
+    def __init__(self, es):
+        self.es = es
+
+    @property
+    def search_modes(self):
+        try:
+            semantic = search.semantic_available(self.es)
+        except Exception as e:
+            logger.warning(f"無法確認索引的向量欄位：{e}")
+            semantic = False
+        return list(search.SEARCH_MODES) if semantic else ["keyword"]
+
+    def start_search(self, session_state, query, start_date, end_date, mode="keyword"):
+        return search_session.start_search(session_state, self.es, query, start_date, end_date, mode)
+
+    def get_active_search(self, session_state):
+        return search_session.get_active_search(session_state)
+
+    def get_page(self, state, page_number):
+        return search_session.get_page(self.es, state, page_number)
+
+    def fetch_sources(self, ids, fields):
+        return search.fetch_sources(self.es, ids, fields)
+
+    def suggest(self, prefix):
+        return suggest.suggest(self.es, prefix)
+
+    def get_analytics(self):
+        return analytics.get_analytics(self.es)
+
+    def refresh_analytics(self):
+        return analytics.refresh_recent(self.es)
+
+
+def day_bounds(start_date: Optional[datetime.date], end_date: Optional[datetime.date]):
+    """與 search.build_query 相同的日期範圍（UTC整天）"""
+    utc = datetime.timezone.utc
+    start = (int(datetime.datetime.combine(start_date, datetime.time.min, utc).timestamp())
+             if start_date else None)
+    end = (int(datetime.datetime.combine(end_date, datetime.time(23, 59, 59), utc).timestamp())
+           if end_date else None)
+    return start, end
+
+
+class LocalBackend(SearchBackend):
+    """以本機倒排索引搜尋，不需Elasticsearch；結果排序與Elasticsearch端相同（發文時間遞減）"""
+
+    name = "local"
+
+    def __init__(self, index_dir: str = local_index.LOCAL_INDEX_DIR):
+        self.index_dir = index_dir
+
+    @property
+    def index(self) -> Optional[local_index.LocalIndex]:
+        """目前的本機索引；尚未匯入資料或索引格式不符（需重新匯入）時為 None"""
+        if not local_index.exists(self.index_dir):
+            return None
+        try:
+            return local_index.get_index(self.index_dir)
+        except (FileNotFoundError, ValueError) as e:
+            logger.warning(f"無法載入本機索引：{e}")
+            return None
+
+    def _searches(self, session_state) -> "OrderedDict":
+        if "local_searches" not in session_state:
+            session_state["local_searches"] = OrderedDict()
+        return session_state["local_searches"]
+
+    def start_search(self, session_state, query, start_date, end_date, mode="keyword"):
+        # 本機索引只支援關鍵字搜尋（search_modes 不提供其他模式）
+        key = search_session.normalize_key(query, start_date, end_date)
+        searches = self._searches(session_state)
+        index = self.index
+        built_at = index.meta["built_at"] if index else None
+        state = searches.get(key)
+        if state is None or state["built_at"] != built_at:
+            start, end = day_bounds(start_date, end_date)
+            # 尚未建立索引時視為沒有結果，匯入後 built_at 不同會重新搜尋
+            ordinals = (index.search(key[0], start, end, operator=search.MATCH_OPERATOR)
+                        if index else np.empty(0, dtype=np.uint32))
+            state = {
+                "query": key[0],
+                "built_at": built_at,
+                "ordinals": ordinals.tolist(),
+                "total": len(ordinals),
+                "created": time.time()
+            }
+            searches[key] = state
+        searches.move_to_end(key)
+        while len(searches) > search_session.MAX_CACHED_SEARCHES:
+            searches.popitem(last=False)
+        session_state["active_search"] = key
+        return state
+
+    def get_active_search(self, session_state):
+        key = session_state.get("active_search")
+        if key is None:
+            return None
+        return self._searches(session_state).get(key)
+
+    def get_page(self, state, page_number):
+        index = self.index
+        if index is None:
+            return []
+        start = (page_number - 1) * search.PAGE_SIZE
+        hits = []
+        for ordinal in state["ordinals"][start:start + search.PAGE_SIZE]:
+            doc = index.document(ordinal)
+            hits.append({
+                "_id": doc["doc_id"],
+                "_source": {field: doc.get(field) for field in search.SOURCE_FIELDS},
+                "highlight": {"content": local_index.highlight(
+                    doc.get("content", ""), state["query"], search.SNIPPET_LENGTH, search.SNIPPET_FRAGMENTS
+                )}
+            })
+        return hits
+
+    def fetch_sources(self, ids, fields):
+        index = self.index
+        sources = {}
+        if index is None:
+            return sources
+        for doc_id in ids:
+            ordinal = index.ordinal_of(doc_id)
+            if ordinal is not None:
+                doc = index.document(ordinal)
+                sources[doc_id] = {field: doc[field] for field in fields if field in doc}
+        return sources
+
+    def suggest(self, prefix):
+        prefix = suggest.normalize(prefix)
+        index = self.index
+        return index.suggest(prefix, suggest.SUGGEST_SIZE) if prefix and index else []
+
+    def get_analytics(self):
+        index = self.index
+        return index.analytics() if index else analytics.summarize({}, {}, None)
+
+
+def get_backend(es=None, backend: str = SEARCH_BACKEND) -> SearchBackend:
+    """依設定選擇搜尋後端
+
+    Args:
+        es: Elasticsearch客戶端，未提供時使用共用客戶端
+        backend: "elasticsearch"、"local" 或 "auto"
+
+    Returns:
+        SearchBackend: 搜尋後端
+    """
+    if backend == "local":
+        return LocalBackend()
+    if backend == "auto" and es_client.get_health()["ok"] is False and local_index.exists():
+        logger.info("Elasticsearch 無法連線，改用本機索引")
+        return LocalBackend()
+    return ElasticsearchBackend(es or es_client.get_client())
@@ -0,0 +1,162 @@
+import time
+import logging
+from datetime import date
+from typing import Dict, List, MutableMapping, Optional, Tuple
+
+import query_cache
+import search
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHED_SEARCHES = 5   # 每個使用者session最多保留幾組搜尋結果
+SEARCH_TTL = 300          # 搜尋結果保留秒數，與PIT存活時間一致
+
+SearchKey = Tuple[str, Optional[str], Optional[str], str]
+
+
+def normalize_key(query: str, start_date: Optional[date], end_date: Optional[date],
+                  mode: str = "keyword") -> SearchKey:
+    """將搜尋條件正規化為快取鍵，忽略大小寫與多餘空白
+
+    Args:
+        query: 搜尋關鍵字
+        start_date: 開始日期
+        end_date: 結束日期
+        mode: 搜尋模式（search.SEARCH_MODES），沒有關鍵字時一律為 "keyword"
+
+    Returns:
+        SearchKey: (關鍵字, 開始日期, 結束日期, 搜尋模式)
+    """
+    query = " ".join((query or "").split()).lower()
+    return (
+        query,
+        start_date.isoformat() if start_date else None,
+        end_date.isoformat() if end_date else None,
+        mode if query else "keyword"
+    )
+
+
+def _searches(session_state: MutableMapping) -> Dict[SearchKey, Dict]:
+    if "searches" not in session_state:
+        session_state["searches"] = {}
+    return session_state["searches"]
+
+
+def _evict(es, searches: Dict[SearchKey, Dict], version: Optional[str]):
+    """移除過期、索引版本已改變或超出數量上限的搜尋，並關閉其PIT"""
+    now = time.time()
+    stale = [k for k, v in searches.items()
+             if now - v["created"] > SEARCH_TTL or v.get("index_version") != version]
+    for key in stale:
+        search.close_pit(es, searches.pop(key)["pit_id"])
+    while len(searches) > MAX_CACHED_SEARCHES:
+        oldest = min(searches, key=lambda k: searches[k]["last_used"])
+        search.close_pit(es, searches.pop(oldest)["pit_id"])
+
+
+def start_search(session_state: MutableMapping, es, query: str,
+                 start_date: Optional[date], end_date: Optional[date], mode: str = "keyword") -> Dict:
+    """執行搜尋並設為目前的搜尋；相同條件且索引版本未變的搜尋直接沿用session中的結果
+
+    Args:
+        session_state: st.session_state
+        es: Elasticsearch客戶端
+        query: 搜尋關鍵字
+        start_date: 開始日期
+        end_date: 結束日期
+        mode: 搜尋模式，語意與混合模式依相關度排序
+
+    Returns:
+        Dict: 搜尋狀態
+    """
+    key = normalize_key(query, start_date, end_date, mode)
+    searches = _searches(session_state)
+    # 重新匯入後索引版本改變，舊結果（文件集合與PIT）一律捨棄
+    version = query_cache.read_index_version()
+    _evict(es, searches, version)
+
+    state = searches.get(key)
+    if state is None and key[3] != "keyword":
+        # 依相關度排序的結果筆數有上限，一次取得所有ID，翻頁時只取該頁的顯示欄位
+        ids = search.ranked_ids(es, key[0], start_date, end_date, key[3])
+        state = {
+            "query_text": key[0],
+            "ids": ids,
+            "total": len(ids),
+            "pit_id": None,
+            "pages": {},
+            "index_version": version,
+            "created": time.time(),
+            "last_used": time.time()
+        }
+        searches[key] = state
+        _evict(es, searches, version)
+    elif state is None:
+        es_query = search.build_query(key[0], start_date, end_date)
+        pit_id = search.open_pit(es)
+        first = search.fetch_page(es, es_query, pit_id=pit_id)
+        state = {
+            "query": es_query,
+            "pit_id": first["pit_id"],
+            "total": first["total"],
+            # cursors[i] 為第 i+1 頁的 search_after
+            "cursors": [None, first["next_cursor"]],
+            "pages": {1: first["hits"]},
+            "index_version": version,
+            "created": time.time(),
+            "last_used": time.time()
+        }
+        searches[key] = state
+        _evict(es, searches, version)
+    else:
+        logger.info(f"沿用已快取的搜尋結果：{key}")
+
+    state["last_used"] = time.time()
+    session_state["active_search"] = key
+    return state
+
+
+def get_active_search(session_state: MutableMapping) -> Optional[Dict]:
+    """取得目前的搜尋狀態，不存在或已過期時回傳 None"""
+    key = session_state.get("active_search")
+    if key is None:
+        return None
+    return _searches(session_state).get(key)
+
+
+def get_page(es, state: Dict, page_number: int) -> List[Dict]:
+    """取得指定頁的結果；已看過的頁直接回傳，下一頁以儲存的cursor查詢
+
+    Args:
+        es: Elasticsearch客戶端
+        state: start_search 回傳的搜尋狀態
+        page_number: 頁碼（從 1 開始）
+
+    Returns:
+        List[Dict]: 該頁的搜尋結果
+    """
+    state["last_used"] = time.time()
+    if page_number in state["pages"]:
+        return state["pages"][page_number]
+
+    if "ids" in state:
+        start = (page_number - 1) * search.PAGE_SIZE
+        hits = search.fetch_ranked_page(es, state["ids"][start:start + search.PAGE_SIZE], state["query_text"])
+        state["pages"][page_number] = hits
+        return hits
+
+    # 只能從已知cursor往後一頁一頁取得
+    while len(state["cursors"]) < page_number:
+        get_page(es, state, len(state["cursors"]))
+
+    page = search.fetch_page(
+        es, state["query"],
+        search_after=state["cursors"][page_number - 1],
+        pit_id=state["pit_id"],
+        track_total_hits=False
+    )
+    state["pit_id"] = page["pit_id"]
+    state["pages"][page_number] = page["hits"]
+    if len(state["cursors"]) == page_number:
+        state["cursors"].append(page["next_cursor"])
+    return page["hits"]
@@ -1,23 +1,113 @@
 import zipfile
 import os
+import io
+import hashlib
+import re
+import zlib
 import shutil
 import json
 import pandas as pd
 import datetime
-from elasticsearch import Elasticsearch
+import time
+from elasticsearch import NotFoundError
+from elasticsearch.helpers import scan
 from contextlib import contextmanager
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
 import logging
 
+from bulk_writer import bulk_write
+import es_client
+import query_cache
+import media_copy
+import media_manifest
+import media_store
+import analyzers
+import suggest
+import analytics
+import local_index
+import search_backend
+import metrics
+import embeddings
+
 # 定義常數
-BASE_DIR = "/app"
+BASE_DIR = os.getenv("APP_BASE_DIR", "/app")  # 容器內為 /app，效能測試時指向暫存目錄
 IG_DATA_DIR = os.path.join(BASE_DIR, "ig_data")
 MEDIA_DIR = os.path.join(BASE_DIR, "media")
 LOGS_DIR = os.path.join(BASE_DIR, "logs")
 EXTRACT_PATH = os.path.join(IG_DATA_DIR, "tmp_extract")
-POSTS_JSON_PATH = os.path.join(EXTRACT_PATH, "your_instagram_activity", "content", "posts_1.json")
-ES_HOST = "http://elasticsearch:9200"
-ES_INDEX = "ig_data"
+POSTS_JSON_DIR = os.path.join(EXTRACT_PATH, "your_instagram_activity", "content")
+POSTS_JSON_PATTERN = re.compile(r"posts_(\d+)\.json$")
+ZIP_POSTS_JSON_PATTERN = re.compile(r"(?:^|/)your_instagram_activity/content/posts_(\d+)\.json$")
+JSON_READ_CHUNK = 64 * 1024  # 串流解析JSON時每次讀取的字元數
+MEDIA_COPY_CHUNK = 1024 * 1024  # 串流寫出媒體檔時每次讀取的位元組數
+# 搬移或寫入媒體檔時平行處理的執行緒數
+MEDIA_COPY_WORKERS = int(os.getenv("MEDIA_COPY_WORKERS", "8"))
+# 以內容雜湊儲存媒體檔（media/store），重複的內容只保留一份；關閉時沿用 media/posts 目錄結構
+MEDIA_STORE = os.getenv("MEDIA_STORE", "true").lower() == "true"
+# 匯入時檢查媒體檔（驗證、尺寸、縮圖）的執行緒數
+MEDIA_INSPECT_WORKERS = int(os.getenv("MEDIA_INSPECT_WORKERS", "4"))
+# 匯入模式："zip" 直接從ZIP讀取（預設），"extract" 先解壓縮到暫存目錄（舊流程）
+INGEST_MODE = os.getenv("INGEST_MODE", "zip")
+ES_INDEX = "ig_data"  # 搜尋端使用的別名，實際資料存放在 ig_data_v<時間戳> 版本索引
+# 保留幾個舊版本索引以便回滾
+INDEX_VERSIONS_TO_KEEP = int(os.getenv("INDEX_VERSIONS_TO_KEEP", "1"))
+# 匯入完成後的副本數（單節點叢集維持 0）
+INDEX_REPLICAS = int(os.getenv("INDEX_REPLICAS", "0"))
+# 強制重建新版本索引，而非增量更新目前版本
+REBUILD_INDEX = os.getenv("REBUILD_INDEX", "false").lower() == "true"
+# 新版本載入完成後是否合併為單一segment
+INDEX_FORCE_MERGE = os.getenv("INDEX_FORCE_MERGE", "true").lower() == "true"
+FORCE_MERGE_TIMEOUT = 600  # 合併segment的請求逾時秒數
+
+# 索引mapping版本，變更 INDEX_MAPPINGS 時遞增，既有索引會自動重建
+MAPPING_VERSION = 6
+INDEX_MAPPINGS = {
+    "_meta": {"mapping_version": MAPPING_VERSION},
+    "properties": {
+        # 分析器依 CONTENT_ANALYZER 設定，建立索引時由 build_index_body 填入
+        "content": analyzers.content_field_mapping(analyzers.FALLBACK_ANALYZER),
+        "datetime": {"type": "date"},
+        "timestamp": {"type": "date"},
+        # 發文的星期（1～7）與小時，供分析頁統計
+        "weekday": {"type": "byte"},
+        "hour": {"type": "byte"},
+        # 媒體資訊只用於顯示，不建立索引
+        "media": {"type": "object", "enabled": False},
+        "content_hash": {"type": "keyword"},
+        # 與 _id 相同，供 search_after 翻頁時作為排序決勝欄位
+        "doc_id": {"type": "keyword"},
+        # 從內文擷取的hashtag、店名、菜名，以及自動完成用的 completion 欄位
+        **suggest.SUGGEST_MAPPINGS
+    }
+}
+# 建立索引時的固定設定；依發文時間排序儲存，讓依 datetime 排序的查詢可提早結束
+INDEX_SETTINGS = {
+    "number_of_shards": 1,
+    "sort.field": "datetime",
+    "sort.order": "desc"
+}
+# 大量載入期間的設定：關閉refresh與副本、translog非同步寫入
+BULK_LOAD_SETTINGS = {
+    "refresh_interval": "-1",
+    "number_of_replicas": 0,
+    "translog.durability": "async"
+}
+# 載入完成後恢復的設定
+SERVING_SETTINGS = {
+    "refresh_interval": "1s",
+    "number_of_replicas": INDEX_REPLICAS,
+    "translog.durability": "request"
+}
+
+# 批次寫入設定（可由環境變數調整）
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_MAX_CHUNK_BYTES = int(os.getenv("BULK_MAX_CHUNK_BYTES", str(10 * 1024 * 1024)))
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "1"))
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "3"))
+# 寫入失敗的文件超過此數量時匯入視為失敗：新版本索引不切換別名（搜尋端繼續使用舊版本），增量更新則回報錯誤
+BULK_MAX_FAILED = int(os.getenv("BULK_MAX_FAILED", "0"))
+# 重新匯入時是否刪除新匯出檔中已不存在的貼文
+SYNC_DELETE_MISSING = os.getenv("SYNC_DELETE_MISSING", "true").lower() == "true"
 
 # 初始化logging（先不建立檔案，等目錄檢查完成後再設定）
 logger = logging.getLogger(__name__)
@@ -26,12 +116,65 @@ logger.setLevel(logging.INFO)
 
 @contextmanager
 def elasticsearch_client():
-    """建立Elasticsearch客戶端的上下文管理器"""
-    client = Elasticsearch(ES_HOST)
-    try:
-        yield client
-    finally:
-        client.close()
+    """取得共用Elasticsearch客戶端的上下文管理器（與搜尋介面共用連線池，離開時不關閉）"""
+    yield es_client.get_client()
+
+class IngestProgress:
+    """匯入進度回報介面，預設不做任何事；背景匯入工作以子類別記錄進度
+    
+    階段名稱：extract（從ZIP寫出檔案）、parse（解析JSON）、copy（搬移解壓縮的媒體檔）、
+    media（媒體清單與縮圖）、index（寫入Elasticsearch）、local（建立本機索引）、cleanup（清除暫存檔）
+    """
+    
+    def start(self, stage: str, total: Optional[int] = None):
+        pass
+    
+    def advance(self, stage: str, items: int = 1, nbytes: int = 0):
+        pass
+    
+    def finish(self, stage: str):
+        pass
+    
+    def track(self, stage: str, items: Iterable) -> Iterator:
+        """逐筆傳遞資料並計入進度"""
+        for item in items:
+            self.advance(stage)
+            yield item
+    
+    def file_callback(self, stage: str) -> Callable[[int], None]:
+        """產生每處理一個檔案呼叫一次的回呼函數"""
+        return lambda nbytes: self.advance(stage, 1, nbytes)
+
+INGEST_STAGE_SECONDS = metrics.histogram("ingest_stage_seconds", "匯入各階段耗時（秒）")
+INGEST_ITEMS = metrics.counter("ingest_items_total", "匯入各階段處理的項目數（貼文、檔案）")
+INGEST_BYTES = metrics.counter("ingest_bytes_total", "匯入各階段處理的位元組數")
+INGEST_RATE = metrics.gauge("ingest_items_per_second", "最近一次匯入各階段的處理速率")
+
+class MeteredProgress(IngestProgress):
+    """將各階段的耗時、項目數與速率記錄到效能指標，再轉給原本的進度回報"""
+    
+    def __init__(self, inner: IngestProgress):
+        self.inner = inner
+        self._started: Dict[str, float] = {}
+        self._items: Dict[str, int] = {}
+    
+    def start(self, stage: str, total: Optional[int] = None):
+        self._started[stage] = time.perf_counter()
+        self._items[stage] = 0
+        self.inner.start(stage, total)
+    
+    def advance(self, stage: str, items: int = 1, nbytes: int = 0):
+        self._items[stage] = self._items.get(stage, 0) + items
+        INGEST_ITEMS.inc(items, stage=stage)
+        if nbytes:
+            INGEST_BYTES.inc(nbytes, stage=stage)
+        self.inner.advance(stage, items, nbytes)
+    
+    def finish(self, stage: str):
+        elapsed = time.perf_counter() - self._started.get(stage, time.perf_counter())
+        INGEST_STAGE_SECONDS.observe(elapsed, stage=stage)
+        INGEST_RATE.set(self._items.get(stage, 0) / elapsed if elapsed > 0 else 0.0, stage=stage)
+        self.inner.finish(stage)
 
 def check_directory_structure():
     """檢查並建立必要的目錄結構"""
@@ -57,10 +200,12 @@ def check_directory_structure():
             except Exception as e:
                 raise PermissionError(f"目錄 {directory} 無法寫入: {e}")
 
-        # 確認所有目錄都存在且可寫入後，添加檔案日誌處理器
-        file_handler = logging.FileHandler(os.path.join(LOGS_DIR, "setup.log"))
-        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-        logger.addHandler(file_handler)
+        # 確認所有目錄都存在且可寫入後，添加檔案日誌處理器（背景工作重複呼叫時只加一次）
+        log_path = os.path.abspath(os.path.join(LOGS_DIR, "setup.log"))
+        if not any(getattr(h, "baseFilename", None) == log_path for h in logger.handlers):
+            file_handler = logging.FileHandler(log_path)
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            logger.addHandler(file_handler)
                 
         logger.info("✅ 目錄結構檢查完成")
         return True
@@ -92,11 +237,12 @@ def find_zip_file(zip_path: str = None) -> str:
     
     return os.path.join(IG_DATA_DIR, zip_files[0])
 
-def extract_zip(zip_path: str):
+def extract_zip(zip_path: str, on_file: Optional[Callable[[int], None]] = None):
     """解壓縮Instagram資料檔案
     
     Args:
         zip_path: zip檔案的路徑
+        on_file: 每解壓一個成員呼叫一次，參數為檔案大小（回報進度用）
     """
     logger.info(f"正在處理：{zip_path}")
     try:
@@ -107,7 +253,14 @@ def extract_zip(zip_path: str):
         
         # 解壓檔案
         with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(EXTRACT_PATH)
+            for info in zip_ref.infolist():
+                path = zip_ref.extract(info, EXTRACT_PATH)
+                if not info.is_dir():
+                    # 沿用ZIP中的修改時間，重新匯入時縮圖路徑（依大小與修改時間命名）維持不變
+                    mtime = time.mktime(info.date_time + (0, 0, -1))
+                    os.utime(path, (mtime, mtime))
+                if on_file:
+                    on_file(info.file_size)
         
         # 設置解壓後目錄的權限
         for root, dirs, files in os.walk(EXTRACT_PATH):
@@ -125,186 +278,788 @@ def extract_zip(zip_path: str):
         logger.error(f"解壓或設置權限時發生錯誤: {e}")
         raise
 
-def process_instagram_data() -> List[Dict]:
-    """處理Instagram JSON資料
+def iter_json_array(fp: TextIO, read_size: int = JSON_READ_CHUNK) -> Iterator:
+    """逐一解析頂層JSON陣列中的元素，不需將整個檔案載入記憶體
     
-    Returns:
-        List[Dict]: 處理後的Instagram資料列表
+    Args:
+        fp: 以文字模式開啟的檔案物件
+        read_size: 每次讀取的字元數
+    
+    Yields:
+        陣列中的每個元素
     
     Raises:
-        FileNotFoundError: 當找不到posts_1.json檔案時
+        ValueError: 當檔案不是JSON陣列或格式錯誤時
     """
-    if not os.path.exists(POSTS_JSON_PATH):
-        raise FileNotFoundError(f"找不到檔案：{POSTS_JSON_PATH}")
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    
+    while True:
+        # 略過空白與元素間的逗號
+        while pos < len(buffer) and (buffer[pos].isspace() or (started and buffer[pos] == ",")):
+            pos += 1
+        
+        if pos >= len(buffer):
+            chunk = fp.read(read_size)
+            if not chunk:
+                raise ValueError("JSON陣列未正確結束")
+            buffer, pos = chunk, 0
+            continue
         
-    with open(POSTS_JSON_PATH, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("posts JSON 的頂層必須是陣列")
+            started = True
+            pos += 1
+            continue
+        
+        if buffer[pos] == "]":
+            return
+        
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # 元素被切在緩衝區邊界，讀入更多內容後重試
+            chunk = fp.read(read_size)
+            if not chunk:
+                raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        
+        # 數字可能被切在緩衝區邊界（例如 "1" 與 ".5"），需看到分隔字元或檔案結尾後才算完整；
+        # 其他元素剛好結束在緩衝區尾端時同樣先補讀再解析一次
+        number = buffer[pos] in "-0123456789"
+        if end >= len(buffer) or (number and not (buffer[end].isspace() or buffer[end] in ",]")):
+            chunk = fp.read(read_size)
+            if chunk:
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+        
+        yield item
+        pos = end
+        # 丟棄已解析的內容，讓緩衝區維持在小範圍
+        if pos > read_size:
+            buffer, pos = buffer[pos:], 0
+
+def find_posts_json_files(content_dir: str = POSTS_JSON_DIR) -> List[str]:
+    """依序號排序，找出所有 posts_N.json 檔案
+    
+    Args:
+        content_dir: Instagram匯出資料中的content目錄
+    
+    Returns:
+        List[str]: posts_1.json、posts_2.json…的完整路徑
+    
+    Raises:
+        FileNotFoundError: 當找不到任何posts_N.json檔案時
+    """
+    if not os.path.isdir(content_dir):
+        raise FileNotFoundError(f"找不到目錄：{content_dir}")
+    
+    matches = []
+    for name in os.listdir(content_dir):
+        match = POSTS_JSON_PATTERN.match(name)
+        if match:
+            matches.append((int(match.group(1)), os.path.join(content_dir, name)))
+    
+    if not matches:
+        raise FileNotFoundError(f"在 {content_dir} 找不到 posts_N.json 檔案")
+    return [path for _, path in sorted(matches)]
 
-    content = []
-    for item in data:
+def fix_mojibake(text: str) -> str:
+    """修正Instagram匯出時以latin1編碼的UTF-8文字
+    
+    Args:
+        text: 原始文字
+    
+    Returns:
+        str: 修正後的文字，無法修正時回傳原文
+    """
+    try:
+        return text.encode('latin1').decode('utf-8')
+    except UnicodeError:
+        return text
+
+def rewrite_media_uri(uri: str) -> str:
+    """將匯出檔中的媒體路徑改寫為 media/posts/[date]/[filename]
+    
+    Args:
+        uri: 原始媒體路徑
+    
+    Returns:
+        str: 改寫後的路徑
+    """
+    # 提取檔案名稱和日期目錄
+    parts = uri.split('/')
+    filename = parts[-1]
+    date_dir = parts[-2] if len(parts) > 1 else None
+    
+    # 組合新的路徑
+    if date_dir:
+        return os.path.join("media", "posts", date_dir, filename)
+    return os.path.join("media", "posts", filename)
+
+def process_post(item: Dict) -> Dict:
+    """將一筆posts JSON資料轉為索引用格式
+    
+    Args:
+        item: posts_N.json 中的一筆資料
+    
+    Returns:
+        Dict: 含 media、title、creation_timestamp 的資料
+    
+    Raises:
+        KeyError: 當缺少必要欄位時
+    """
+    processed_media = []
+    for media_item in item.get("media", []):
+        uri = media_item.get("uri", "")
+        if uri:
+            media_item["uri"] = rewrite_media_uri(uri)
+        processed_media.append(media_item)
+    
+    return {
+        "media": processed_media,
+        "title": fix_mojibake(item["title"]),
+        "creation_timestamp": datetime.datetime.fromtimestamp(item["creation_timestamp"]).isoformat()
+    }
+
+def iter_posts(fp: TextIO, failures: Optional[List[str]] = None) -> Iterator[Dict]:
+    """串流解析單一posts JSON檔案並逐筆轉換
+    
+    Args:
+        fp: 以文字模式開啟的posts JSON檔案
+        failures: 提供時記錄無法處理的貼文（錯誤訊息），供同步時判斷是否可刪除缺少的貼文
+    
+    Yields:
+        Dict: 處理後的Instagram資料
+    """
+    for item in iter_json_array(fp):
         try:
-            # 修改media路徑，添加posts前綴
-            media_list = item.get("media", [])
-            processed_media = []
-            for media_item in media_list:
-                uri = media_item.get("uri", "")
-                if uri:
-                    # 提取檔案名稱和日期目錄
-                    parts = uri.split('/')
-                    filename = parts[-1]
-                    date_dir = parts[-2] if len(parts) > 1 else None
-                    
-                    # 組合新的路徑
-                    if date_dir:
-                        media_item["uri"] = os.path.join("media", "posts", date_dir, filename)
-                    else:
-                        media_item["uri"] = os.path.join("media", "posts", filename)
-                processed_media.append(media_item)
-                
-            content.append({
-                "media": processed_media,
-                "title": item["title"].encode('latin1').decode('utf-8'),
-                "creation_timestamp": datetime.datetime.fromtimestamp(item["creation_timestamp"]).isoformat()
-            })
-        except (KeyError, UnicodeError) as e:
+            yield process_post(item)
+        except (KeyError, TypeError, AttributeError, ValueError, OverflowError) as e:
             logger.warning(f"處理資料時發生錯誤: {str(e)}")
+            if failures is not None:
+                failures.append(str(e))
             continue
 
-    return content
+def iter_instagram_data(content_dir: str = POSTS_JSON_DIR, failures: Optional[List[str]] = None) -> Iterator[Dict]:
+    """依序串流處理所有 posts_N.json，記憶體用量不隨資料量成長
+    
+    Args:
+        content_dir: Instagram匯出資料中的content目錄
+        failures: 記錄無法處理的貼文，見 iter_posts
+    
+    Yields:
+        Dict: 處理後的Instagram資料
+    """
+    for path in find_posts_json_files(content_dir):
+        logger.info(f"正在解析：{os.path.basename(path)}")
+        with open(path, 'r', encoding='utf-8') as f:
+            yield from iter_posts(f, failures)
+
+def find_posts_json_members(zf: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    """依序號排序，找出ZIP中所有 posts_N.json 成員
+    
+    Args:
+        zf: 已開啟的Instagram匯出ZIP檔
+    
+    Returns:
+        List[zipfile.ZipInfo]: posts_1.json、posts_2.json…的成員資訊
+    
+    Raises:
+        FileNotFoundError: 當ZIP中找不到任何posts_N.json時
+    """
+    matches = []
+    for info in zf.infolist():
+        match = ZIP_POSTS_JSON_PATTERN.search(info.filename)
+        if match and not info.is_dir():
+            matches.append((int(match.group(1)), info))
+    
+    if not matches:
+        raise FileNotFoundError("ZIP 中找不到 your_instagram_activity/content/posts_N.json")
+    return [info for _, info in sorted(matches, key=lambda m: m[0])]
+
+def iter_instagram_data_from_zip(zf: zipfile.ZipFile, failures: Optional[List[str]] = None) -> Iterator[Dict]:
+    """直接從ZIP串流處理所有 posts_N.json，不解壓縮到磁碟
+    
+    Args:
+        zf: 已開啟的Instagram匯出ZIP檔
+        failures: 記錄無法處理的貼文，見 iter_posts
+    
+    Yields:
+        Dict: 處理後的Instagram資料
+    """
+    for info in find_posts_json_members(zf):
+        logger.info(f"正在解析：{info.filename}")
+        with zf.open(info) as raw:
+            yield from iter_posts(io.TextIOWrapper(raw, encoding='utf-8'), failures)
+
+def collect_media_uris(items: Iterable[Dict]) -> Set[str]:
+    """收集資料中引用到的所有媒體路徑（只保留路徑，不保留資料本身）
+    
+    Args:
+        items: 處理後的Instagram資料
+    
+    Returns:
+        Set[str]: 改寫後的媒體路徑
+    """
+    media_uris = set()
+    for item in items:
+        media_uris.update(m["uri"] for m in item["media"] if m.get("uri"))
+    return media_uris
+
+def _file_crc32(path: str) -> int:
+    """計算檔案的CRC32"""
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(MEDIA_COPY_CHUNK)
+            if not chunk:
+                break
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+def _same_as_member(path: str, info: zipfile.ZipInfo) -> bool:
+    """判斷目的地檔案是否已與ZIP成員相同（大小與CRC皆相符）"""
+    try:
+        if os.path.getsize(path) != info.file_size:
+            return False
+        return _file_crc32(path) == info.CRC
+    except OSError:
+        return False
+
+def map_media_members(zf: zipfile.ZipFile) -> Dict[str, zipfile.ZipInfo]:
+    """以改寫後的路徑對應ZIP中的媒體成員（ZIP內可能有額外的上層目錄）
+    
+    Args:
+        zf: 已開啟的Instagram匯出ZIP檔
+    
+    Returns:
+        Dict[str, zipfile.ZipInfo]: {改寫後的媒體路徑: 成員資訊}
+    """
+    members = {}
+    for info in zf.infolist():
+        if not info.is_dir() and "media/posts/" in info.filename:
+            members[rewrite_media_uri(info.filename)] = info
+    return members
+
+def extract_media_from_zip(zf: zipfile.ZipFile, media_uris: Iterable[str],
+                           on_file: Optional[Callable[[int], None]] = None) -> Dict:
+    """只將資料引用到的媒體成員一次寫到 media/posts/... 的最終位置
+    
+    Args:
+        zf: 已開啟的Instagram匯出ZIP檔
+        media_uris: 改寫後的媒體路徑（例如 media/posts/202301/xxx.jpg）
+        on_file: 每處理一個媒體檔呼叫一次，參數為寫入的位元組數（回報進度用）
+    
+    Returns:
+        Dict: 統計結果 {"written", "skipped", "missing", "bytes"}
+    """
+    members = map_media_members(zf)
+    stats = {"written": 0, "skipped": 0, "missing": 0, "bytes": 0}
+    media_root = os.path.realpath(MEDIA_DIR)
+    for uri in sorted(media_uris):
+        info = members.get(uri)
+        if info is None:
+            stats["missing"] += 1
+            logger.warning(f"ZIP 中找不到媒體檔：{uri}")
+            continue
+        
+        dst = os.path.realpath(os.path.join(BASE_DIR, uri))
+        if not dst.startswith(media_root + os.sep):
+            logger.warning(f"略過不安全的媒體路徑：{uri}")
+            continue
+        
+        if _same_as_member(dst, info):
+            stats["skipped"] += 1
+            if on_file:
+                on_file(0)
+            continue
+        
+        dst_dir = os.path.dirname(dst)
+        if not os.path.isdir(dst_dir):
+            os.makedirs(dst_dir, exist_ok=True)
+            os.chmod(dst_dir, 0o777)
+        
+        # 先寫到暫存檔再改名，避免中斷時留下不完整的檔案
+        tmp_path = dst + ".part"
+        with zf.open(info) as fsrc, open(tmp_path, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, MEDIA_COPY_CHUNK)
+        os.chmod(tmp_path, 0o666)
+        os.replace(tmp_path, dst)
+        stats["written"] += 1
+        stats["bytes"] += info.file_size
+        if on_file:
+            on_file(info.file_size)
+    
+    logger.info(f"📁 媒體檔寫入 {stats['written']} 個（{stats['bytes'] / 1024 / 1024:.1f} MB），"
+                f"略過未變更 {stats['skipped']} 個，缺少 {stats['missing']} 個")
+    return stats
+
+def process_instagram_data() -> List[Dict]:
+    """處理Instagram JSON資料
+    
+    Returns:
+        List[Dict]: 處理後的Instagram資料列表
+    
+    Raises:
+        FileNotFoundError: 當找不到posts_N.json檔案時
+    """
+    return list(iter_instagram_data())
+
+def get_alias_target(es) -> str:
+    """取得別名目前指向的實體索引
+    
+    Args:
+        es: Elasticsearch客戶端
+    
+    Returns:
+        str: 實體索引名稱，別名不存在時回傳 None
+    """
+    try:
+        targets = es.indices.get_alias(name=ES_INDEX)
+    except NotFoundError:
+        return None
+    return sorted(targets.keys())[-1] if targets else None
+
+def list_index_versions(es) -> List[str]:
+    """列出所有版本索引，由新到舊排序"""
+    try:
+        indices = es.indices.get(index=f"{ES_INDEX}_v*")
+    except NotFoundError:
+        return []
+    return sorted(indices.keys(), reverse=True)
+
+def get_index_meta(es, index: str) -> Dict:
+    """讀取索引mapping中記錄的 _meta（mapping版本、分析器與向量模型），舊索引沒有記錄時回傳空字典"""
+    mappings = es.indices.get_mapping(index=index)
+    # 以別名查詢時回應的鍵為實體索引名稱
+    return next(iter(mappings.values()))["mappings"].get("_meta", {})
+
+def embedding_model() -> Optional[str]:
+    """依設定要寫入的向量模型名稱，未啟用語意搜尋時為 None"""
+    return embeddings.model_name() if embeddings.SEMANTIC_SEARCH else None
 
-def setup_elasticsearch_index():
-    """設置Elasticsearch索引"""
+def build_index_body(analyzer: str, embedding_model: Optional[str] = None) -> Dict:
+    """組合建立版本索引的 settings 與 mappings
+    
+    Args:
+        analyzer: content 欄位使用的分析器（analyzers.resolve_analyzer 的結果）
+        embedding_model: 向量模型名稱，提供時加入 dense_vector 欄位
+    
+    Returns:
+        Dict: es.indices.create 的 body
+    """
+    mappings = json.loads(json.dumps(INDEX_MAPPINGS))
+    mappings["_meta"]["content_analyzer"] = analyzer
+    mappings["properties"]["content"] = analyzers.content_field_mapping(analyzer)
+    if embedding_model:
+        mappings["_meta"]["embedding_model"] = embedding_model
+        mappings["properties"][embeddings.VECTOR_FIELD] = embeddings.vector_mapping(
+            embeddings.get_embedder(embedding_model).dims
+        )
+    analysis = json.loads(json.dumps(suggest.SUGGEST_ANALYSIS))
+    for section, components in analyzers.analysis_settings(analyzer).items():
+        analysis.setdefault(section, {}).update(components)
+    settings = {"index": {**INDEX_SETTINGS, **BULK_LOAD_SETTINGS}, "analysis": analysis}
+    return {"settings": settings, "mappings": mappings}
+
+def create_index_version(es) -> str:
+    """建立新的版本索引，並以適合大量寫入的設定開始載入
+    
+    Args:
+        es: Elasticsearch客戶端
+    
+    Returns:
+        str: 新版本索引名稱
+    """
+    index = f"{ES_INDEX}_v{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}"
+    suffix = 1
+    while es.indices.exists(index=index):
+        index = f"{index.split('-')[0]}-{suffix}"
+        suffix += 1
+    
+    analyzer = analyzers.resolve_analyzer(es)
+    model = embedding_model()
+    es.indices.create(index=index, body=build_index_body(analyzer, model))
+    logger.info(f"✅ 版本索引 '{index}' 已建立（content 分析器：{analyzer}，向量模型：{model or '無'}）")
+    return index
+
+def setup_elasticsearch_index(rebuild: bool = REBUILD_INDEX) -> Tuple[str, bool]:
+    """決定本次匯入要寫入的實體索引
+    
+    別名已存在時直接增量更新目前版本；別名不存在、舊版以實體索引命名為
+    ig_data、或指定重建時，建立新的版本索引，待載入完成後再切換別名。
+    
+    Args:
+        rebuild: 是否強制建立新版本索引
+    
+    Returns:
+        Tuple[str, bool]: (要寫入的實體索引名稱, 是否為新建版本)
+    """
     with elasticsearch_client() as es:
         if not es.ping():
             raise ConnectionError("無法連接到Elasticsearch")
         
         logger.info("✅ 成功連接 Elasticsearch")
 
-        # 如果索引已經存在，則刪除
-        if es.indices.exists(index=ES_INDEX):
-            es.indices.delete(index=ES_INDEX)
+        target = get_alias_target(es)
+        if target and not rebuild:
+            meta = get_index_meta(es, target)
+            mapping_version = meta.get("mapping_version")
+            if mapping_version != MAPPING_VERSION:
+                logger.info(f"'{target}' 的mapping版本為 {mapping_version}，需要 {MAPPING_VERSION}，重建索引")
+                return create_index_version(es), True
+            analyzer = analyzers.resolve_analyzer(es)
+            if meta.get("content_analyzer") != analyzer:
+                logger.info(f"'{target}' 的分析器為 {meta.get('content_analyzer')}，需要 {analyzer}，重建索引")
+                return create_index_version(es), True
+            model = embedding_model()
+            if meta.get("embedding_model") != model:
+                logger.info(f"'{target}' 的向量模型為 {meta.get('embedding_model')}，需要 {model}，重建索引")
+                return create_index_version(es), True
+            logger.info(f"別名 '{ES_INDEX}' 指向 '{target}'，進行增量更新")
+            return target, False
+        
+        return create_index_version(es), True
 
-        # 創建新索引
-        es.indices.create(index=ES_INDEX, body={
-            "settings": {
-                "number_of_shards": 1,
-                "number_of_replicas": 0
-            },
-            "mappings": {
-                "properties": {
-                    "content": {"type": "text"},
-                    "creation_timestamp": {"type": "date"}
-                }
-            }
-        })
-        logger.info(f"✅ 索引 '{ES_INDEX}' 已建立")
+def publish_index_version(index: str):
+    """恢復索引設定、強制refresh（可選擇合併segment），並以原子操作將別名切換到新版本
+    
+    Args:
+        index: 新版本索引名稱
+    """
+    with elasticsearch_client() as es:
+        es.indices.put_settings(index=index, body={"index": SERVING_SETTINGS})
+        es.indices.refresh(index=index)
+        if INDEX_FORCE_MERGE:
+            es.options(request_timeout=FORCE_MERGE_TIMEOUT).indices.forcemerge(index=index, max_num_segments=1)
+            logger.info(f"✅ '{index}' 已合併為單一segment")
+        
+        actions = [{"add": {"index": index, "alias": ES_INDEX}}]
+        old_target = get_alias_target(es)
+        if old_target:
+            actions.insert(0, {"remove": {"index": old_target, "alias": ES_INDEX}})
+        elif es.indices.exists(index=ES_INDEX):
+            # 舊版直接以 ig_data 為實體索引，切換時一併移除
+            actions.insert(0, {"remove_index": {"index": ES_INDEX}})
+        es.indices.update_aliases(body={"actions": actions})
+        logger.info(f"✅ 別名 '{ES_INDEX}' 已切換到 '{index}'")
+        
+        cleanup_old_index_versions(es, index)
 
-def import_data_to_elasticsearch(data: List[Dict]):
-    """將資料導入Elasticsearch
+def cleanup_old_index_versions(es, current: str, keep: int = INDEX_VERSIONS_TO_KEEP):
+    """刪除過舊的版本索引，保留最新的 keep 個舊版本供回滾
     
     Args:
-        data: 要導入的資料列表
+        es: Elasticsearch客戶端
+        current: 目前別名指向的版本
+        keep: 要保留的舊版本數量
+    """
+    older = [name for name in list_index_versions(es) if name != current and name < current]
+    for name in older[keep:]:
+        es.indices.delete(index=name)
+        logger.info(f"🗑️ 已刪除舊版本索引 '{name}'")
+
+def rollback_index_version() -> str:
+    """將別名切回上一個保留的版本索引
+    
+    Returns:
+        str: 切換後的版本索引名稱
+    
+    Raises:
+        RuntimeError: 當沒有可回滾的舊版本時
     """
     with elasticsearch_client() as es:
-        for item in data:
-            doc = {
-                "content": item["title"],
-                "datetime": item["creation_timestamp"],
-                "timestamp": datetime.datetime.now().isoformat(),
-                "media": item["media"]
-            }
-            res = es.index(index=ES_INDEX, body=doc)
-            logger.info(f"✅ 文本已寫入，ID: {res['_id']}")
+        current = get_alias_target(es)
+        older = [name for name in list_index_versions(es) if current is None or name < current]
+        if not older:
+            raise RuntimeError("沒有可回滾的舊版本索引")
+        
+        actions = [{"add": {"index": older[0], "alias": ES_INDEX}}]
+        if current:
+            actions.insert(0, {"remove": {"index": current, "alias": ES_INDEX}})
+        es.indices.update_aliases(body={"actions": actions})
+        logger.info(f"↩️ 別名 '{ES_INDEX}' 已回滾到 '{older[0]}'")
+        return older[0]
 
-def copy_with_metadata(src: str, dst: str):
-    """複製檔案並保留metadata
+def make_doc_id(item: Dict) -> str:
+    """以發文時間與媒體路徑產生固定的文件ID，同一篇貼文每次匯入都相同
     
     Args:
-        src: 來源檔案路徑
-        dst: 目標檔案路徑
+        item: process_post 處理後的資料
+    
+    Returns:
+        str: 文件ID
     """
-    # 建立目標目錄（如果不存在）
-    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    # 使用匯出檔中的原始路徑，媒體改存到內容雜湊路徑後ID仍維持不變
+    uris = [m.get("source_uri", m.get("uri", "")) for m in item["media"]]
+    key = "|".join([item["creation_timestamp"]] + uris)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+# 內容雜湊只納入媒體清單中穩定的欄位；縮圖路徑由檔案修改時間決定，重新解壓縮時可能改變
+MANIFEST_HASH_FIELDS = ("size", "width", "height", "format", "kind", "valid")
+
+def hashable_media(media: List[Dict]) -> List[Dict]:
+    """計算內容雜湊用的媒體資訊（路徑、內容與尺寸），不含縮圖路徑"""
+    result = []
+    for media_item in media:
+        entry = {k: v for k, v in media_item.items() if k != "manifest"}
+        manifest = media_item.get("manifest")
+        if manifest is not None:
+            entry["manifest"] = {k: manifest.get(k) for k in MANIFEST_HASH_FIELDS}
+        result.append(entry)
+    return result
+
+def build_document(item: Dict) -> Dict:
+    """將處理後的資料轉為索引文件，並附上內容雜湊供增量比對
     
-    # 使用低層級檔案操作以確保更好的控制
-    with open(src, 'rb') as fsrc:
-        with open(dst, 'wb') as fdst:
-            while True:
-                chunk = fsrc.read(1024 * 1024)  # 1MB chunks
-                if not chunk:
-                    break
-                fdst.write(chunk)
+    Args:
+        item: process_post 處理後的資料
     
-    # 複製檔案權限
-    os.chmod(dst, 0o666)
+    Returns:
+        Dict: 索引文件（不含 timestamp）
+    """
+    doc = {
+        "content": item["title"],
+        "datetime": item["creation_timestamp"],
+        "media": item["media"],
+        **analytics.time_fields(item["creation_timestamp"]),
+        **suggest.build_suggest_fields(item["title"])
+    }
+    canonical = json.dumps({**doc, "media": hashable_media(doc["media"])}, ensure_ascii=False, sort_keys=True)
+    doc["content_hash"] = hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+    return doc
 
-def cleanup():
-    """清理暫存檔案和目錄"""
-    # 搬移媒體檔案
-    media_dir = os.path.join(EXTRACT_PATH, "media")
-    posts_dir = os.path.join(media_dir, "posts")
-    if os.path.exists(posts_dir):
-        try:
-            # 確保目標目錄存在
-            os.makedirs(MEDIA_DIR, exist_ok=True)
-            os.chmod(MEDIA_DIR, 0o777)
-            
-            target_posts_dir = os.path.join(MEDIA_DIR, "posts")
-            
-            # 如果目標目錄已存在，先移除
-            if os.path.exists(target_posts_dir):
-                for root, dirs, files in os.walk(target_posts_dir, topdown=False):
-                    for name in files:
-                        file_path = os.path.join(root, name)
-                        try:
-                            os.chmod(file_path, 0o666)
-                            os.remove(file_path)
-                        except OSError:
-                            pass
-                    for name in dirs:
-                        dir_path = os.path.join(root, name)
-                        try:
-                            os.chmod(dir_path, 0o777)
-                            os.rmdir(dir_path)
-                        except OSError:
-                            pass
-                try:
-                    os.rmdir(target_posts_dir)
-                except OSError:
-                    pass
-            
-            # 建立目標目錄
-            os.makedirs(target_posts_dir, exist_ok=True)
-            os.chmod(target_posts_dir, 0o777)
-            
-            # 複製所有檔案
-            for root, dirs, files in os.walk(posts_dir):
-                # 計算相對路徑
-                rel_path = os.path.relpath(root, posts_dir)
-                target_root = os.path.join(target_posts_dir, rel_path)
+def load_existing_hashes(es, index: str = ES_INDEX) -> Dict[str, str]:
+    """讀取索引中現有文件的 ID 與內容雜湊
+    
+    Args:
+        es: Elasticsearch客戶端
+        index: 索引名稱
+    
+    Returns:
+        Dict[str, str]: {文件ID: 內容雜湊}，舊版匯入的文件雜湊為空字串
+    """
+    if not es.indices.exists(index=index):
+        return {}
+    return {
+        hit["_id"]: hit.get("_source", {}).get("content_hash", "")
+        for hit in scan(es, index=index, query={"_source": ["content_hash"]}, size=1000)
+    }
+
+def import_data_to_elasticsearch(data: Iterable[Dict], index: str = ES_INDEX,
+                                 parse_failures: Optional[List[str]] = None) -> Dict:
+    """以固定ID增量同步資料到Elasticsearch，只寫入新增或變更的貼文
+    
+    Args:
+        data: 要導入的資料，可為產生器（邊解析邊寫入）
+        index: 要寫入的實體索引
+        parse_failures: 解析 data 時記錄失敗貼文的清單；讀完 data 後不為空時不刪除缺少的貼文，
+            因為無法處理的貼文算不出文件ID，會被誤判為已從匯出檔移除
+    
+    Returns:
+        Dict: 同步統計 {"added", "updated", "unchanged", "deleted", "indexed", "failed", "retried", "errors"}
+    """
+    timestamp = datetime.datetime.now().isoformat()
+    counts = {"added": 0, "updated": 0, "unchanged": 0, "deleted": 0}
+    
+    with elasticsearch_client() as es:
+        existing = load_existing_hashes(es, index)
+        seen = set()
+        
+        def actions():
+            for item in data:
+                doc_id = make_doc_id(item)
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
                 
-                # 建立目錄
-                os.makedirs(target_root, exist_ok=True)
-                os.chmod(target_root, 0o777)
+                doc = build_document(item)
+                old_hash = existing.get(doc_id)
+                if old_hash == doc["content_hash"]:
+                    counts["unchanged"] += 1
+                    continue
+                counts["added" if old_hash is None else "updated"] += 1
                 
-                # 複製檔案
-                for file in files:
-                    src_file = os.path.join(root, file)
-                    dst_file = os.path.join(target_root, file)
-                    try:
-                        copy_with_metadata(src_file, dst_file)
-                        logger.debug(f"複製檔案：{src_file} -> {dst_file}")
-                    except Exception as e:
-                        logger.warning(f"複製檔案失敗 {src_file}: {e}")
-                        continue
+                doc["doc_id"] = doc_id
+                doc["timestamp"] = timestamp
+                yield {"_index": index, "_id": doc_id, "_source": doc}
             
-            logger.info("複製完成並設置權限")
+            # 匯出檔中已不存在的貼文（沒有解析到任何資料或有貼文解析失敗時不刪除，避免誤刪）
+            if parse_failures:
+                logger.warning(f"有 {len(parse_failures)} 篇貼文解析失敗，本次不刪除匯出檔中缺少的貼文")
+            elif SYNC_DELETE_MISSING and seen:
+                for doc_id in existing.keys() - seen:
+                    counts["deleted"] += 1
+                    yield {"_op_type": "delete", "_index": index, "_id": doc_id}
+        
+        # 索引有向量欄位時，以建立索引時記錄的模型為新增或變更的貼文產生向量
+        try:
+            model = get_index_meta(es, index).get("embedding_model")
+        except NotFoundError:
+            model = None
+        stream = actions()
+        if model:
+            stream = embeddings.attach_vectors(stream, embeddings.VECTOR_FIELD, model)
+        
+        report = bulk_write(
+            es, stream,
+            chunk_size=BULK_CHUNK_SIZE,
+            max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+            workers=BULK_WORKERS,
+            max_retries=BULK_MAX_RETRIES
+        )
+        es.indices.refresh(index=index)
+    
+    report.update(counts)
+    logger.info(f"✅ 同步完成：新增 {counts['added']} 筆，更新 {counts['updated']} 筆，"
+                f"未變更 {counts['unchanged']} 筆，刪除 {counts['deleted']} 筆；"
+                f"失敗 {report['failed']} 筆，重試 {report['retried']} 次")
+    for error in report["errors"]:
+        logger.warning(f"寫入失敗：{error}")
+    return report
+
+def index_instagram_data(data: Iterable[Dict], parse_failures: Optional[List[str]] = None) -> Dict:
+    """將資料寫入索引：增量更新目前版本，或建立新版本後切換別名
+    
+    Args:
+        data: 要導入的資料，可為產生器
+        parse_failures: 解析 data 時記錄失敗貼文的清單，見 import_data_to_elasticsearch
+    
+    Returns:
+        Dict: 同步統計
+    
+    Raises:
+        RuntimeError: 寫入失敗的文件超過 BULK_MAX_FAILED 筆；新版本時已刪除新版本，
+            增量更新時已寫入的變更保留（查詢快取仍會失效）
+    """
+    index, is_new = setup_elasticsearch_index()
+    try:
+        report = import_data_to_elasticsearch(data, index, parse_failures)
+        if is_new and report["failed"] > BULK_MAX_FAILED:
+            raise RuntimeError(f"新版本索引有 {report['failed']} 筆文件寫入失敗（上限 {BULK_MAX_FAILED} 筆），"
+                               f"不切換版本，搜尋端仍使用原本的資料")
+    except Exception:
+        if is_new:
+            # 載入失敗時移除未完成的版本，別名仍指向舊版本
+            with elasticsearch_client() as es:
+                es.indices.delete(index=index, ignore_unavailable=True)
+        raise
+    
+    if is_new:
+        publish_index_version(index)
+    # 通知搜尋端的查詢快取失效
+    query_cache.bump_index_version(f"{index}@{datetime.datetime.now().isoformat()}")
+    if report["failed"] > BULK_MAX_FAILED:
+        # 增量更新無法回復，讓匯入工作標示為失敗，以便檢查錯誤後重新匯入
+        raise RuntimeError(f"增量更新有 {report['failed']} 筆文件寫入失敗（上限 {BULK_MAX_FAILED} 筆），"
+                           f"其餘變更已寫入，請檢查錯誤後重新匯入")
+    return report
+
+def build_local_index(data: Iterable[Dict]) -> Dict:
+    """以相同的索引文件建立不需Elasticsearch的本機索引
+    
+    Args:
+        data: 要導入的資料，可為產生器
+    
+    Returns:
+        Dict: 建立統計
+    """
+    docs = ({**build_document(item), "doc_id": make_doc_id(item)} for item in data)
+    version = f"local@{datetime.datetime.now().isoformat()}"
+    stats = local_index.build(docs, version=version)
+    query_cache.bump_index_version(version)
+    return stats
+
+def referenced_media_uris(es) -> Set[str]:
+    """所有保留的版本索引中文件引用的媒體路徑（回滾到舊版本時媒體檔仍須存在）"""
+    uris = set()
+    for index in list_index_versions(es):
+        for hit in scan(es, index=index, query={"_source": ["media.uri"]}, size=1000):
+            uris.update(m["uri"] for m in hit.get("_source", {}).get("media", []) if m.get("uri"))
+    return uris
+
+def collect_media_garbage(current_uris: Iterable[str]):
+    """發布成功後刪除媒體儲存區中沒有任何索引引用的內容
+    
+    Args:
+        current_uris: 本次匯入的文件引用的媒體路徑（本機索引每次整批重建，只引用這些路徑）
+    """
+    referenced = set(current_uris)
+    if search_backend.SEARCH_BACKEND != "local":
+        try:
+            with elasticsearch_client() as es:
+                referenced |= referenced_media_uris(es)
         except Exception as e:
-            logger.error(f"移動檔案時發生錯誤: {e}")
-            raise
+            # 無法確認哪些檔案仍被引用時不刪除任何檔案
+            logger.warning(f"無法讀取索引引用的媒體路徑，略過媒體儲存區清理：{e}")
+            return
+    media_store.collect_garbage(BASE_DIR, referenced)
+
+def publish_documents(make_items: Callable[[List[str]], Iterable[Dict]], progress: "IngestProgress"):
+    """依搜尋後端設定寫入Elasticsearch及（或）本機索引
+    
+    Args:
+        make_items: 每次呼叫產生一份處理後的資料（兩種索引各讀一次），解析失敗的貼文記錄到傳入的清單
+        progress: 進度回報
+    """
+    if search_backend.SEARCH_BACKEND != "local":
+        progress.start("index")
+        failures = []
+        index_instagram_data(progress.track("index", make_items(failures)), failures)
+        progress.finish("index")
+    if search_backend.SEARCH_BACKEND != "elasticsearch":
+        progress.start("local")
+        build_local_index(progress.track("local", make_items([])))
+        progress.finish("local")
+
+def copy_with_metadata(src: str, dst: str):
+    """複製檔案並設置權限（使用核心層級複製）
+    
+    Args:
+        src: 來源檔案路徑
+        dst: 目標檔案路徑
+    """
+    media_copy.fast_copy(src, dst)
+
+def move_extracted_media() -> Dict:
+    """將暫存目錄中的 media/posts 平行搬移到媒體目錄，完成後以改名切換新舊目錄
+    
+    Returns:
+        Dict: 搬移統計（檔案數、位元組數、MB/s），沒有媒體時為空字典
+    """
+    posts_dir = os.path.join(EXTRACT_PATH, "media", "posts")
+    if not os.path.exists(posts_dir):
+        return {}
+    
+    try:
+        # 確保目標目錄存在
+        os.makedirs(MEDIA_DIR, exist_ok=True)
+        os.chmod(MEDIA_DIR, 0o777)
         
-        logger.info(f"📁 資料已搬移到 {MEDIA_DIR} 並設置適當權限")
+        # 暫存目錄之後會刪除，同一檔案系統時直接改名搬移
+        stats = media_copy.replace_tree(
+            posts_dir, os.path.join(MEDIA_DIR, "posts"),
+            workers=MEDIA_COPY_WORKERS, move=True
+        )
+    except Exception as e:
+        logger.error(f"移動檔案時發生錯誤: {e}")
+        raise
     
+    logger.info(f"📁 資料已搬移到 {MEDIA_DIR} 並設置適當權限")
+    return stats
+
+def cleanup():
+    """搬移媒體檔後清理暫存檔案和目錄"""
+    move_extracted_media()
+    remove_temp_files()
+
+def remove_temp_files():
+    """清除暫存目錄與暫存JSON檔案"""
     # 清除暫存
     if os.path.exists(EXTRACT_PATH):
         shutil.rmtree(EXTRACT_PATH)
@@ -315,11 +1070,115 @@ def cleanup():
         os.remove(json_file)
         logger.info(f"已刪除：{json_file}")
 
-def process_instagram_zip(zip_path: str = None) -> tuple[bool, str]:
+def ingest_zip(zip_path: str, progress: IngestProgress = None):
+    """直接從ZIP讀取JSON並寫出需要的媒體檔，不經過暫存目錄
+    
+    Args:
+        zip_path: zip檔案的路徑
+        progress: 進度回報
+    """
+    progress = progress or IngestProgress()
+    logger.info(f"正在處理：{zip_path}")
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        # 第一輪只收集引用到的媒體路徑，先寫出媒體並建立清單
+        progress.start("parse")
+        media_uris = collect_media_uris(progress.track("parse", iter_instagram_data_from_zip(zf)))
+        progress.finish("parse")
+        
+        uri_map = None
+        if MEDIA_STORE:
+            members = map_media_members(zf)
+            missing = media_uris - members.keys()
+            for uri in sorted(missing)[:20]:
+                logger.warning(f"ZIP 中找不到媒體檔：{uri}")
+            needed = {uri: members[uri] for uri in media_uris - missing}
+            # 只寫入儲存區中還沒有的內容，文件中的媒體路徑改為內容雜湊路徑
+            progress.start("extract", total=len(needed))
+            uri_map, _ = media_store.import_from_zip(zip_path, BASE_DIR, needed, workers=MEDIA_COPY_WORKERS,
+                                                     on_file=progress.file_callback("extract"))
+            media_uris = set(uri_map.values())
+        else:
+            progress.start("extract", total=len(media_uris))
+            extract_media_from_zip(zf, media_uris, on_file=progress.file_callback("extract"))
+        progress.finish("extract")
+        
+        progress.start("media", total=len(media_uris))
+        manifest = media_manifest.build_manifest(BASE_DIR, media_uris, workers=MEDIA_INSPECT_WORKERS,
+                                                 on_file=progress.file_callback("media"))
+        progress.finish("media")
+        
+        def make_items(failures):
+            items = iter_instagram_data_from_zip(zf, failures)
+            if uri_map is not None:
+                items = media_store.rewrite_uris(items, uri_map)
+            return media_manifest.attach_manifest(items, manifest)
+        
+        # 第二輪邊解析邊寫入，媒體清單資訊一併存入文件
+        publish_documents(make_items, progress)
+    
+    if uri_map is not None:
+        progress.start("cleanup")
+        collect_media_garbage(media_uris)
+        progress.finish("cleanup")
+
+def ingest_extracted_zip(zip_path: str, progress: IngestProgress = None):
+    """舊流程：解壓縮到暫存目錄後再匯入並搬移媒體檔
+    
+    Args:
+        zip_path: zip檔案的路徑
+        progress: 進度回報
+    """
+    progress = progress or IngestProgress()
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        member_count = len(zf.infolist())
+    progress.start("extract", total=member_count)
+    extract_zip(zip_path, on_file=progress.file_callback("extract"))
+    progress.finish("extract")
+    
+    progress.start("parse")
+    media_uris = collect_media_uris(progress.track("parse", iter_instagram_data()))
+    progress.finish("parse")
+    
+    uri_map = None
+    if MEDIA_STORE:
+        # 與直接讀取ZIP相同，媒體檔移入內容雜湊儲存區，文件中的媒體路徑改為儲存區路徑
+        progress.start("copy", total=len(media_uris))
+        uri_map, _ = media_store.import_from_directory(EXTRACT_PATH, BASE_DIR, media_uris,
+                                                       workers=MEDIA_COPY_WORKERS,
+                                                       on_file=progress.file_callback("copy"))
+        media_uris = set(uri_map.values())
+    else:
+        progress.start("copy")
+        media_stats = move_extracted_media()
+        progress.advance("copy", media_stats.get("files", 0), media_stats.get("bytes", 0))
+    progress.finish("copy")
+    
+    progress.start("media", total=len(media_uris))
+    manifest = media_manifest.build_manifest(BASE_DIR, media_uris, workers=MEDIA_INSPECT_WORKERS,
+                                             on_file=progress.file_callback("media"))
+    progress.finish("media")
+    
+    def make_items(failures):
+        items = iter_instagram_data(failures=failures)
+        if uri_map is not None:
+            items = media_store.rewrite_uris(items, uri_map)
+        return media_manifest.attach_manifest(items, manifest)
+    
+    # 邊解析邊寫入，不在記憶體中保留完整資料
+    publish_documents(make_items, progress)
+    
+    progress.start("cleanup")
+    remove_temp_files()
+    if uri_map is not None:
+        collect_media_garbage(media_uris)
+    progress.finish("cleanup")
+
+def process_instagram_zip(zip_path: str = None, progress: IngestProgress = None) -> tuple[bool, str]:
     """處理Instagram ZIP檔案的主要函數
     
     Args:
         zip_path: 指定的zip檔案路徑，如果未指定則尋找ig_data目錄中唯一的zip檔案
+        progress: 進度回報，背景匯入工作用來記錄各階段進度
         
     Returns:
         tuple[bool, str]: (是否成功, 錯誤訊息)
@@ -329,19 +1188,12 @@ def process_instagram_zip(zip_path: str = None) -> tuple[bool, str]:
         check_directory_structure()
         
         zip_path = find_zip_file(zip_path)
-        extract_zip(zip_path)
-        
-        data = process_instagram_data()
-        
-        # 將處理後的資料暫存為JSON
-        with open(os.path.join(IG_DATA_DIR, "ig_data.json"), "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        logger.info("List 已成功存到 ig_data.json 檔案中！")
-        
-        setup_elasticsearch_index()
-        import_data_to_elasticsearch(data)
+        progress = MeteredProgress(progress or IngestProgress())
+        if INGEST_MODE == "extract":
+            ingest_extracted_zip(zip_path, progress)
+        else:
+            ingest_zip(zip_path, progress)
         
-        cleanup()
         logger.info("✅ 初始化完成")
         
         return True, None
@@ -0,0 +1,157 @@
+import os
+import re
+import logging
+import unicodedata
+from typing import Dict, List
+
+import query_cache
+
+logger = logging.getLogger(__name__)
+
+ES_INDEX = "ig_data"
+SUGGEST_FIELD = "suggest"
+SUGGEST_SIZE = int(os.getenv("SUGGEST_SIZE", "8"))
+SUGGEST_CACHE_SIZE = int(os.getenv("SUGGEST_CACHE_SIZE", "2048"))
+SUGGEST_CACHE_TTL = float(os.getenv("SUGGEST_CACHE_TTL", "600"))
+MAX_TERM_LENGTH = 30  # 過長的片段通常是整句話，不列入建議
+
+# 建議詞的權重：店名優先於菜名，菜名優先於hashtag
+PLACE_WEIGHT = 3
+DISH_WEIGHT = 2
+HASHTAG_WEIGHT = 1
+
+_HASHTAG_PATTERN = re.compile(r"#([^\s#＃,，.。!！?？]+)")
+_PLACE_PATTERNS = [
+    re.compile(r"📍\s*([^\n#]+)"),
+    re.compile(r"(?:店名|店家|餐廳)\s*[:：]\s*([^\n#]+)")
+]
+_DISH_PATTERNS = [
+    re.compile(r"[【「『]([^】」』\n]+)[】」』]"),
+    re.compile(r"(?:餐點|品項|點了)\s*[:：]\s*([^\n#]+)")
+]
+
+# 建議欄位使用的分析器：整段視為一個詞，只統一全形半形與大小寫
+SUGGEST_ANALYSIS = {
+    "analyzer": {
+        "suggest_keyword": {
+            "type": "custom",
+            "tokenizer": "keyword",
+            "filter": ["cjk_width", "lowercase"]
+        }
+    }
+}
+SUGGEST_MAPPINGS = {
+    "hashtags": {"type": "keyword"},
+    "places": {"type": "keyword"},
+    "dishes": {"type": "keyword"},
+    SUGGEST_FIELD: {"type": "completion", "analyzer": "suggest_keyword"}
+}
+
+
+def normalize(text: str) -> str:
+    """全形轉半形、轉小寫並去除前後空白與 # 符號"""
+    return unicodedata.normalize("NFKC", text or "").strip().lstrip("#").lower()
+
+
+def _clean(terms: List[str]) -> List[str]:
+    """去除空白與重複，保留原本順序"""
+    seen = set()
+    result = []
+    for term in terms:
+        term = term.strip(" \t-—|｜,，.。")
+        if term and len(term) <= MAX_TERM_LENGTH and term not in seen:
+            seen.add(term)
+            result.append(term)
+    return result
+
+
+def extract_terms(content: str) -> Dict[str, List[str]]:
+    """從貼文內容擷取hashtag、店名與菜名
+
+    Args:
+        content: 貼文內容
+
+    Returns:
+        Dict[str, List[str]]: {"hashtags", "places", "dishes"}
+    """
+    content = content or ""
+    return {
+        "hashtags": _clean(_HASHTAG_PATTERN.findall(content)),
+        "places": _clean([m for p in _PLACE_PATTERNS for m in p.findall(content)]),
+        "dishes": _clean([m for p in _DISH_PATTERNS for m in p.findall(content)])
+    }
+
+
+def build_suggest_fields(content: str) -> Dict:
+    """產生索引文件中的擷取欄位與 completion 欄位
+
+    Args:
+        content: 貼文內容
+
+    Returns:
+        Dict: {"hashtags", "places", "dishes", "suggest"}
+    """
+    terms = extract_terms(content)
+    entries = []
+    for key, weight in (("places", PLACE_WEIGHT), ("dishes", DISH_WEIGHT), ("hashtags", HASHTAG_WEIGHT)):
+        if terms[key]:
+            entries.append({"input": terms[key], "weight": weight})
+    return {**terms, SUGGEST_FIELD: entries}
+
+
+_cache = query_cache.QueryCache(max_entries=SUGGEST_CACHE_SIZE, ttl=SUGGEST_CACHE_TTL)
+query_cache.register_metrics("suggest", _cache)
+
+
+def _fetch(es, prefix: str, size: int, index: str) -> List[str]:
+    body = {
+        "_source": False,
+        "suggest": {
+            "terms": {
+                "prefix": prefix,
+                "completion": {"field": SUGGEST_FIELD, "size": size, "skip_duplicates": True}
+            }
+        }
+    }
+    response = es.search(index=index, body=body)
+    return [option["text"] for option in response["suggest"]["terms"][0]["options"]]
+
+
+def suggest(es, prefix: str, size: int = SUGGEST_SIZE, index: str = ES_INDEX) -> List[str]:
+    """取得輸入前綴的建議詞
+
+    相同前綴在快取期間內直接回傳行程內快取的結果。前綴變長時一律重新查詢：
+    completion 每篇文件只回傳一個選項（skip_duplicates 還會略過與其他文件重複
+    的選項），同一篇文件其他符合的輸入不會出現在較短前綴的結果中，即使結果
+    少於 size 筆也無法由本地過濾得到完整的建議詞。
+
+    Args:
+        es: Elasticsearch客戶端
+        prefix: 使用者輸入的前綴
+        size: 最多回傳幾筆
+        index: 索引名稱
+
+    Returns:
+        List[str]: 建議詞（依權重排序）
+    """
+    prefix = normalize(prefix)
+    if not prefix:
+        return []
+
+    key = f"{index}|{size}|{prefix}"
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+
+    try:
+        result = _fetch(es, prefix, size, index)
+    except Exception as e:
+        logger.warning(f"取得建議詞失敗 '{prefix}': {e}")
+        return []
+    _cache.put(key, result)
+    return result
+
+
+def get_cache() -> query_cache.QueryCache:
+    """取得建議詞的前綴快取"""
+    return _cache
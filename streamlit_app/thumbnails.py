@@ -0,0 +1,172 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+from PIL import Image, ImageOps
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.getenv("APP_BASE_DIR", "/app")
+# 縮圖設定（可由環境變數調整）
+THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", os.path.join(BASE_DIR, "media", ".thumbnails"))
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", "600"))              # 最長邊像素（顯示寬度300px的兩倍，供高解析度螢幕使用）
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "webp").lower()      # webp 或 jpeg
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+THUMBNAIL_CACHE_MB = int(os.getenv("THUMBNAIL_CACHE_MB", "512"))      # 快取磁碟用量上限
+EVICT_TARGET_RATIO = 0.9  # 清理時降到上限的90%，避免每次新增都觸發清理
+
+_EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg"}
+VIDEO_EXTENSIONS = {".mp4", ".mov", ".m4v", ".webm"}
+
+THUMBNAIL_LOOKUPS = metrics.counter("thumbnail_lookups_total", "縮圖查詢次數（hit：已有縮圖、render：即時產生、error：無法產生）")
+THUMBNAIL_RENDER_SECONDS = metrics.histogram("thumbnail_render_seconds", "即時產生縮圖的耗時（秒）")
+THUMBNAIL_BYTES = metrics.counter("thumbnail_bytes_total", "即時產生的縮圖大小（位元組）")
+
+_evict_lock = threading.Lock()
+_bytes_since_evict = 0
+
+
+def thumbnail_path(src_path: str, st: os.stat_result = None) -> str:
+    """計算原始檔對應的縮圖路徑
+
+    縮圖以原始檔的路徑、大小、修改時間與縮圖設定做雜湊命名，原始檔內容
+    變動（大小或修改時間改變）時會自動對應到新的縮圖。
+
+    Args:
+        src_path: 原始檔路徑
+        st: 已取得的 os.stat 結果，未提供時自動取得
+
+    Returns:
+        str: 縮圖路徑（可能尚未產生）
+    """
+    st = st or os.stat(src_path)
+    key = f"{os.path.abspath(src_path)}|{st.st_size}|{st.st_mtime_ns}|{THUMBNAIL_SIZE}|{THUMBNAIL_QUALITY}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(THUMBNAIL_DIR, digest[:2], digest + _EXTENSIONS.get(THUMBNAIL_FORMAT, ".jpg"))
+
+
+def _render(src_path: str, dst_path: str) -> int:
+    """產生縮圖並寫入 dst_path，回傳檔案大小"""
+    with Image.open(src_path) as img:
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+        if img.mode not in ("RGB", "RGBA") or THUMBNAIL_FORMAT == "jpeg":
+            img = img.convert("RGB")
+
+        os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+        tmp_path = f"{dst_path}.{threading.get_ident()}.tmp"
+        if THUMBNAIL_FORMAT == "webp":
+            img.save(tmp_path, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+        else:
+            img.save(tmp_path, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+    os.replace(tmp_path, dst_path)
+    return os.path.getsize(dst_path)
+
+
+def get_thumbnail(src_path: str) -> Optional[str]:
+    """取得原始圖片的縮圖，尚未產生時立即產生
+
+    Args:
+        src_path: 原始圖片路徑
+
+    Returns:
+        Optional[str]: 縮圖路徑；原始檔不存在或不是可辨識的圖片（例如影片、損毀檔）時回傳 None
+    """
+    global _bytes_since_evict
+    if os.path.splitext(src_path)[1].lower() in VIDEO_EXTENSIONS:
+        return None
+    try:
+        dst_path = thumbnail_path(src_path)
+    except OSError:
+        return None
+
+    if os.path.exists(dst_path):
+        try:
+            # 更新修改時間作為LRU的最近使用時間
+            os.utime(dst_path)
+        except OSError:
+            pass
+        THUMBNAIL_LOOKUPS.inc(result="hit")
+        return dst_path
+
+    start = time.perf_counter()
+    try:
+        size = _render(src_path, dst_path)
+    except Exception as e:
+        logger.warning(f"無法產生縮圖 {src_path}: {e}")
+        THUMBNAIL_LOOKUPS.inc(result="error")
+        return None
+    THUMBNAIL_RENDER_SECONDS.observe(time.perf_counter() - start)
+    THUMBNAIL_LOOKUPS.inc(result="render")
+    THUMBNAIL_BYTES.inc(size)
+
+    with _evict_lock:
+        _bytes_since_evict += size
+        should_evict = _bytes_since_evict > THUMBNAIL_CACHE_MB * 1024 * 1024 * (1 - EVICT_TARGET_RATIO)
+    if should_evict:
+        evict()
+    return dst_path
+
+
+def evict(budget_mb: int = THUMBNAIL_CACHE_MB) -> Dict:
+    """依最近使用時間刪除最舊的縮圖，直到磁碟用量低於上限
+
+    Args:
+        budget_mb: 磁碟用量上限（MB）
+
+    Returns:
+        Dict: {"files": 剩餘檔案數, "bytes": 剩餘位元組數, "evicted": 刪除檔案數}
+    """
+    global _bytes_since_evict
+    with _evict_lock:
+        _bytes_since_evict = 0
+        entries = []
+        total = 0
+        for root, _, files in os.walk(THUMBNAIL_DIR):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        budget = budget_mb * 1024 * 1024
+        evicted = 0
+        if total > budget:
+            target = budget * EVICT_TARGET_RATIO
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                    evicted += 1
+                except OSError:
+                    pass
+            logger.info(f"🧹 已清除 {evicted} 個縮圖，快取用量 {total / 1024 / 1024:.1f} MB")
+        return {"files": len(entries) - evicted, "bytes": total, "evicted": evicted}
+
+
+def generate_thumbnails(paths: Iterable[str], workers: int = 4) -> Dict:
+    """在匯入時預先產生縮圖
+
+    Args:
+        paths: 原始媒體檔路徑
+        workers: 平行處理的執行緒數
+
+    Returns:
+        Dict: {"generated": 成功數, "skipped": 非圖片或失敗數}
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(get_thumbnail, paths))
+    generated = sum(1 for r in results if r)
+    logger.info(f"🖼️ 縮圖完成：{generated} 個，略過 {len(results) - generated} 個")
+    return {"generated": generated, "skipped": len(results) - generated}
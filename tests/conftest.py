@@ -0,0 +1,5 @@
+import os
+import sys
+
+# streamlit_app 的模組以扁平方式互相匯入（容器內工作目錄為 /app）
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "streamlit_app"))
@@ -0,0 +1,124 @@
+"""本機索引與Elasticsearch後端的結果比對
+
+以 fixtures/backend_parity.json 的貼文建立本機索引，檢查搜尋（含翻頁）與建議詞的結果。
+設定 ES_HOST（預設 http://localhost:9200）可連線時，另外以相同貼文建立可拋棄的
+Elasticsearch暫存索引（cjk_bigram 分析器、正式的 mappings），以正式的查詢函數搜尋，
+比較兩個後端實際回傳的文件ID、順序與建議詞；無法連線時略過這些測試。
+
+    docker run -d --rm -p 9200:9200 -e discovery.type=single-node \\
+        -e xpack.security.enabled=false docker.elastic.co/elasticsearch/elasticsearch:8.11.3
+    ES_HOST=http://localhost:9200 python -m pytest tests
+"""
+import os
+import json
+import math
+import uuid
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+from elasticsearch import Elasticsearch
+
+import local_index
+import query_cache
+import search
+import search_backend
+import search_session
+import setup
+import suggest
+from bulk_writer import bulk_write
+
+FIXTURE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "backend_parity.json")
+with open(FIXTURE_PATH, "r", encoding="utf-8") as f:
+    FIXTURE = json.load(f)
+
+ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")
+PARITY_ANALYZER = "cjk_bigram"  # 本機索引的切詞與此分析器相同
+
+
+def case_id(case: Dict) -> str:
+    return f"{case['query'] or '*'}|{case['start']}|{case['end']}"
+
+
+def _dates(case: Dict) -> Tuple[Optional[date], Optional[date]]:
+    start = date.fromisoformat(case["start"]) if case["start"] else None
+    end = date.fromisoformat(case["end"]) if case["end"] else None
+    return start, end
+
+
+@pytest.fixture(scope="module")
+def local_backend(tmp_path_factory):
+    index_dir = str(tmp_path_factory.mktemp("parity") / "local_index")
+    local_index.build(iter(FIXTURE["docs"]), index_dir, version="parity")
+    return search_backend.LocalBackend(index_dir)
+
+
+@pytest.fixture(scope="module")
+def es_index():
+    """可拋棄的Elasticsearch暫存索引，測試結束後刪除"""
+    es = Elasticsearch(ES_HOST, request_timeout=10)
+    try:
+        reachable = es.ping()
+    except Exception:
+        reachable = False
+    if not reachable:
+        pytest.skip(f"無法連線到 Elasticsearch（{ES_HOST}），略過與Elasticsearch的比對")
+
+    index = f"parity_{uuid.uuid4().hex[:8]}"
+    es.indices.create(index=index, body=setup.build_index_body(PARITY_ANALYZER))
+    try:
+        report = bulk_write(es, ({"_index": index, "_id": doc["doc_id"], "_source": doc} for doc in FIXTURE["docs"]))
+        assert report["failed"] == 0, report["errors"]
+        es.indices.refresh(index=index)
+        yield es, index
+    finally:
+        es.indices.delete(index=index, ignore_unavailable=True)
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    query_cache.get_cache().invalidate()
+    suggest.get_cache().invalidate()
+
+
+def local_ids(backend, case: Dict) -> Tuple[int, List[str]]:
+    """經由搜尋後端介面搜尋並翻完所有頁"""
+    start, end = _dates(case)
+    state = backend.start_search({}, case["query"], start, end)
+    pages = math.ceil(state["total"] / search.PAGE_SIZE)
+    ids = [hit["_id"] for page in range(1, pages + 1) for hit in backend.get_page(state, page)]
+    return state["total"], ids
+
+
+def es_ids(es, index: str, case: Dict) -> Tuple[int, List[str]]:
+    """以正式的查詢條件與排序搜尋暫存索引，依 search_after 翻完所有頁"""
+    start, end = _dates(case)
+    query = search.build_query(search_session.normalize_key(case["query"], start, end)[0], start, end)
+    page = search.fetch_page(es, query, index=index)
+    total, ids = page["total"], [hit["_id"] for hit in page["hits"]]
+    while page["next_cursor"]:
+        page = search.fetch_page(es, query, search_after=page["next_cursor"], track_total_hits=False, index=index)
+        ids.extend(hit["_id"] for hit in page["hits"])
+    return total, ids
+
+
+@pytest.mark.parametrize("case", FIXTURE["searches"], ids=case_id)
+def test_local_search(local_backend, case):
+    assert local_ids(local_backend, case) == (len(case["hits"]), case["hits"])
+
+
+@pytest.mark.parametrize("prefix", list(FIXTURE["suggest"]))
+def test_local_suggest(local_backend, prefix):
+    assert local_backend.suggest(prefix) == FIXTURE["suggest"][prefix]
+
+
+@pytest.mark.parametrize("case", FIXTURE["searches"], ids=case_id)
+def test_search_parity(es_index, local_backend, case):
+    es, index = es_index
+    assert es_ids(es, index, case) == local_ids(local_backend, case)
+
+
+@pytest.mark.parametrize("prefix", list(FIXTURE["suggest"]))
+def test_suggest_parity(es_index, local_backend, prefix):
+    es, index = es_index
+    assert suggest.suggest(es, prefix, index=index) == local_backend.suggest(prefix)
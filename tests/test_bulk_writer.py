@@ -0,0 +1,130 @@
+"""bulk_writer 的批次切分與單筆重試（以假的客戶端回應 _bulk）"""
+import json
+
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+from elasticsearch import ApiError
+
+import bulk_writer
+from bulk_writer import bulk_write, chunk_actions
+
+
+def index_action(doc_id: str, text: str = "x") -> dict:
+    return {"_index": "test", "_id": doc_id, "_source": {"content": text}}
+
+
+def api_error(status: int) -> ApiError:
+    meta = ApiResponseMeta(status=status, http_version="1.1", headers=HttpHeaders(), duration=0.0,
+                           node=NodeConfig("http", "localhost", 9200))
+    return ApiError(f"status {status}", meta, {})
+
+
+class FakeBulkClient:
+    """依序回傳預先設定的結果：整批例外，或 {文件ID: 狀態碼}（未列出的文件視為成功）"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    def bulk(self, operations: bytes, **kwargs):
+        lines = [json.loads(line) for line in operations.decode("utf-8").splitlines()]
+        actions = []
+        for line in lines:
+            op_type = next(iter(line))
+            if op_type in ("index", "create", "update", "delete"):
+                actions.append((op_type, line[op_type].get("_id")))
+        self.requests.append([doc_id for _, doc_id in actions])
+
+        outcome = self.outcomes.pop(0) if self.outcomes else {}
+        if isinstance(outcome, Exception):
+            raise outcome
+        items = []
+        for op_type, doc_id in actions:
+            status = outcome.get(doc_id, 200)
+            result = {"_id": doc_id, "status": status}
+            if status >= 300:
+                result["error"] = {"type": "test_error"}
+            items.append({op_type: result})
+        return {"errors": any(status >= 300 for status in outcome.values()), "items": items}
+
+
+def write(es, actions, **kwargs):
+    kwargs.setdefault("initial_backoff", 0)
+    return bulk_write(es, actions, **kwargs)
+
+
+def test_chunks_by_count():
+    chunks = list(chunk_actions((index_action(str(i)) for i in range(7)), chunk_size=3))
+    assert [[action["_id"] for action, _ in chunk] for chunk in chunks] == [["0", "1", "2"], ["3", "4", "5"], ["6"]]
+
+
+def test_chunks_by_bytes():
+    size = len(bulk_writer._serialize_action(index_action("0", "a" * 50)))
+    chunks = list(chunk_actions((index_action(str(i), "a" * 50) for i in range(5)),
+                                chunk_size=100, max_chunk_bytes=size * 2))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+
+
+def test_oversized_action_gets_its_own_chunk():
+    chunks = list(chunk_actions([index_action("small"), index_action("big", "a" * 100)], max_chunk_bytes=10))
+    assert [[action["_id"] for action, _ in chunk] for chunk in chunks] == [["small"], ["big"]]
+
+
+def test_delete_has_no_source_line():
+    data = bulk_writer._serialize_action({"_op_type": "delete", "_index": "test", "_id": "1"})
+    assert data.decode("utf-8").splitlines() == ['{"delete": {"_index": "test", "_id": "1"}}']
+
+
+def test_retries_only_failed_items():
+    es = FakeBulkClient({"b": 429}, {})
+    report = write(es, [index_action("a"), index_action("b"), index_action("c")])
+    assert es.requests == [["a", "b", "c"], ["b"]]
+    assert report == {"indexed": 3, "failed": 0, "retried": 1, "errors": []}
+
+
+def test_retries_server_errors():
+    es = FakeBulkClient({"a": 503}, {"a": 502}, {})
+    report = write(es, [index_action("a")])
+    assert es.requests == [["a"], ["a"], ["a"]]
+    assert (report["indexed"], report["retried"]) == (1, 2)
+
+
+def test_does_not_retry_rejected_documents():
+    es = FakeBulkClient({"a": 400})
+    report = write(es, [index_action("a"), index_action("b")])
+    assert es.requests == [["a", "b"]]
+    assert (report["indexed"], report["failed"], report["retried"]) == (1, 1, 0)
+    assert report["errors"][0]["_id"] == "a"
+
+
+def test_gives_up_after_max_retries():
+    es = FakeBulkClient({"a": 429}, {"a": 429}, {"a": 429})
+    report = write(es, [index_action("a")], max_retries=2)
+    assert len(es.requests) == 3
+    assert (report["indexed"], report["failed"], report["retried"]) == (0, 1, 2)
+
+
+def test_missing_document_delete_counts_as_done():
+    es = FakeBulkClient({"gone": 404})
+    report = write(es, [{"_op_type": "delete", "_index": "test", "_id": "gone"}])
+    assert (report["indexed"], report["failed"]) == (1, 0)
+
+
+def test_retries_whole_request_on_retryable_status():
+    es = FakeBulkClient(api_error(503), {})
+    report = write(es, [index_action("a"), index_action("b")])
+    assert es.requests == [["a", "b"], ["a", "b"]]
+    assert (report["indexed"], report["retried"]) == (2, 2)
+
+
+def test_fails_whole_request_on_other_status():
+    es = FakeBulkClient(api_error(413))
+    report = write(es, [index_action("a"), index_action("b")])
+    assert len(es.requests) == 1
+    assert (report["indexed"], report["failed"]) == (0, 2)
+
+
+def test_parallel_workers_write_every_chunk():
+    es = FakeBulkClient()
+    report = write(es, (index_action(str(i)) for i in range(25)), chunk_size=4, workers=3)
+    assert report["indexed"] == 25
+    assert sorted(doc_id for request in es.requests for doc_id in request) == sorted(str(i) for i in range(25))
@@ -0,0 +1,43 @@
+"""setup.iter_json_array 的串流解析：元素被切在讀取邊界時仍須完整解析"""
+import io
+import json
+
+import pytest
+
+from setup import iter_json_array
+
+SAMPLES = [
+    "[]",
+    "[1.5, 2]",
+    "[-12e3,0.25 , 7]",
+    '[{"title": "早餐", "creation_timestamp": 1700000000, "media": [{"uri": "a.jpg"}]}, "x", null, true]',
+    '[ [1, [2]], {"a": "]"}, "逗號,在字串裡", 3 ]',
+    "[10]",
+]
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_every_read_size(text):
+    expected = json.loads(text)
+    for read_size in range(1, len(text) + 1):
+        assert list(iter_json_array(io.StringIO(text), read_size=read_size)) == expected, read_size
+
+
+def test_number_split_across_reads():
+    # 第一次只讀到 "[1"，不能把 1 當成完整的數字
+    assert list(iter_json_array(io.StringIO("[1.5]"), read_size=2)) == [1.5]
+    assert list(iter_json_array(io.StringIO("[123, 4]"), read_size=3)) == [123, 4]
+
+
+def test_yields_lazily():
+    items = iter_json_array(io.StringIO('[{"a": 1}, {"b": 2}, oops'), read_size=4)
+    assert next(items) == {"a": 1}
+    assert next(items) == {"b": 2}
+    with pytest.raises(ValueError):
+        next(items)
+
+
+@pytest.mark.parametrize("text", ['{"a": 1}', "[1, 2", ""])
+def test_rejects_malformed_input(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), read_size=4))
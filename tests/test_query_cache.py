@@ -0,0 +1,97 @@
+"""QueryCache 的 LRU 容量、TTL 過期與索引版本失效"""
+from types import SimpleNamespace
+
+import pytest
+
+import query_cache
+from query_cache import QueryCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(query_cache, "time", SimpleNamespace(monotonic=clock))
+    return clock
+
+
+@pytest.fixture
+def version_file(tmp_path):
+    return str(tmp_path / ".index_version")
+
+
+def test_evicts_least_recently_used(clock, version_file):
+    cache = QueryCache(max_entries=2, ttl=60, version_file=version_file)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # a 變成最近使用
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock, version_file):
+    cache = QueryCache(max_entries=10, ttl=5, version_file=version_file)
+    cache.put("a", 1)
+    clock.now += 4.9
+    assert cache.get("a") == 1
+    clock.now += 0.2
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["size"], stats["expirations"], stats["hits"], stats["misses"]) == (0, 1, 1, 1)
+
+
+def test_version_file_change_clears_entries(clock, version_file):
+    query_cache.bump_index_version("v1", version_file)
+    cache = QueryCache(max_entries=10, ttl=60, version_file=version_file)
+    cache.put("a", 1)
+
+    query_cache.bump_index_version("v2", version_file)
+    # 版本檔只在間隔後才重新讀取
+    assert cache.get("a") == 1
+    clock.now += query_cache.VERSION_CHECK_INTERVAL
+    assert cache.get("a") is None
+    assert cache.stats()["version"] == "v2"
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_unchanged_version_keeps_entries(clock, version_file):
+    query_cache.bump_index_version("v1", version_file)
+    cache = QueryCache(max_entries=10, ttl=60, version_file=version_file)
+    cache.put("a", 1)
+    clock.now += query_cache.VERSION_CHECK_INTERVAL * 3
+    assert cache.get("a") == 1
+
+
+def test_invalidate_records_version(clock, version_file):
+    cache = QueryCache(max_entries=10, ttl=60, version_file=version_file)
+    cache.put("a", 1)
+    cache.invalidate("v9")
+    assert cache.get("a") is None
+    assert cache.stats()["version"] == "v9"
+
+
+def test_get_or_compute_runs_once(clock, version_file):
+    cache = QueryCache(max_entries=10, ttl=60, version_file=version_file)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"hits": []}
+
+    assert cache.get_or_compute("q", compute) == {"hits": []}
+    assert cache.get_or_compute("q", compute) == {"hits": []}
+    assert len(calls) == 1
+
+
+def test_canonical_key_ignores_key_order():
+    assert (query_cache.canonical_key("ig_data", {"size": 1, "query": {"match_all": {}}})
+            == query_cache.canonical_key("ig_data", {"query": {"match_all": {}}, "size": 1}))
@@ -0,0 +1,70 @@
+"""語意與混合搜尋的排名：RRF合併與 search.ranked_ids 送出的查詢（以假的客戶端回應 _msearch）"""
+import pytest
+
+import embeddings
+import query_cache
+import search
+
+
+class FakeMsearchClient:
+    """依查詢種類回傳預先設定的文件ID排名"""
+
+    def __init__(self, knn_ids, bm25_ids):
+        self.knn_ids = knn_ids
+        self.bm25_ids = bm25_ids
+        self.bodies = []
+
+    def msearch(self, searches):
+        bodies = searches[1::2]
+        self.bodies.extend(bodies)
+        responses = []
+        for body in bodies:
+            ids = self.knn_ids if "knn" in body else self.bm25_ids
+            responses.append({"status": 200, "hits": {"hits": [{"_id": doc_id} for doc_id in ids]}})
+        return {"responses": responses}
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    query_cache.get_cache().invalidate()
+    monkeypatch.setattr(search, "index_embedding_model", lambda es, index=search.ES_INDEX: "test-model")
+    monkeypatch.setattr(embeddings, "embed_query", lambda text, model=None: [0.0] if text == "!!" else [0.6, 0.8])
+
+
+def test_rrf_scores_by_reciprocal_rank():
+    fused = search.reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], rank_constant=60)
+    # a: 1/61 + 1/62，c: 1/63 + 1/61，b: 1/62，d: 1/63
+    assert fused == ["a", "c", "b", "d"]
+
+
+def test_rrf_breaks_ties_by_id():
+    assert search.reciprocal_rank_fusion([["b", "a"], ["a", "b"]]) == ["a", "b"]
+
+
+def test_rrf_rank_constant_changes_weight_of_top_ranks():
+    # x 只在一組排第 1，y 在兩組都排第 3：常數小時第 1 名較重要，常數大時出現次數較重要
+    rankings = [["x", "a", "y"], ["w", "b", "y"]]
+    low = search.reciprocal_rank_fusion(rankings, rank_constant=0)
+    high = search.reciprocal_rank_fusion(rankings, rank_constant=60)
+    assert low.index("x") < low.index("y")
+    assert high[0] == "y"
+
+
+def test_hybrid_fuses_knn_and_bm25_in_one_msearch():
+    es = FakeMsearchClient(knn_ids=["a", "b", "c"], bm25_ids=["c", "a", "d"])
+    ids = search.ranked_ids(es, "牛肉麵", None, None, "hybrid", size=3)
+    assert ids == search.reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]])[:3]
+    assert ["knn" in body for body in es.bodies] == [True, False]
+    assert es.bodies[0]["knn"]["k"] == 3
+
+
+def test_knn_mode_returns_vector_ranking():
+    es = FakeMsearchClient(knn_ids=["b", "a"], bm25_ids=["a", "b"])
+    assert search.ranked_ids(es, "牛肉麵", None, None, "knn") == ["b", "a"]
+    assert len(es.bodies) == 1
+
+
+def test_zero_vector_falls_back_to_keywords():
+    es = FakeMsearchClient(knn_ids=["b"], bm25_ids=["a"])
+    assert search.ranked_ids(es, "!!", None, None, "hybrid") == ["a"]
+    assert ["knn" in body for body in es.bodies] == [False]
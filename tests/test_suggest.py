@@ -0,0 +1,84 @@
+"""建議詞的擷取與前綴快取（以假的客戶端模擬 completion suggester）"""
+import pytest
+
+import suggest
+
+
+class FakeCompletionClient:
+    """與 completion suggester 相同：每篇文件只回傳權重最高的一個符合輸入，skip_duplicates 略過重複文字"""
+
+    def __init__(self, contents):
+        self.docs = [suggest.build_suggest_fields(content)[suggest.SUGGEST_FIELD] for content in contents]
+        self.prefixes = []
+
+    def search(self, index, body):
+        completion = body["suggest"]["terms"]
+        prefix = completion["prefix"]
+        self.prefixes.append(prefix)
+        best = []
+        for entries in self.docs:
+            matches = [(entry["weight"], term) for entry in entries for term in entry["input"]
+                       if suggest.normalize(term).startswith(prefix)]
+            if matches:
+                best.append(max(matches, key=lambda m: m[0]))
+        options, seen = [], set()
+        for weight, term in sorted(best, key=lambda m: -m[0]):
+            if completion["completion"].get("skip_duplicates") and term in seen:
+                continue
+            seen.add(term)
+            options.append({"text": term, "_score": weight})
+        return {"suggest": {"terms": [{"options": options[:completion["completion"]["size"]]}]}}
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    suggest.get_cache().invalidate()
+
+
+def test_extract_terms():
+    terms = suggest.extract_terms("📍 好吃餐廳\n【牛肉麵】#台北美食 #台北美食 #noodle")
+    assert terms == {"hashtags": ["台北美食", "noodle"], "places": ["好吃餐廳"], "dishes": ["牛肉麵"]}
+
+
+def test_suggest_weights_order_places_first():
+    fields = suggest.build_suggest_fields("📍 Apple Cafe\n【apple pie】#apple")
+    assert [(entry["input"], entry["weight"]) for entry in fields[suggest.SUGGEST_FIELD]] == [
+        (["Apple Cafe"], suggest.PLACE_WEIGHT), (["apple pie"], suggest.DISH_WEIGHT), (["apple"], suggest.HASHTAG_WEIGHT)
+    ]
+
+
+def test_normalizes_prefix():
+    es = FakeCompletionClient(["#ramen"])
+    assert suggest.suggest(es, "  ＃ＲＡ ", index="test") == ["ramen"]
+    assert es.prefixes == ["ra"]
+
+
+def test_repeated_prefix_uses_cache():
+    es = FakeCompletionClient(["#ramen", "#rice"])
+    first = suggest.suggest(es, "r", index="test")
+    assert suggest.suggest(es, "R", index="test") == first
+    assert es.prefixes == ["r"]
+
+
+def test_longer_prefix_finds_inputs_hidden_by_shorter_prefix():
+    # 同一篇的 apple 與 avocado 都符合 "a"，completion 只回傳其中一個
+    es = FakeCompletionClient(["#apple #avocado", "#apple"])
+    assert suggest.suggest(es, "a", size=8, index="test") == ["apple"]
+    assert suggest.suggest(es, "av", size=8, index="test") == ["avocado"]
+    assert es.prefixes == ["a", "av"]
+
+
+def test_empty_prefix_skips_query():
+    es = FakeCompletionClient(["#ramen"])
+    assert suggest.suggest(es, " # ", index="test") == []
+    assert es.prefixes == []
+
+
+def test_query_failure_returns_nothing_and_is_not_cached():
+    class BrokenClient:
+        def search(self, index, body):
+            raise RuntimeError("unavailable")
+
+    assert suggest.suggest(BrokenClient(), "ra", index="test") == []
+    es = FakeCompletionClient(["#ramen"])
+    assert suggest.suggest(es, "ra", index="test") == ["ramen"]